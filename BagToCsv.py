@@ -1,152 +1,933 @@
-import os
-import csv
-import argparse
-from pathlib import Path
-from rosbags.highlevel import AnyReader
-
-class RosbagParser:
-    """
-    A class to parse ROS 2 bag files and export specified topics to CSV files.
-
-    This parser uses the 'rosbags' library, which does not require a local ROS 2
-    installation, making it portable. It can handle nested message types by
-    flattening them into a single row.
-    """
-
-    def __init__(self, bag_file_path: str, output_dir: str = '.'):
-        """
-        Initializes the RosbagParser.
-
-        Args:
-            bag_file_path (str): The full path to the ros2 bag folder
-            output_dir (str, optional): The directory to save output CSV files. 
-                                        Defaults to the current directory.
-        """
-        self.bag_path = Path(bag_file_path)
-        self.output_dir = output_dir
-        self.bag_file_name = self.bag_path.stem
-       
-        if not self.bag_path.exists():
-            raise FileNotFoundError(f"Rosbag path (file or directory) not found at: {self.bag_path}")
-
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-            print(f"Created output directory: {self.output_dir}")
-
-    @staticmethod
-    def _flatten_message(msg: object, parent_key: str = '') -> dict:
-        """
-        Recursively flattens a nested message object into a single dictionary.
-        This is a helper method to handle complex, nested ROS messages.
-        
-        Args:
-            msg (object): The ROS message object to flatten.
-            parent_key (str, optional): The base key for nested fields.
-        
-        Returns:
-            dict: A flattened dictionary representation of the message.
-        """
-        items = {}
-        attrs = [s for s in dir(msg) if not s.startswith('_')]
-
-        for slot in attrs:
-            value = getattr(msg, slot)
-            new_key = f"{parent_key}.{slot}" if parent_key else slot
-
-            if hasattr(value, '__module__') and 'builtin' not in value.__module__:
-                items.update(RosbagParser._flatten_message(value, new_key))
-            elif isinstance(value, list):
-                items[new_key] = str(value)
-            else:
-                items[new_key] = value
-        return items
-
-    def export_to_csv(self, topics: list = None):
-        """
-        Reads the rosbag file and exports messages from topics to CSV files.
-
-        Args:
-            topics (list, optional): A list of topic names to export. 
-                                     If None, all topics in the bag file will be exported.
-        """
-        print(f"Opening rosbag file: {self.bag_path}")
-        with AnyReader([self.bag_path]) as reader:
-            
-            # If no topics are specified, get all available topics from the bag
-            if not topics:
-                print("No topics specified. Exporting all available topics.")
-                topics = list(reader.topics.keys())
-                print(f"Found topics: {topics}")
-
-            for topic_name in topics:
-                connections = [c for c in reader.connections if c.topic == topic_name]
-                if not connections:
-                    print(f"Warning: Topic '{topic_name}' not found in the bag file.")
-                    continue
-
-                # Sanitize the topic name for use as a valid filename
-                sanitized_topic_name = topic_name.replace('/', '_').lstrip('_')
-                output_file_name = f"{self.bag_file_name}_{sanitized_topic_name}.csv"
-                output_file_path = os.path.join(self.output_dir, output_file_name)
-
-                print(f"Processing topic: '{topic_name}'")
-                
-                first_msg = True
-                message_count = 0
-                writer = None
-
-                with open(output_file_path, 'w', newline='') as csvfile:
-                    for connection, timestamp, rawdata in reader.messages(connections=connections):
-                        msg = reader.deserialize(rawdata, connection.msgtype)
-                        flat_msg = self._flatten_message(msg)
-
-                        if first_msg:
-                            # Create header from the keys of the first flattened message
-                            header = ['timestamp'] + sorted(flat_msg.keys())
-                            writer = csv.DictWriter(csvfile, fieldnames=header, extrasaction='ignore')
-                            writer.writeheader()
-                            first_msg = False
-                        
-                        row_data = {'timestamp': timestamp}
-                        row_data.update(flat_msg)
-                        writer.writerow(row_data)
-                        message_count += 1
-                
-                if message_count > 0:
-                    print(f"SUCCESS: Wrote {message_count} messages to {output_file_path}")
-                else:
-                    print(f"Info: No messages found for topic '{topic_name}'.")
-                    os.remove(output_file_path) # Clean up empty file
-
-# --- Main execution block to allow running this file as a standalone script ---
-def main():
-    """Main function to handle command-line arguments."""
-    parser = argparse.ArgumentParser(
-        description="Extract topics from a rosbag file into CSV files without a ROS environment."
-    )
-    parser.add_argument('bag_file', help="Path to the rosbag file.")
-    parser.add_argument(
-        '--topics', 
-        nargs='+', 
-        help="List of topics to extract. If not specified, all topics will be extracted."
-    )
-    parser.add_argument(
-        '--output-dir', 
-        dest='output_dir', 
-        default='.', 
-        help="Directory to save the output CSV files."
-    )
-
-    args = parser.parse_args()
-
-    try:
-        # Create a parser instance and run the export
-        rosbag_parser = RosbagParser(args.bag_file, args.output_dir)
-        rosbag_parser.export_to_csv(args.topics)
-    except FileNotFoundError as e:
-        print(f"Error: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-if __name__ == '__main__':
+import os
+import csv
+import argparse
+import operator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rosbags.highlevel import AnyReader
+from rosbags.interfaces import Nodetype
+from fast_cdr import compile_fast_decoder
+
+# Version of the flattened output, bump it whenever the output of a bag changes.
+# Cached conversions made by other versions are not reused.
+PARSER_VERSION = '3'
+
+# Arrow types for the ROS base types, used for the typed columnar output
+ARROW_TYPES = {
+    'bool': pa.bool_(),
+    'byte': pa.uint8(),
+    'char': pa.uint8(),
+    'octet': pa.uint8(),
+    'int8': pa.int8(),
+    'uint8': pa.uint8(),
+    'int16': pa.int16(),
+    'uint16': pa.uint16(),
+    'int32': pa.int32(),
+    'uint32': pa.uint32(),
+    'int64': pa.int64(),
+    'uint64': pa.uint64(),
+    'float32': pa.float32(),
+    'float64': pa.float64(),
+    'string': pa.string(),
+    'wstring': pa.string(),
+}
+
+def arrow_type(ros_type: str) -> pa.DataType:
+    """Arrow type for a flattened ROS type; sequences become list columns, anything else strings."""
+    if ros_type.endswith('[]'):
+        return pa.list_(ARROW_TYPES[ros_type[:-2]])
+    return ARROW_TYPES.get(ros_type, pa.string())
+
+# NumPy dtypes for the ROS base types, used for the in-memory DataFrame output.
+# Strings and any other field type fall back to object columns.
+NUMPY_TYPES = {
+    'bool': np.bool_,
+    'byte': np.uint8,
+    'char': np.uint8,
+    'octet': np.uint8,
+    'int8': np.int8,
+    'uint8': np.uint8,
+    'int16': np.int16,
+    'uint16': np.uint16,
+    'int32': np.int32,
+    'uint32': np.uint32,
+    'int64': np.int64,
+    'uint64': np.uint64,
+    'float32': np.float32,
+    'float64': np.float64,
+}
+
+# Number of messages buffered per Parquet row group
+PARQUET_BATCH_SIZE = 50000
+
+# Time slices per worker process in the parallel export, for load balancing
+SLICES_PER_WORKER = 4
+
+# Raw messages collected per topic before a batch is decoded
+DECODE_BATCH_SIZE = 4096
+
+
+class CsvTopicWriter:
+    """
+    Writes the flattened messages of one topic to a CSV file.
+
+    Variable-length sequence fields go to a side file per field, e.g.
+    'bag_scan.ranges.csv', with one value per line. The main file keeps
+    '<field>.offset' and '<field>.length' columns pointing into it.
+    """
+
+    def __init__(self, path: str, columns: list, types: list):
+        self.target = path
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+
+        header = ['timestamp']
+        self._sequence_slots = []
+        self._side_files = []
+        self._side_writers = []
+        for slot, (column, ros_type) in enumerate(zip(columns, types)):
+            if not ros_type.endswith('[]'):
+                header.append(column)
+                continue
+            header.extend([f"{column}.offset", f"{column}.length"])
+            self._sequence_slots.append(slot)
+            side_file = open(f"{os.path.splitext(path)[0]}.{column}.csv", 'w', newline='')
+            side_writer = csv.writer(side_file)
+            side_writer.writerow(['value'])
+            self._side_files.append(side_file)
+            self._side_writers.append(side_writer)
+        # Replace sequences back to front so earlier slots keep their positions
+        self._sequence_slots.reverse()
+        self._side_writers.reverse()
+        self._offsets = [0] * len(self._sequence_slots)
+        self._writer.writerow(header)
+
+    def write(self, timestamp: int, row: list):
+        for i, slot in enumerate(self._sequence_slots):
+            values = row[slot]
+            length = len(values)
+            row[slot:slot + 1] = [self._offsets[i], length]
+            self._side_writers[i].writerows([value] for value in values.tolist())
+            self._offsets[i] += length
+        self._writer.writerow([timestamp] + row)
+
+    def write_columns(self, timestamps: list, arrays: list):
+        # Batches from the fast decoder never hold sequence fields
+        self._writer.writerows(zip(timestamps, *(array.tolist() for array in arrays)))
+
+    def close(self):
+        self._file.close()
+        for side_file in self._side_files:
+            side_file.close()
+
+
+class ParquetTopicWriter:
+    """
+    Writes the flattened messages of one topic to a typed, zstd-compressed Parquet file.
+
+    Rows are buffered and written as one row group per batch, so the per-message cost
+    is a list append and the columnar conversion happens once per batch.
+    """
+
+    def __init__(self, path: str, columns: list, types: list, batch_size: int = PARQUET_BATCH_SIZE):
+        self.target = path
+        self.schema = pa.schema(
+            [('timestamp', pa.int64())] +
+            [(column, arrow_type(ros_type)) for column, ros_type in zip(columns, types)]
+        )
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self._batch_size = batch_size
+        self._rows = []
+        # Column batches waiting for the next row group, in message order
+        self._tables = []
+        self._table_rows = 0
+
+    def write(self, timestamp: int, row: list):
+        self._rows.append([timestamp] + row)
+        if len(self._rows) + self._table_rows >= self._batch_size:
+            self._flush()
+
+    def write_columns(self, timestamps: list, arrays: list):
+        self._rows_to_table()
+        columns = [pa.array(timestamps, type=pa.int64())]
+        columns.extend(pa.array(array, type=column_type) for array, column_type in zip(arrays, self.schema.types[1:]))
+        self._tables.append(pa.Table.from_arrays(columns, schema=self.schema))
+        self._table_rows += len(timestamps)
+        if self._table_rows >= self._batch_size:
+            self._flush()
+
+    def _rows_to_table(self):
+        if not self._rows:
+            return
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*self._rows), self.schema)]
+        self._tables.append(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._table_rows += len(self._rows)
+        self._rows = []
+
+    def _flush(self):
+        self._rows_to_table()
+        if not self._tables:
+            return
+        self._writer.write_table(pa.concat_tables(self._tables))
+        self._tables = []
+        self._table_rows = 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class DataFrameTopicBuffer:
+    """
+    Collects the flattened messages of one topic into typed NumPy column buffers.
+
+    The buffers are preallocated from the message count in the bag index and only
+    grow if the index undercounts, so no intermediate row lists are kept.
+    """
+
+    def __init__(self, topic_name: str, columns: list, types: list, capacity: int):
+        self.target = f"DataFrame for '{topic_name}'"
+        self.columns = columns
+        capacity = max(capacity, 1)
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._buffers = [np.empty(capacity, dtype=NUMPY_TYPES.get(ros_type, object)) for ros_type in types]
+        self._count = 0
+
+    def write(self, timestamp: int, row: list):
+        i = self._count
+        if i == len(self._timestamps):
+            self._grow()
+        self._timestamps[i] = timestamp
+        for buffer, value in zip(self._buffers, row):
+            buffer[i] = value
+        self._count = i + 1
+
+    def write_columns(self, timestamps: list, arrays: list):
+        start = self._count
+        stop = start + len(timestamps)
+        while stop > len(self._timestamps):
+            self._grow()
+        self._timestamps[start:stop] = timestamps
+        for buffer, array in zip(self._buffers, arrays):
+            buffer[start:stop] = array
+        self._count = stop
+
+    def _grow(self):
+        capacity = 2 * len(self._timestamps)
+        self._timestamps = np.resize(self._timestamps, capacity)
+        self._buffers = [np.resize(buffer, capacity) for buffer in self._buffers]
+
+    def close(self):
+        pass
+
+    def to_dataframe(self) -> pd.DataFrame:
+        data = {'timestamp': self._timestamps[:self._count]}
+        for column, buffer in zip(self.columns, self._buffers):
+            data[column] = buffer[:self._count]
+        return pd.DataFrame(data)
+
+
+class RosbagParser:
+    """
+    A class to parse ROS 2 bag files and export specified topics to CSV files.
+
+    This parser uses the 'rosbags' library, which does not require a local ROS 2
+    installation, making it portable. It can handle nested message types by
+    flattening them into a single row.
+    """
+
+    def __init__(self, bag_file_path: str, output_dir: str = '.', workers: int = 1,
+                 start: int = None, stop: int = None, last_seconds: float = None):
+        """
+        Initializes the RosbagParser.
+
+        Args:
+            bag_file_path (str): The full path to the ros2 bag folder
+            output_dir (str, optional): The directory to save output CSV files. 
+                                        Defaults to the current directory.
+            workers (int, optional): Number of processes used to decode the bag.
+                                     Defaults to 1, which decodes in this process.
+            start (int, optional): Only read messages at or after this timestamp (ns).
+            stop (int, optional): Only read messages before this timestamp (ns).
+            last_seconds (float, optional): Only read the last seconds of the bag,
+                                            measured from its final message. Takes
+                                            precedence over start.
+        """
+        self.bag_path = Path(bag_file_path)
+        self.output_dir = output_dir
+        self.bag_file_name = self.bag_path.stem
+        self.workers = max(int(workers), 1)
+        self.start = start
+        self.stop = stop
+        self.last_seconds = last_seconds
+        # Compiled flatteners and fast decoders keyed by message type, see _get_flattener
+        self._flatteners = {}
+        self._fast_decoders = {}
+       
+        if not self.bag_path.exists():
+            raise FileNotFoundError(f"Rosbag path (file or directory) not found at: {self.bag_path}")
+
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+            print(f"Created output directory: {self.output_dir}")
+
+    @staticmethod
+    def _message_fields(typestore, msgtype: str, parent_key: str = '', parent_path: str = '') -> list:
+        """
+        Recursively lists the flattened fields of a message type from its definition.
+        This is a helper method to handle complex, nested ROS messages.
+
+        Fixed-length arrays of base types are expanded into one indexed field per
+        element, e.g. 'position_covariance.0' to 'position_covariance.8'. Variable-length
+        sequences of numeric types are kept as arrays with the type '<base type>[]'.
+        Any other array is kept as its string representation.
+
+        Args:
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name, e.g. 'sensor_msgs/msg/NavSatFix'.
+            parent_key (str, optional): The base key for nested fields.
+            parent_path (str, optional): The base attribute path for nested fields.
+
+        Returns:
+            list: (key, kind, payload, ros_type) tuples. The kind is 'constant' with the
+                  constant value as payload, 'element' with an (attribute path, index)
+                  payload, otherwise 'value', 'sequence' or 'array' with the attribute
+                  path. The ros_type is the base type name, '<base type>[]' for
+                  sequences or 'array' for arrays kept as strings.
+        """
+        constants, fields = typestore.fielddefs[msgtype]
+        items = []
+
+        for name, ros_type, value in constants:
+            key = f"{parent_key}.{name}" if parent_key else name
+            items.append((key, 'constant', value, ros_type))
+
+        for name, (nodetype, details) in fields:
+            key = f"{parent_key}.{name}" if parent_key else name
+            path = f"{parent_path}.{name}" if parent_path else name
+
+            if nodetype == Nodetype.NAME:
+                items.extend(RosbagParser._message_fields(typestore, details, key, path))
+            elif nodetype in (Nodetype.ARRAY, Nodetype.SEQUENCE):
+                (element_nodetype, element_details), length = details
+                element_type = element_details[0] if element_nodetype == Nodetype.BASE else None
+                if nodetype == Nodetype.ARRAY and element_type is not None:
+                    items.extend((f"{key}.{i}", 'element', (path, i), element_type) for i in range(length))
+                elif nodetype == Nodetype.SEQUENCE and element_type in NUMPY_TYPES:
+                    items.append((key, 'sequence', path, f"{element_type}[]"))
+                else:
+                    items.append((key, 'array', path, 'array'))
+            else:
+                items.append((key, 'value', path, details[0]))
+        return items
+
+    @staticmethod
+    def _field_sort_key(key: str) -> list:
+        """Sorts flattened keys alphabetically, with array indices in numeric order."""
+        return [int(part) if part.isdigit() else part for part in key.split('.')]
+
+    @staticmethod
+    def _flattened_fields(typestore, msgtype: str, keep: tuple = None) -> list:
+        """
+        Lists the flattened fields of a message type in output order.
+
+        Args:
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name.
+            keep (tuple, optional): Flattened keys to keep, in output order. If None,
+                                    all fields are kept in sorted order.
+
+        Returns:
+            list: (key, kind, payload, ros_type) tuples as returned by _message_fields.
+        """
+        fields = sorted(RosbagParser._message_fields(typestore, msgtype),
+                        key=lambda field: RosbagParser._field_sort_key(field[0]))
+        if keep is not None:
+            fields_by_key = {field[0]: field for field in fields}
+            missing = [key for key in keep if key not in fields_by_key]
+            if missing:
+                raise KeyError(f"Fields {missing} not found in message type '{msgtype}'.")
+            fields = [fields_by_key[key] for key in keep]
+        return fields
+
+    @staticmethod
+    def _compile_flattener(typestore, msgtype: str, keep: tuple = None):
+        """
+        Builds a flattener for one message type.
+
+        The field list and the attribute accessors are resolved once from the message
+        definition, so flattening a message is a single attrgetter call instead of a
+        dir()/getattr recursion over every field.
+
+        Args:
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name.
+            keep (tuple, optional): Flattened keys to keep, in output order. If None,
+                                    all fields are kept in sorted order.
+
+        Returns:
+            tuple: (columns, types, flatten) where columns is the list of flattened keys,
+                   types their ROS types and flatten(msg) returns the values of a message
+                   in column order. Sequence columns hold NumPy arrays.
+        """
+        fields = RosbagParser._flattened_fields(typestore, msgtype, keep)
+        columns = [field[0] for field in fields]
+        types = [field[3] for field in fields]
+
+        # Constants are filled in once; only the message attributes are read per message
+        template = [payload if kind == 'constant' else None for _, kind, payload, _ in fields]
+
+        # Each attribute path is read once, array elements share the path of their array
+        paths = []
+        value_slots = []
+        array_slots = []
+        element_groups = {}
+        for slot, (_, kind, payload, _) in enumerate(fields):
+            if kind == 'constant':
+                continue
+            path = payload[0] if kind == 'element' else payload
+            if path not in paths:
+                paths.append(path)
+            index = paths.index(path)
+            if kind == 'element':
+                element_groups.setdefault(index, []).append((slot, payload[1]))
+            elif kind == 'array':
+                array_slots.append((slot, index))
+            else:
+                value_slots.append((slot, index))
+        element_groups = list(element_groups.items())
+
+        if not paths:
+            return columns, types, lambda msg: list(template)
+
+        getter = operator.attrgetter(*paths)
+        single = len(paths) == 1
+
+        def flatten(msg: object) -> list:
+            values = getter(msg)
+            if single:
+                values = (values,)
+            row = list(template)
+            for slot, index in value_slots:
+                row[slot] = values[index]
+            for slot, index in array_slots:
+                row[slot] = str(values[index])
+            for index, elements in element_groups:
+                array = values[index]
+                items = array.tolist() if isinstance(array, np.ndarray) else array
+                for slot, i in elements:
+                    row[slot] = items[i]
+            return row
+
+        return columns, types, flatten
+
+    @staticmethod
+    def _get_flattener(cache: dict, typestore, msgtype: str, keep: list = None):
+        """
+        Returns the cached flattener for a message type, compiling it on first use.
+
+        Args:
+            cache (dict): The flattener cache to look up and fill.
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name.
+            keep (list, optional): Flattened keys to keep. The 'timestamp' column is
+                                   always written and is ignored here.
+
+        Returns:
+            tuple: (columns, types, flatten) as returned by _compile_flattener.
+        """
+        if keep is not None:
+            keep = tuple(key for key in keep if key != 'timestamp')
+        flattener = cache.get((msgtype, keep))
+        if flattener is None:
+            flattener = RosbagParser._compile_flattener(typestore, msgtype, keep)
+            cache[(msgtype, keep)] = flattener
+        return flattener
+
+    @staticmethod
+    def _get_fast_decoder(cache: dict, typestore, msgtype: str, keep: list = None):
+        """
+        Returns the cached fast CDR decoder for a message type, compiling it on first use.
+
+        Args:
+            cache (dict): The decoder cache to look up and fill.
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name.
+            keep (list, optional): Flattened keys to keep, as for _get_flattener.
+
+        Returns:
+            FastDecoder: The decoder, or None if the type needs the generic path.
+        """
+        if keep is not None:
+            keep = tuple(key for key in keep if key != 'timestamp')
+        if (msgtype, keep) not in cache:
+            fields = RosbagParser._flattened_fields(typestore, msgtype, keep)
+            cache[(msgtype, keep)] = compile_fast_decoder(typestore, msgtype, fields)
+        return cache[(msgtype, keep)]
+
+    @staticmethod
+    def _decode_messages(reader: AnyReader, connections: list, columns: dict, flatteners: dict,
+                         fast_decoders: dict, start: int, stop: int, batch_size: int = DECODE_BATCH_SIZE):
+        """
+        Reads, decodes and flattens the messages of the selected connections in batches.
+
+        Raw messages are collected per topic. Batches of fixed-layout CDR messages are
+        decoded at once with np.frombuffer by a fast decoder; any other batch, or one
+        the fast decoder rejects, is deserialized and flattened message by message.
+
+        Args:
+            reader (AnyReader): An open reader of the bag.
+            connections (list): The connections to read.
+            columns (dict): Maps topic names to the flattened field names to keep.
+            flatteners (dict): The flattener cache, see _get_flattener.
+            fast_decoders (dict): The fast decoder cache, see _get_fast_decoder.
+            start (int): First timestamp to read (ns), inclusive.
+            stop (int): Last timestamp to read (ns), exclusive.
+            batch_size (int, optional): Number of raw messages decoded per batch.
+
+        Yields:
+            tuple: (topic_name, columns, types, timestamps, rows, arrays). A batch from
+                   the fast decoder has one NumPy array per column in arrays and None in
+                   rows, any other batch has flattened rows and None in arrays. The
+                   batches of a topic are yielded in bag order.
+        """
+        routes = {}
+        pending = {}
+
+        def decode(topic_name):
+            connection, timestamps, rawdatas = pending.pop(topic_name)
+            topic_columns, types, flatten, decoder = routes[connection.id]
+            arrays = decoder.decode(rawdatas) if decoder is not None else None
+            if arrays is not None:
+                return topic_name, topic_columns, types, timestamps, None, arrays
+            rows = [flatten(reader.deserialize(rawdata, connection.msgtype)) for rawdata in rawdatas]
+            return topic_name, topic_columns, types, timestamps, rows, None
+
+        for connection, timestamp, rawdata in reader.messages(connections=connections, start=start, stop=stop):
+            route = routes.get(connection.id)
+            if route is None:
+                keep = columns.get(connection.topic)
+                topic_columns, types, flatten = RosbagParser._get_flattener(
+                    flatteners, reader.typestore, connection.msgtype, keep)
+                decoder = None
+                # Only CDR payloads have the layout the fast decoder reads
+                if getattr(connection.ext, 'serialization_format', None) == 'cdr':
+                    decoder = RosbagParser._get_fast_decoder(
+                        fast_decoders, reader.typestore, connection.msgtype, keep)
+                route = (topic_columns, types, flatten, decoder)
+                routes[connection.id] = route
+
+            topic_name = connection.topic
+            batch = pending.get(topic_name)
+            # A batch holds messages of one connection, so they share one message type
+            if batch is not None and batch[0].id != connection.id:
+                yield decode(topic_name)
+                batch = None
+            if batch is None:
+                batch = (connection, [], [])
+                pending[topic_name] = batch
+            batch[1].append(timestamp)
+            batch[2].append(rawdata)
+            if len(batch[1]) >= batch_size:
+                yield decode(topic_name)
+
+        for topic_name in list(pending):
+            yield decode(topic_name)
+
+    def _output_file_path(self, topic_name: str, extension: str = 'csv') -> str:
+        """
+        Builds the output file path for a topic.
+
+        Args:
+            topic_name (str): The ROS topic name, e.g. '/uwb_distance'.
+            extension (str, optional): The output file extension. Defaults to 'csv'.
+
+        Returns:
+            str: The path of the per-topic output file inside the output directory.
+        """
+        # Sanitize the topic name for use as a valid filename
+        sanitized_topic_name = topic_name.replace('/', '_').lstrip('_')
+        output_file_name = f"{self.bag_file_name}_{sanitized_topic_name}.{extension}"
+        return os.path.join(self.output_dir, output_file_name)
+
+    @staticmethod
+    def _select_connections(reader: AnyReader, topics: list) -> list:
+        """
+        Collects the bag connections for the requested topics, warning about missing ones.
+
+        Args:
+            reader (AnyReader): An open rosbags reader.
+            topics (list): The topic names to select.
+
+        Returns:
+            list: The connections that carry any of the requested topics.
+        """
+        connections = []
+        for topic_name in topics:
+            topic_connections = [c for c in reader.connections if c.topic == topic_name]
+            if not topic_connections:
+                print(f"Warning: Topic '{topic_name}' not found in the bag file.")
+            connections.extend(topic_connections)
+        return connections
+
+    def export_to_csv(self, topics: list = None, columns: dict = None):
+        """
+        Reads the rosbag file and exports messages from topics to CSV files.
+
+        Args:
+            topics (list, optional): A list of topic names to export. If None, the topics
+                                     in columns are exported, or all topics in the bag
+                                     file if columns is not given either.
+            columns (dict, optional): Maps topic names to the flattened field names to
+                                      keep. Topics without an entry keep all fields.
+        """
+        self._export(
+            topics,
+            lambda topic_name, topic_columns, types, capacity: CsvTopicWriter(
+                self._output_file_path(topic_name, 'csv'), topic_columns, types),
+            columns
+        )
+
+    def export_to_parquet(self, topics: list = None, columns: dict = None, batch_size: int = PARQUET_BATCH_SIZE):
+        """
+        Reads the rosbag file and exports messages from topics to Parquet files.
+
+        Each topic gets one typed, compressed columnar file, so readers can load just
+        the columns they need, e.g. pd.read_parquet(path, columns=['timestamp', 'latitude']).
+
+        Args:
+            topics (list, optional): A list of topic names to export. If None, the topics
+                                     in columns are exported, or all topics in the bag
+                                     file if columns is not given either.
+            columns (dict, optional): Maps topic names to the flattened field names to
+                                      keep. Topics without an entry keep all fields.
+            batch_size (int, optional): Number of messages per Parquet row group.
+        """
+        self._export(
+            topics,
+            lambda topic_name, topic_columns, types, capacity: ParquetTopicWriter(
+                self._output_file_path(topic_name, 'parquet'), topic_columns, types, batch_size),
+            columns
+        )
+
+    def to_dataframes(self, topics: list = None, columns: dict = None) -> dict:
+        """
+        Reads the rosbag file straight into pandas DataFrames, without any disk I/O.
+
+        Args:
+            topics (list, optional): A list of topic names to load. If None, the topics
+                                     in columns are loaded, or all topics in the bag
+                                     file if columns is not given either.
+            columns (dict, optional): Maps topic names to the flattened field names to
+                                      keep, e.g. {'/uwb_distance': ['timestamp', 'distance']}.
+                                      The timestamp column is always included. Topics
+                                      without an entry keep all fields.
+
+        Returns:
+            dict: Topic name to DataFrame, for every topic that had messages.
+        """
+        buffers = self._export(
+            topics,
+            lambda topic_name, topic_columns, types, capacity: DataFrameTopicBuffer(
+                topic_name, topic_columns, types, capacity),
+            columns
+        )
+        return {topic_name: buffer.to_dataframe() for topic_name, buffer in buffers.items()}
+
+    def save_dataframes(self, dataframes: dict) -> list:
+        """
+        Persists DataFrames returned by to_dataframes as per-topic Parquet files.
+
+        Args:
+            dataframes (dict): Topic name to DataFrame.
+
+        Returns:
+            list: The paths of the written files.
+        """
+        paths = []
+        for topic_name, df in dataframes.items():
+            path = self._output_file_path(topic_name, 'parquet')
+            df.to_parquet(path, index=False, compression='zstd')
+            paths.append(path)
+        return paths
+
+    def iter_dataframes(self, chunk_seconds: float, topics: list = None, columns: dict = None,
+                        margin_seconds: float = 0.0):
+        """
+        Reads the time window in consecutive time chunks, one set of DataFrames at a time.
+
+        Only one chunk is held in memory, so the peak memory use depends on the chunk
+        length rather than the length of the bag.
+
+        Args:
+            chunk_seconds (float): Length of each chunk in seconds.
+            topics (list, optional): The topic names to load, as for to_dataframes.
+            columns (dict, optional): The fields to keep per topic, as for to_dataframes.
+            margin_seconds (float, optional): Extra time read on both sides of every chunk,
+                                              so samples just outside of it are available,
+                                              e.g. for interpolation. Chunks overlap by it.
+
+        Yields:
+            tuple: (start, stop, dataframes) with the chunk's own time range in ns, stop
+                   exclusive, and the DataFrames of the chunk including its margins.
+        """
+        start, stop = self.time_window()
+        chunk_ns = max(int(chunk_seconds * 1e9), 1)
+        margin_ns = int(margin_seconds * 1e9)
+        for chunk_start in range(start, stop, chunk_ns):
+            chunk_stop = min(chunk_start + chunk_ns, stop)
+            chunk = RosbagParser(self.bag_path, self.output_dir, workers=self.workers,
+                                 start=chunk_start - margin_ns, stop=chunk_stop + margin_ns)
+            yield chunk_start, chunk_stop, chunk.to_dataframes(topics, columns)
+
+    @staticmethod
+    def _decode_time_slice(bag_path: Path, topics: list, columns: dict, start: int, stop: int) -> dict:
+        """
+        Decodes and flattens the messages of the selected topics in one time slice.
+
+        This runs in a worker process of the parallel export and opens its own reader.
+        The reader uses the bag index to skip chunks outside of [start, stop).
+
+        Args:
+            bag_path (Path): The path to the ros2 bag.
+            topics (list): The topic names to decode.
+            columns (dict): Maps topic names to the flattened field names to keep.
+            start (int): First timestamp of the slice (ns), inclusive.
+            stop (int): Last timestamp of the slice (ns), exclusive.
+
+        Returns:
+            dict: Topic name to (columns, types, batches), where batches holds the
+                  (timestamps, rows, arrays) batches of _decode_messages in bag order.
+        """
+        decoded = {}
+
+        with AnyReader([bag_path]) as reader:
+            connections = [c for c in reader.connections if c.topic in topics]
+            for topic_name, topic_columns, types, timestamps, rows, arrays in RosbagParser._decode_messages(
+                    reader, connections, columns, {}, {}, start, stop):
+                if topic_name not in decoded:
+                    decoded[topic_name] = (topic_columns, types, [])
+                decoded[topic_name][2].append((timestamps, rows, arrays))
+        return decoded
+
+    def time_window(self) -> tuple:
+        """
+        The time window this parser reads, from the bag's metadata.
+
+        Returns:
+            tuple: (start, stop) timestamps in ns, stop exclusive, see _time_window.
+        """
+        with AnyReader([self.bag_path]) as reader:
+            return self._time_window(reader)
+
+    def _time_window(self, reader: AnyReader) -> tuple:
+        """
+        Resolves the configured time window against the bag's time range.
+
+        Args:
+            reader (AnyReader): An open reader of the bag.
+
+        Returns:
+            tuple: (start, stop) timestamps in ns, clipped to the bag. The stop is
+                   exclusive, like the reader's end_time.
+        """
+        start = reader.start_time if self.start is None else max(int(self.start), reader.start_time)
+        stop = reader.end_time if self.stop is None else min(int(self.stop), reader.end_time)
+        if self.last_seconds is not None:
+            start = max(reader.end_time - int(self.last_seconds * 1e9), reader.start_time)
+        return start, max(start, stop)
+
+    def _decode_parallel(self, topics: list, columns: dict, start: int, stop: int):
+        """
+        Decodes the selected topics on a process pool, split into contiguous time slices.
+
+        Args:
+            topics (list): The topic names to decode.
+            columns (dict): Maps topic names to the flattened field names to keep.
+            start (int): First timestamp to decode (ns), inclusive.
+            stop (int): Last timestamp to decode (ns), exclusive.
+
+        Yields:
+            dict: The decoded slices as returned by _decode_time_slice, in time order.
+        """
+        slice_count = self.workers * SLICES_PER_WORKER
+        bounds = np.linspace(start, stop, slice_count + 1).astype(np.int64)
+        bounds[0], bounds[-1] = start, stop
+        bounds = np.unique(bounds).tolist()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # map returns the slices in submission order, which keeps the output deterministic
+            yield from executor.map(
+                RosbagParser._decode_time_slice,
+                repeat(self.bag_path), repeat(topics), repeat(columns), bounds[:-1], bounds[1:]
+            )
+
+    def _export(self, topics: list, open_writer, columns: dict = None) -> dict:
+        """
+        Reads the rosbag file and routes the flattened messages to per-topic writers.
+
+        The bag is read in a single pass over all selected connections. Messages are
+        decoded in batches, see _decode_messages, and routed to the writer of their
+        topic, which is opened lazily on the first batch, so parse time scales with
+        the bag size rather than the topic count.
+        With more than one worker the bag is decoded in time slices on a process pool
+        and the slices are written in time order, giving the same output. Only the
+        configured time window is read; chunks outside of it are never decompressed.
+
+        Args:
+            topics (list): A list of topic names to export. If None or empty, the
+                           topics in columns are exported, or all topics in the bag
+                           file if columns is not given either.
+            open_writer: Callable taking (topic_name, columns, types, capacity) and
+                         returning a writer with write(timestamp, row),
+                         write_columns(timestamps, arrays) and close() methods. The
+                         capacity is the topic's expected message count in the time
+                         window, from the bag index.
+            columns (dict, optional): Maps topic names to the flattened field names
+                                      to keep. Topics without an entry keep all fields.
+
+        Returns:
+            dict: Topic name to writer, for every topic that had messages.
+        """
+        columns = columns or {}
+        if not topics and columns:
+            topics = list(columns.keys())
+
+        print(f"Opening rosbag file: {self.bag_path}")
+        with AnyReader([self.bag_path]) as reader:
+            
+            # If no topics are specified, get all available topics from the bag
+            if not topics:
+                print("No topics specified. Exporting all available topics.")
+                topics = list(reader.topics.keys())
+                print(f"Found topics: {topics}")
+
+            connections = self._select_connections(reader, topics)
+            if not connections:
+                return {}
+            selected_topics = list(dict.fromkeys(c.topic for c in connections))
+
+            start, stop = self._time_window(reader)
+            if (start, stop) != (reader.start_time, reader.end_time):
+                print(f"Reading time window [{start}, {stop}).")
+            # Share of the bag inside the window, to size the writers' buffers
+            window_fraction = (stop - start) / max(reader.end_time - reader.start_time, 1)
+
+            # Writers are opened per topic on its first message
+            writers = {}
+            message_counts = {}
+
+            def get_writer(topic_name, topic_columns, types):
+                writer = writers.get(topic_name)
+                if writer is None:
+                    print(f"Processing topic: '{topic_name}'")
+                    capacity = sum(c.msgcount for c in connections if c.topic == topic_name)
+                    capacity = int(capacity * window_fraction) + 1
+                    # Header comes from the message definition, not the first message
+                    writer = open_writer(topic_name, topic_columns, types, capacity)
+                    writers[topic_name] = writer
+                    message_counts[topic_name] = 0
+                return writer
+
+            def write_batch(topic_name, topic_columns, types, timestamps, rows, arrays):
+                writer = get_writer(topic_name, topic_columns, types)
+                if arrays is not None:
+                    writer.write_columns(timestamps, arrays)
+                else:
+                    for timestamp, row in zip(timestamps, rows):
+                        writer.write(timestamp, row)
+                message_counts[topic_name] += len(timestamps)
+
+            try:
+                if self.workers > 1:
+                    print(f"Decoding on {self.workers} worker processes.")
+                    for decoded in self._decode_parallel(selected_topics, columns, start, stop):
+                        for topic_name, (topic_columns, types, batches) in decoded.items():
+                            for timestamps, rows, arrays in batches:
+                                write_batch(topic_name, topic_columns, types, timestamps, rows, arrays)
+                else:
+                    for batch in self._decode_messages(reader, connections, columns, self._flatteners,
+                                                       self._fast_decoders, start, stop):
+                        write_batch(*batch)
+            finally:
+                for writer in writers.values():
+                    writer.close()
+
+            for topic_name in selected_topics:
+                if topic_name in message_counts:
+                    print(f"SUCCESS: Wrote {message_counts[topic_name]} messages to {writers[topic_name].target}")
+                else:
+                    print(f"Info: No messages found for topic '{topic_name}'.")
+
+            return writers
+
+# --- Main execution block to allow running this file as a standalone script ---
+def main():
+    """Main function to handle command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Extract topics from a rosbag file into CSV files without a ROS environment."
+    )
+    parser.add_argument('bag_file', help="Path to the rosbag file.")
+    parser.add_argument(
+        '--topics', 
+        nargs='+', 
+        help="List of topics to extract. If not specified, all topics will be extracted."
+    )
+    parser.add_argument(
+        '--output-dir', 
+        dest='output_dir', 
+        default='.', 
+        help="Directory to save the output CSV files."
+    )
+    parser.add_argument(
+        '--format',
+        dest='output_format',
+        choices=['csv', 'parquet'],
+        default='csv',
+        help="Output file format. Parquet writes typed, compressed columnar files."
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of processes used to decode the bag. Defaults to 1."
+    )
+    parser.add_argument(
+        '--start',
+        type=int,
+        help="Only extract messages at or after this timestamp (ns)."
+    )
+    parser.add_argument(
+        '--stop',
+        type=int,
+        help="Only extract messages before this timestamp (ns)."
+    )
+    parser.add_argument(
+        '--last',
+        dest='last_seconds',
+        type=float,
+        help="Only extract the last SECONDS of the bag, e.g. the final approach and landing."
+    )
+
+    args = parser.parse_args()
+
+    try:
+        # Create a parser instance and run the export
+        rosbag_parser = RosbagParser(args.bag_file, args.output_dir, workers=args.workers,
+                                     start=args.start, stop=args.stop, last_seconds=args.last_seconds)
+        if args.output_format == 'parquet':
+            rosbag_parser.export_to_parquet(args.topics)
+        else:
+            rosbag_parser.export_to_csv(args.topics)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+NS_PER_SECOND = 1e9
+DEFAULT_MAX_GAP = 1.0  # seconds, older samples are too stale to describe the aircraft
+
+def sort_by_time(df, on='timestamp'):
+    """Return the dataframe sorted by its time column, without copying if it already is"""
+    if df[on].is_monotonic_increasing:
+        return df
+    return df.sort_values(on, kind='stable').reset_index(drop=True)
+
+def _take(values, index, valid):
+    """Values at index, with missing values where valid is False"""
+    taken = values[index]
+    if valid.all():
+        return taken
+    if taken.dtype.kind in 'biu':
+        taken = taken.astype(np.float64)
+    elif taken.dtype.kind != 'f':
+        taken = taken.astype(object)
+    taken[~valid] = np.nan if taken.dtype.kind == 'f' else None
+    return taken
+
+def align_stream(target_times, stream_df, method='nearest', max_gap=None, on='timestamp', time_unit_ns=1):
+    """Resample one stream onto target timestamps, returning a dataframe with one row per target
+
+    Args:
+        target_times: Sorted target times, in the unit of the time column.
+        stream_df: The stream to align, sorted by its time column.
+        method: 'nearest' takes the closest sample, earlier on ties like merge_asof.
+                'linear' interpolates numeric columns between the samples either side
+                of each target and takes the closest sample for other columns.
+        max_gap: Largest allowed distance in seconds from a target to any sample used
+                 for it. Targets without such samples get missing values. None allows
+                 any gap.
+        on: Name of the time column.
+        time_unit_ns: Nanoseconds per unit of the time column, e.g. 1000000 for ms.
+    """
+    if method not in ('nearest', 'linear'):
+        raise ValueError(f"Unknown alignment method '{method}', use 'nearest' or 'linear'.")
+
+    target_times = np.asarray(target_times, dtype=np.int64)
+    times = stream_df[on].to_numpy(dtype=np.int64)
+    columns = [column for column in stream_df.columns if column != on]
+    if len(times) == 0:
+        return pd.DataFrame({column: np.full(len(target_times), np.nan) for column in columns}, columns=columns)
+    max_gap_units = np.inf if max_gap is None else max_gap * NS_PER_SECOND / time_unit_ns
+
+    # Samples either side of each target: times[before] < target <= times[after],
+    # clipped into the stream, with infinite gaps where a side has no sample
+    after = np.searchsorted(times, target_times, side='left')
+    before = np.maximum(after - 1, 0)
+    has_before = after > 0
+    has_after = after < len(times)
+    after = np.minimum(after, len(times) - 1)
+    gap_before = np.where(has_before, target_times - times[before], np.inf)
+    gap_after = np.where(has_after, times[after] - target_times, np.inf)
+
+    nearest = np.where(gap_before <= gap_after, before, after)
+    valid = np.minimum(gap_before, gap_after) <= max_gap_units
+
+    if method == 'linear':
+        # Targets between two samples in range are interpolated, targets on a sample,
+        # outside the stream or next to a dropout take the nearest sample in range:
+        # both ends of their interpolation are that sample, so every column is
+        # lower + weight * (upper - lower) without a select per column
+        interpolate = has_before & has_after & (gap_after > 0) & \
+            (gap_before <= max_gap_units) & (gap_after <= max_gap_units)
+        span = np.where(interpolate, gap_before + gap_after, 1.0)
+        weight = np.where(interpolate, gap_before, 0.0) / span
+        lower_index = np.where(interpolate, before, nearest)
+        upper_index = np.where(interpolate, after, nearest)
+        all_valid = valid.all()
+
+    aligned = {}
+    for column in columns:
+        values = stream_df[column].to_numpy()
+        if method == 'linear' and values.dtype.kind in 'biuf':
+            values = values.astype(np.float64, copy=False)
+            lower = values[lower_index]
+            result = values[upper_index]
+            result -= lower
+            result *= weight
+            result += lower
+            if not all_valid:
+                result[~valid] = np.nan
+            aligned[column] = result
+        else:
+            aligned[column] = _take(values, nearest, valid)
+    return pd.DataFrame(aligned, columns=columns)
+
+def align_streams(base_df, streams, method='nearest', max_gap=None, on='timestamp', time_unit_ns=1):
+    """Join several streams onto the timeline of a base stream in one pass
+
+    The base stream and every stream are sorted once, then each stream is aligned
+    with align_stream. Stream columns must not clash with each other or with the
+    base columns; rename them first, e.g. with DataFrame.add_prefix.
+
+    Args:
+        base_df: The stream whose timestamps define the output rows, e.g. UWB distances.
+        streams: The dataframes to join, each with a time column.
+        method: 'nearest' or 'linear', see align_stream.
+        max_gap: Largest allowed gap in seconds, see align_stream.
+        on: Name of the time column.
+        time_unit_ns: Nanoseconds per unit of the time column.
+    """
+    base_df = sort_by_time(base_df, on)
+    target_times = base_df[on].to_numpy(dtype=np.int64)
+
+    parts = [base_df.reset_index(drop=True)]
+    seen = set(base_df.columns)
+    for stream_df in streams:
+        clashes = seen.intersection(column for column in stream_df.columns if column != on)
+        if clashes:
+            raise ValueError(f"Columns {sorted(clashes)} are in more than one stream.")
+        seen.update(stream_df.columns)
+        parts.append(align_stream(target_times, sort_by_time(stream_df, on), method, max_gap, on, time_unit_ns))
+    return pd.concat(parts, axis=1)
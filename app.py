@@ -1,12 +1,10 @@
 import streamlit as st
 import os
 import pandas as pd
-import numpy as np
-import math
 import tempfile
 import shutil
 from pathlib import Path
-from BagToCsv import RosbagParser
+from flight_processing import process_bag_data
 from plot_utilities import (
     plot_uwb_error_over_time,
     plot_uwb_error_over_actual_distance,
@@ -14,84 +12,6 @@ from plot_utilities import (
     plot_uwb_distance_vs_gps_actual_distance
 )
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate distance between two GPS coordinates"""
-    R = 6371000  # Earth radius in meters
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_los_vector(aircraft_lat, aircraft_lon, aircraft_alt, beacon_lat, beacon_lon, beacon_alt):
-    """Calculate line-of-sight unit vector from aircraft to beacon"""
-    R = 6371000  # Earth radius
-    dlat = np.radians(beacon_lat - aircraft_lat) * R
-    dlon = np.radians(beacon_lon - aircraft_lon) * R * np.cos(np.radians(aircraft_lat))
-    dalt = beacon_alt - aircraft_alt
-    los_vector = np.array([dlat, dlon, dalt])
-    return los_vector / np.linalg.norm(los_vector)
-
-def calculate_radial_velocity(row, beacon_lat, beacon_lon, beacon_alt):
-    """Calculate radial velocity component"""
-    los_unit = calculate_los_vector(row['latitude'], row['longitude'], row['altitude'], 
-                                   beacon_lat, beacon_lon, beacon_alt)
-    velocity = np.array([row['twist.linear.x'], row['twist.linear.y'], row['twist.linear.z']])
-    return np.dot(velocity, los_unit)
-
-def process_bag_data(bag_path, csv_output_dir, beacon_lat, beacon_lon, beacon_alt):
-    """Process ROS bag data and return merged dataframe"""
-    
-    # Parse bag to CSV
-    parser = RosbagParser(bag_file_path=bag_path, output_dir=csv_output_dir)
-    parser.export_to_csv()
-    
-    bag_name = Path(bag_path).stem
-    
-    # Load CSV files
-    uwb_file = os.path.join(csv_output_dir, f'{bag_name}_uwb_distance.csv')
-    gps_file = os.path.join(csv_output_dir, f'{bag_name}_mavros_global_position_global.csv')
-    vel_file = os.path.join(csv_output_dir, f'{bag_name}_mavros_local_position_velocity_local.csv')
-    
-    # Check if required files exist
-    if not all(os.path.exists(f) for f in [uwb_file, gps_file, vel_file]):
-        st.error("Required CSV files not found. Check if the bag contains the necessary topics.")
-        return None, None, None
-    
-    # Load dataframes
-    uwb_df = pd.read_csv(uwb_file)[['timestamp', 'distance']]
-    gps_df = pd.read_csv(gps_file)[['timestamp', 'latitude', 'longitude', 'altitude']]
-    vel_df = pd.read_csv(vel_file)[['timestamp', 'twist.linear.x', 'twist.linear.y', 'twist.linear.z']]
-    
-    # Merge dataframes
-    merged_df = pd.merge_asof(uwb_df.sort_values('timestamp'),
-                              gps_df.sort_values('timestamp'),
-                              on='timestamp', direction='nearest')
-    
-    merged_df = pd.merge_asof(merged_df.sort_values('timestamp'),
-                              vel_df.sort_values('timestamp'),
-                              on='timestamp', direction='nearest')
-    
-    # Calculate actual distance and error
-    merged_df['actual_distance'] = merged_df.apply(
-        lambda row: haversine(row['latitude'], row['longitude'], beacon_lat, beacon_lon), axis=1
-    )
-    merged_df['beacon_error'] = merged_df['distance'] - merged_df['actual_distance']
-    
-    # Calculate radial velocity
-    merged_df['radial_velocity'] = merged_df.apply(
-        lambda row: calculate_radial_velocity(row, beacon_lat, beacon_lon, beacon_alt), axis=1
-    )
-    
-    # Calculate actual distance for GPS dataframe
-    gps_df['actual_distance'] = gps_df.apply(
-        lambda row: haversine(row['latitude'], row['longitude'], beacon_lat, beacon_lon), axis=1
-    )
-    
-    return merged_df, uwb_df, gps_df
-
 ## The main application ##
 
 # Page config
@@ -107,6 +27,20 @@ beacon_lat = st.sidebar.number_input("Beacon Latitude", value=40.3791014, format
 beacon_lon = st.sidebar.number_input("Beacon Longitude", value=-79.6078958, format="%.7f")
 beacon_alt = st.sidebar.number_input("Beacon Altitude (m)", value=325.281693, format="%.6f")
 
+# Sidebar for the UWB clock offset
+st.sidebar.header("Clock Offset")
+estimate_offset = st.sidebar.checkbox(
+    "Estimate UWB clock offset", value=True,
+    help="Line up the UWB and MAVROS timestamps by cross-correlating UWB ranges with GPS distances"
+)
+time_offset = 'auto' if estimate_offset else st.sidebar.number_input(
+    "UWB clock offset (s)", value=0.0, format="%.3f", help="Seconds added to the UWB timestamps"
+)
+
+# Sidebar for output options
+st.sidebar.header("Output")
+save_topics = st.sidebar.checkbox("Save extracted topics to disk (Parquet)", value=False)
+
 # File uploader
 uploaded_files = st.file_uploader(
     "Upload ROS2 bag folder contents (.yaml and .mcap file)",
@@ -138,22 +72,25 @@ if uploaded_files:
         if st.button("Process Bag Data"):
             with st.spinner("Processing ROS2 bag data..."):
                 try:
-                    # Process the data
-                    merged_df, uwb_df, gps_df = process_bag_data(
-                        bag_dir, csv_dir, beacon_lat, beacon_lon, beacon_alt
+                    # Process the data, the columns of the analysis are computed when a plot or metric asks for them
+                    analysis, _ = process_bag_data(
+                        bag_dir, csv_dir, beacon_lat, beacon_lon, beacon_alt, save_topics, time_offset=time_offset
                     )
                     
-                    if merged_df is not None:
+                    if analysis is None:
+                        st.error("Required topics not found. Check if the bag contains the necessary topics.")
+                    else:
                         st.success("Data processed successfully!")
                         
                         # Display data summary
+                        beacon_error = pd.Series(analysis.column('merged', 'beacon_error'))
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            st.metric("Total UWB Readings", len(merged_df))
+                            st.metric("Total UWB Readings", len(beacon_error))
                         with col2:
-                            st.metric("Mean UWB Error (m)", f"{merged_df['beacon_error'].mean():.3f}")
+                            st.metric("Mean UWB Error (m)", f"{beacon_error.mean():.3f}")
                         with col3:
-                            st.metric("Std UWB Error (m)", f"{merged_df['beacon_error'].std():.3f}")
+                            st.metric("Std UWB Error (m)", f"{beacon_error.std():.3f}")
                         
                         # Generate plots
                         st.subheader("UWB Error Plots")
@@ -161,30 +98,36 @@ if uploaded_files:
                         # bag_name already defined above
                         
                         # Plot 1: UWB Distance and GPS Distance
-                        plot_uwb_distance_vs_gps_actual_distance(uwb_df, gps_df, bag_name, plot_dir)
+                        plot_uwb_distance_vs_gps_actual_distance(analysis.frame('uwb', ['timestamp', 'distance']),
+                                                                 analysis.frame('gps', ['timestamp', 'actual_distance']),
+                                                                 bag_name, plot_dir)
                         plot1_path = os.path.join(plot_dir, 'uwb_distance_vs_gps_actual_distance.png')
                         if os.path.exists(plot1_path):
                             st.image(plot1_path, caption="UWB Distance vs GPS Actual Distance") 
 
                         # Plot 2: UWB Error over Time
-                        plot_uwb_error_over_time(merged_df, bag_name, plot_dir)
+                        plot_uwb_error_over_time(analysis.frame('merged', ['timestamp', 'beacon_error', 'radial_velocity']),
+                                                 bag_name, plot_dir)
                         plot2_path = os.path.join(plot_dir, 'uwb_error_vs_time_colored_velocity.png')
                         if os.path.exists(plot2_path):
                             st.image(plot2_path, caption="UWB Error Over Time (Colored by Radial Velocity)")
                         
                         # Plot 3: UWB Error vs Actual Distance
-                        plot_uwb_error_over_actual_distance(merged_df, bag_name, plot_dir)
+                        plot_uwb_error_over_actual_distance(
+                            analysis.frame('merged', ['actual_distance', 'beacon_error', 'radial_velocity']), bag_name, plot_dir)
                         plot3_path = os.path.join(plot_dir, 'uwb_error_vs_actual_distance.png')
                         if os.path.exists(plot3_path):
                             st.image(plot3_path, caption="UWB Error vs Actual Distance")
                         
                         # Plot 4: UWB vs GPS Distance Comparison
-                        plot_uwb_distance_vs_gps_actual_distance_merged(merged_df, bag_name, plot_dir)
+                        plot_uwb_distance_vs_gps_actual_distance_merged(
+                            analysis.frame('merged', ['timestamp', 'distance', 'actual_distance']), bag_name, plot_dir)
                         plot4_path = os.path.join(plot_dir, 'uwb_distance_vs_gps_actual_distance_merged.png')
                         if os.path.exists(plot4_path):
                             st.image(plot4_path, caption="UWB vs GPS Distance Over Time")
                         
                         # Display data table
+                        merged_df = analysis.frame('merged')
                         st.subheader("Data Preview")
                         st.dataframe(merged_df.head(100))
                         
@@ -0,0 +1,121 @@
+import numpy as np
+from geo_utils import beacon_enu, enu_to_geodetic
+from robust_stats import MAD_SCALE
+
+# Huber threshold in scaled MADs of the residuals, readings beyond it are down-weighted
+HUBER_THRESHOLD = 1.345
+
+# Gauss-Newton stops when no position or bias changes by more than this many meters
+SOLVER_TOLERANCE = 1e-4
+SOLVER_MAX_ITERATIONS = 50
+
+# Merged columns the solver reads from every flight
+SOLVER_COLUMNS = ['latitude', 'longitude', 'altitude', 'distance', 'outlier']
+
+def solve_beacon(positions, distance, flight=None, initial=(0.0, 0.0, 0.0), max_iterations=SOLVER_MAX_ITERATIONS,
+                 tolerance=SOLVER_TOLERANCE):
+    """
+    Beacon position and UWB range bias from ranges to known aircraft positions.
+
+    Solves distance = |position - beacon| + bias for the beacon and a bias per flight by
+    Gauss-Newton, re-weighting the readings every iteration with Huber weights so
+    multipath spikes barely pull the fit. Every iteration is a handful of vectorized
+    passes over the readings and a small least-squares solve.
+
+    Args:
+        positions: (N, 3) aircraft east, north and up in meters in a local frame.
+        distance: The N UWB ranges in meters.
+        flight (optional): Flight number (0 to F-1) of every reading, for a joint solve
+                           with one beacon and a bias per flight. Defaults to one flight.
+        initial (tuple, optional): Starting beacon position in the local frame.
+        max_iterations (int, optional): Most Gauss-Newton iterations.
+        tolerance (float, optional): Largest change in meters at which the solve has converged.
+
+    Returns:
+        dict: 'position' (east, north, up) of the beacon, 'bias' per flight, 'position_std'
+              and 'bias_std' from the covariance of the fit, 'rms' of the residuals,
+              'iterations', 'converged' and 'readings' used.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    flight = np.zeros(len(distance), dtype=np.int64) if flight is None else np.asarray(flight, dtype=np.int64)
+    keep = np.isfinite(distance) & np.isfinite(positions).all(axis=1)
+    positions, distance, flight = positions[keep], distance[keep], flight[keep]
+    flights = int(flight.max()) + 1 if len(flight) else 1
+    if len(distance) < 3 + flights:
+        raise ValueError(f"{len(distance)} readings are too few to solve for the beacon and {flights} bias(es).")
+
+    beacon = np.array(initial, dtype=np.float64)
+    bias = np.zeros(flights)
+    # Columns of the Jacobian: d(range)/d(beacon) for the position and one indicator per flight bias
+    jacobian = np.zeros((len(distance), 3 + flights))
+    jacobian[np.arange(len(distance)), 3 + flight] = 1.0
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        offset = positions - beacon
+        ranges = np.linalg.norm(offset, axis=1)
+        residual = distance - ranges - bias[flight]
+        jacobian[:, :3] = -offset / ranges[:, None]
+
+        scale = MAD_SCALE * np.median(np.abs(residual - np.median(residual)))
+        limit = HUBER_THRESHOLD * max(scale, 1e-6)
+        weights = np.minimum(1.0, limit / np.maximum(np.abs(residual), 1e-12))
+        normal = jacobian.T @ (jacobian * weights[:, None])
+        step = np.linalg.solve(normal, jacobian.T @ (weights * residual))
+        beacon += step[:3]
+        bias += step[3:]
+        if np.abs(step).max() < tolerance:
+            converged = True
+            break
+
+    residual = distance - np.linalg.norm(positions - beacon, axis=1) - bias[flight]
+    variance = (weights * residual**2).sum() / max(len(distance) - len(step), 1)
+    covariance = np.linalg.inv(normal) * variance
+    std = np.sqrt(np.diag(covariance))
+    return {
+        'position': beacon,
+        'bias': bias,
+        'position_std': std[:3],
+        'bias_std': std[3:],
+        'rms': float(np.sqrt(np.mean(residual**2))),
+        'iterations': iteration,
+        'converged': converged,
+        'readings': len(distance),
+    }
+
+def solve_beacon_position(frames, beacon_lat, beacon_lon, beacon_alt, **options):
+    """
+    Beacon latitude, longitude and altitude from the merged frames of one or more flights.
+
+    Args:
+        frames (list): Merged DataFrames with the SOLVER_COLUMNS, one per flight.
+                       Readings flagged as outliers are left out.
+        beacon_lat, beacon_lon, beacon_alt: The entered beacon position, the origin of the
+                                            local frame and the starting point of the solve.
+        **options: Further solve_beacon arguments, e.g. max_iterations.
+
+    Returns:
+        dict: The solve_beacon result with 'latitude', 'longitude' and 'altitude' of the
+              beacon, and 'horizontal_shift' and 'vertical_shift' in meters from the
+              entered position.
+    """
+    positions, distances, flights = [], [], []
+    for number, df in enumerate(frames):
+        df = df[~df['outlier'].astype(bool)]
+        east, north, up = beacon_enu(df['latitude'].to_numpy(), df['longitude'].to_numpy(), df['altitude'].to_numpy(),
+                                     beacon_lat, beacon_lon, beacon_alt)
+        positions.append(np.column_stack([east, north, up]))
+        distances.append(df['distance'].to_numpy())
+        flights.append(np.full(len(df), number))
+    result = solve_beacon(np.concatenate(positions), np.concatenate(distances), np.concatenate(flights), **options)
+
+    east, north, up = result['position']
+    latitude, longitude, altitude = enu_to_geodetic(east, north, up, beacon_lat, beacon_lon, beacon_alt)
+    result.update({
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'altitude': float(altitude),
+        'horizontal_shift': float(np.hypot(east, north)),
+        'vertical_shift': float(up),
+    })
+    return result
@@ -0,0 +1,537 @@
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timezone
+from importlib import metadata
+import numpy as np
+from rosbags.rosbag2 import Writer, StoragePlugin
+from rosbags.typesys import Stores, get_typestore, get_types_from_msg
+from BagToCsv import RosbagParser
+from geo_utils import enu_to_geodetic
+from flight_analysis import ERROR_BINNINGS, UWB_TOPIC, GPS_TOPIC, VELOCITY_TOPIC, UWB_STATE_TOPIC
+from flight_processing import process_bag_data, ANALYSIS_FIELDS, LZ_TOPIC
+from plot_utilities import (
+    plot_uwb_error_over_time,
+    plot_uwb_error_over_actual_distance,
+    plot_uwb_distance_vs_gps_actual_distance_merged,
+    plot_uwb_distance_vs_gps_actual_distance,
+    plot_aircraft_path,
+    plot_sigma_time,
+)
+from create_kmz import create_kmz_from_dataframe
+
+# Seconds of flight in the generated bags, one benchmark run each
+BENCHMARK_DURATIONS = [60.0, 600.0]
+
+# Message rates of the generated topics in Hz
+BENCHMARK_RATES = {
+    UWB_TOPIC: 50.0,
+    GPS_TOPIC: 10.0,
+    VELOCITY_TOPIC: 30.0,
+    UWB_STATE_TOPIC: 10.0,
+    LZ_TOPIC: 1.0,
+}
+
+# Timed runs of every stage; one more run is traced for its peak memory
+BENCHMARK_REPEATS = 3
+
+BENCHMARK_OUTPUT_DIR = "benchmarks"
+
+# A stage is a regression when its fastest run is this much slower than the baseline's
+BENCHMARK_REGRESSION_RATIO = 1.2
+
+# Largest errors of the UWB delay (s) and range bias (m) recovered by the analyses
+# against the ones planted in the bags
+DELAY_TOLERANCE_SECONDS = 0.01
+BIAS_TOLERANCE = 0.05
+
+# Beacon the synthetic aircraft flies to, the page's default
+BEACON_LAT = 40.3791014
+BEACON_LON = -79.6078958
+BEACON_ALT = 325.281693
+
+# Flight pattern of every bag, in meters and seconds: orbits of the beacon taking
+# ORBIT_SECONDS, with the range swinging by RANGE_SWING around ORBIT_RADIUS over
+# RANGE_SECONDS and the height by HEIGHT_SWING around FLIGHT_HEIGHT over HEIGHT_SECONDS.
+# Speeds stay those of a small aircraft (up to about 30 m/s) whatever the duration.
+ORBIT_RADIUS = 400.0
+ORBIT_SECONDS = 180.0
+RANGE_SWING = 300.0
+RANGE_SECONDS = 120.0
+FLIGHT_HEIGHT = 100.0
+HEIGHT_SWING = 30.0
+HEIGHT_SECONDS = 45.0
+
+# Meters east of the beacon of the UWB landing estimate
+LANDING_OFFSET = 3.0
+
+# Synthetic sensor errors: GPS noise, UWB range bias, noise, timestamp delay and
+# multipath spikes, and localizer sigma spikes beyond the plotted range
+GPS_NOISE_STD = 0.3          # m
+UWB_BIAS = 0.3               # m
+UWB_NOISE_STD = 0.1          # m
+UWB_DELAY_SECONDS = 0.1
+MULTIPATH_PROBABILITY = 0.01
+MULTIPATH_METERS = (2.0, 15.0)
+SIGMA_SPIKE_PROBABILITY = 0.005
+
+# Flight start time of the generated bags (ns)
+BAG_START_TIME = 1_700_000_000_000_000_000
+
+# Stand-ins for the UWB driver messages, with the fields the analysis reads
+UWB_DISTANCE_MSG = """std_msgs/Header header
+float64 distance
+"""
+UWB_STATE_MSG = """std_msgs/Header header
+float64 x
+float64 y
+float64 sigma
+"""
+
+def flight_enu(seconds):
+    """East, north and up of the aircraft seconds into the flight"""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    radius = ORBIT_RADIUS + RANGE_SWING * np.sin(2 * np.pi * seconds / RANGE_SECONDS)
+    angle = 2 * np.pi * seconds / ORBIT_SECONDS
+    up = FLIGHT_HEIGHT + HEIGHT_SWING * np.sin(2 * np.pi * seconds / HEIGHT_SECONDS)
+    return radius * np.cos(angle), radius * np.sin(angle), up
+
+def _sample_times(duration, rate, rng=None, jitter=0.0):
+    """Message times in seconds of a topic published at rate Hz, each late by up to jitter seconds"""
+    seconds = np.arange(0.0, duration, 1.0 / rate)
+    if jitter:
+        seconds = seconds + rng.uniform(0.0, jitter, len(seconds))
+    return seconds
+
+def generate_bag(bag_path, duration, rates=BENCHMARK_RATES, seed=0, jitter=0.0):
+    """
+    Write a synthetic MCAP bag of a flight around the beacon, with the topics the
+    analysis reads at the given rates.
+
+    The aircraft orbits the beacon at a changing range and height (flight_enu). GPS
+    fixes carry noise, velocities are the derivative of the flight path, UWB ranges
+    carry a bias, noise, a timestamp delay and multipath spikes, and the localizer
+    sigma grows with range with occasional spikes. The same seed gives the same bag.
+
+    Args:
+        bag_path (str): Bag folder to create; an existing one is replaced.
+        duration (float): Seconds of flight.
+        rates (dict, optional): Topic name to message rate in Hz.
+        seed (int, optional): Seed of the sensor errors.
+        jitter (float, optional): Seconds by which each message is at most late, so
+                                  timestamps fall off the millisecond grid as in real bags.
+
+    Returns:
+        dict: Topic name to the number of messages written.
+    """
+    bag_path = Path(bag_path)
+    if bag_path.exists():
+        shutil.rmtree(bag_path)
+    rng = np.random.default_rng(seed)
+
+    typestore = get_typestore(Stores.ROS2_HUMBLE)
+    typestore.register(get_types_from_msg(UWB_DISTANCE_MSG, 'uwb_msgs/msg/UwbDistance'))
+    typestore.register(get_types_from_msg(UWB_STATE_MSG, 'uwb_msgs/msg/UwbState'))
+    types = typestore.types
+    Header, Time = types['std_msgs/msg/Header'], types['builtin_interfaces/msg/Time']
+    NavSatFix, NavSatStatus = types['sensor_msgs/msg/NavSatFix'], types['sensor_msgs/msg/NavSatStatus']
+    TwistStamped, Twist, Vector3 = (types['geometry_msgs/msg/TwistStamped'], types['geometry_msgs/msg/Twist'],
+                                    types['geometry_msgs/msg/Vector3'])
+    UwbDistance, UwbState = types['uwb_msgs/msg/UwbDistance'], types['uwb_msgs/msg/UwbState']
+
+    def header(stamp):
+        return Header(stamp=Time(sec=int(stamp // 10**9), nanosec=int(stamp % 10**9)), frame_id='map')
+
+    def navsatfix(stamp, latitude, longitude, altitude):
+        return NavSatFix(header=header(stamp), status=NavSatStatus(status=0, service=1), latitude=float(latitude),
+                         longitude=float(longitude), altitude=float(altitude),
+                         position_covariance=np.zeros(9, dtype=np.float64), position_covariance_type=0)
+
+    def velocity(stamp, x, y, z):
+        return TwistStamped(header=header(stamp), twist=Twist(linear=Vector3(x=float(x), y=float(y), z=float(z)),
+                                                              angular=Vector3(x=0.0, y=0.0, z=0.0)))
+
+    def uwb_distance(stamp, distance):
+        return UwbDistance(header=header(stamp), distance=float(distance))
+
+    def uwb_state(stamp, x, y, sigma):
+        return UwbState(header=header(stamp), x=float(x), y=float(y), sigma=float(sigma))
+
+    # Every message as (bag time, topic, message), written in time order
+    messages = []
+    def add(topic, seconds, build, *columns):
+        stamps = (BAG_START_TIME + np.round(seconds * 1e9).astype(np.int64)).tolist()
+        messages.extend((stamp, topic, build(stamp, *values)) for stamp, *values in zip(stamps, *columns))
+
+    seconds = _sample_times(duration, rates[GPS_TOPIC], rng, jitter)
+    east, north, up = flight_enu(seconds)
+    noise = rng.normal(0.0, GPS_NOISE_STD, (3, len(seconds)))
+    add(GPS_TOPIC, seconds, navsatfix,
+        *enu_to_geodetic(east + noise[0], north + noise[1], up + noise[2], BEACON_LAT, BEACON_LON, BEACON_ALT))
+
+    seconds = _sample_times(duration, rates[VELOCITY_TOPIC], rng, jitter)
+    step = 1e-3
+    ahead, behind = flight_enu(seconds + step), flight_enu(seconds - step)
+    add(VELOCITY_TOPIC, seconds, velocity, *[(a - b) / (2 * step) for a, b in zip(ahead, behind)])
+
+    seconds = _sample_times(duration, rates[UWB_TOPIC], rng, jitter)
+    east, north, up = flight_enu(seconds - UWB_DELAY_SECONDS)
+    distance = np.sqrt(east**2 + north**2 + up**2) + UWB_BIAS + rng.normal(0.0, UWB_NOISE_STD, len(seconds))
+    spikes = rng.random(len(seconds)) < MULTIPATH_PROBABILITY
+    distance[spikes] += rng.uniform(*MULTIPATH_METERS, spikes.sum())
+    add(UWB_TOPIC, seconds, uwb_distance, distance)
+
+    seconds = _sample_times(duration, rates[UWB_STATE_TOPIC], rng, jitter)
+    east, north, up = flight_enu(seconds)
+    sigma = 0.1 + np.sqrt(east**2 + north**2 + up**2) / 200 + np.abs(rng.normal(0.0, 0.2, len(seconds)))
+    sigma[rng.random(len(seconds)) < SIGMA_SPIKE_PROBABILITY] = 100.0
+    add(UWB_STATE_TOPIC, seconds, uwb_state, east, north, sigma)
+
+    # The UWB landing estimate, a few meters east of the beacon
+    seconds = _sample_times(duration, rates[LZ_TOPIC], rng, jitter)
+    zeros = np.zeros(len(seconds))
+    landing_lat, landing_lon, landing_alt = enu_to_geodetic(zeros + LANDING_OFFSET, zeros, zeros,
+                                                            BEACON_LAT, BEACON_LON, BEACON_ALT)
+    add(LZ_TOPIC, seconds, navsatfix, landing_lat, landing_lon, landing_alt)
+
+    messages.sort(key=lambda message: message[0])
+    counts = {}
+    with Writer(bag_path, version=9, storage_plugin=StoragePlugin.MCAP) as writer:
+        connections = {}
+        for stamp, topic, message in messages:
+            if topic not in connections:
+                connections[topic] = writer.add_connection(topic, message.__msgtype__, typestore=typestore)
+            writer.write(connections[topic], stamp, typestore.serialize_cdr(message, message.__msgtype__))
+            counts[topic] = counts.get(topic, 0) + 1
+    return counts
+
+def _directory_size(path):
+    """Bytes of the files under a folder"""
+    return sum(file.stat().st_size for file in Path(path).rglob('*') if file.is_file())
+
+def time_stage(function, repeats=BENCHMARK_REPEATS):
+    """
+    Time a pipeline stage, then run it once more under tracemalloc for its peak memory.
+
+    tracemalloc sees Python and NumPy allocations but not those of Arrow or other
+    native libraries, and slows the stage down, so the timed runs are untraced.
+
+    Args:
+        function: The stage, called without arguments.
+        repeats (int, optional): Timed runs.
+
+    Returns:
+        tuple: (result, timing) with the result of the last run and a dict of the run
+               'seconds', their 'min_seconds' and 'median_seconds', and 'peak_memory_mb'.
+    """
+    seconds = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        'seconds': seconds,
+        'min_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'peak_memory_mb': peak / 2**20,
+    }
+
+def flight_metrics(analysis):
+    """Compute every metric the Current Flight page shows of an analysis, and return it"""
+    analysis.error_summary()
+    analysis.error_quantile(0.5)
+    analysis.robust_summary()
+    analysis.uwb_time_offset()
+    for axes in ERROR_BINNINGS:
+        analysis.error_bins(*axes)
+    analysis.solve_beacon()
+    return analysis
+
+def process_flight(bag_path, work_dir, streaming=False):
+    """The Current Flight page's processing of a bag with its metrics, the clock offset estimated and no conversion cache"""
+    analysis, _ = process_bag_data(bag_path, work_dir, BEACON_LAT, BEACON_LON, BEACON_ALT, streaming=streaming,
+                                   time_offset='auto', cache=False)
+    return flight_metrics(analysis)
+
+def recovery_errors(analysis):
+    """
+    UWB delay and range bias an analysis recovers, and their errors against the planted
+    UWB_DELAY_SECONDS and UWB_BIAS. The bias is the median UWB error against the
+    surveyed beacon, which the bags are generated around; the bias of solve_beacon
+    trades off against the beacon height on short flights.
+    """
+    delay = -analysis.uwb_time_offset()
+    bias = analysis.robust_summary()['median_error']
+    return {
+        'delay_seconds': delay,
+        'delay_error_seconds': delay - UWB_DELAY_SECONDS,
+        'bias': bias,
+        'bias_error': bias - UWB_BIAS,
+    }
+
+def plot_jobs(analysis, plot_dir):
+    """Name to (plot function, arguments) of every plot the Current Flight page draws"""
+    return {
+        'distance': (plot_uwb_distance_vs_gps_actual_distance, (
+            analysis.frame('uwb', ['timestamp', 'distance']), analysis.frame('gps', ['timestamp', 'actual_distance']),
+            'benchmark', plot_dir)),
+        'error_time': (plot_uwb_error_over_time, (
+            analysis.frame('merged', ['timestamp', 'beacon_error', 'radial_velocity']), 'benchmark', plot_dir)),
+        'error_distance': (plot_uwb_error_over_actual_distance, (
+            analysis.frame('merged', ['actual_distance', 'beacon_error', 'radial_velocity']), 'benchmark', plot_dir)),
+        'distance_merged': (plot_uwb_distance_vs_gps_actual_distance_merged, (
+            analysis.frame('merged', ['timestamp', 'distance', 'actual_distance']), 'benchmark', plot_dir)),
+        'sigma': (plot_sigma_time, (
+            analysis.frame('uwb_state', ['timestamp', 'sigma'], where='sigma_plotted'), 2.0, 'benchmark', plot_dir)),
+        'path': (plot_aircraft_path, (
+            analysis.frame('gps', ['latitude', 'longitude']), BEACON_LAT, BEACON_LON, None, 'benchmark', plot_dir)),
+    }
+
+def benchmark_bag(bag_path, work_dir, repeats=BENCHMARK_REPEATS, workers=1):
+    """
+    Time and memory-profile every pipeline stage on one bag.
+
+    Stages: 'parse' (RosbagParser into DataFrames), 'analyze' (process_bag_data and
+    every metric of the page, parse included), 'stream' (the same with the streaming
+    analysis), 'plot_<name>' for every plot and 'kmz' (create_kmz_from_dataframe). The
+    conversion cache is never used.
+
+    Args:
+        bag_path (str): The bag folder.
+        work_dir (str): Folder for the plots, KMZ and any parser output.
+        repeats (int, optional): Timed runs of every stage.
+        workers (int, optional): Processes RosbagParser decodes with.
+
+    Returns:
+        tuple: (stages, accuracy) with stage name to its time_stage timing, and
+               'analyze' and 'stream' to the recovery_errors of their analysis.
+    """
+    stages = {}
+    _, stages['parse'] = time_stage(
+        lambda: RosbagParser(bag_file_path=bag_path, output_dir=work_dir, workers=workers).to_dataframes(
+            columns=ANALYSIS_FIELDS), repeats)
+    analysis, stages['analyze'] = time_stage(lambda: process_flight(bag_path, work_dir), repeats)
+    summary, stages['stream'] = time_stage(lambda: process_flight(bag_path, work_dir, streaming=True), repeats)
+    accuracy = {'analyze': recovery_errors(analysis), 'stream': recovery_errors(summary)}
+
+    for name, (function, args) in plot_jobs(analysis, work_dir).items():
+        _, stages[f'plot_{name}'] = time_stage(lambda: function(*args), repeats)
+
+    merged_df = analysis.frame('merged')
+    kmz_path = os.path.join(work_dir, 'benchmark.kmz')
+    _, stages['kmz'] = time_stage(lambda: create_kmz_from_dataframe(merged_df, kmz_path, BEACON_LAT, BEACON_LON), repeats)
+    return stages, accuracy
+
+def environment():
+    """Python, platform, package versions and git commit the benchmark ran on"""
+    packages = {}
+    for package in ['numpy', 'pandas', 'pyarrow', 'matplotlib', 'rosbags', 'pyproj']:
+        try:
+            packages[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            packages[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'packages': packages,
+        'git_commit': commit,
+    }
+
+def run_benchmarks(durations=BENCHMARK_DURATIONS, rates=BENCHMARK_RATES, repeats=BENCHMARK_REPEATS, workers=1,
+                   bag_dir=None, seed=0):
+    """
+    Generate a bag for every duration and benchmark the pipeline on it.
+
+    Args:
+        durations (list, optional): Seconds of flight of each bag.
+        rates (dict, optional): Topic name to message rate in Hz.
+        repeats (int, optional): Timed runs of every stage.
+        workers (int, optional): Processes RosbagParser decodes with.
+        bag_dir (str, optional): Folder to keep the generated bags in. They are written
+                                 to a temporary folder and removed without one.
+        seed (int, optional): Seed of the synthetic sensor errors.
+
+    Returns:
+        dict: The 'environment', the benchmark settings and a run per duration with the
+              bag's message counts and size, the timing of every stage and the
+              'accuracy' of the recovered UWB delay and bias.
+    """
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'rates': rates,
+        'repeats': repeats,
+        'workers': workers,
+        'seed': seed,
+        'planted': {'delay_seconds': UWB_DELAY_SECONDS, 'bias': UWB_BIAS},
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for duration in durations:
+            bag_path = os.path.join(bag_dir or temp_dir, f"benchmark_{duration:g}s")
+            work_dir = os.path.join(temp_dir, f"output_{duration:g}s")
+            os.makedirs(work_dir, exist_ok=True)
+
+            print(f"Benchmark: generating a {duration:g} s bag at {bag_path}")
+            start = time.perf_counter()
+            messages = generate_bag(bag_path, duration, rates, seed)
+            generate_seconds = time.perf_counter() - start
+
+            print(f"Benchmark: timing the pipeline on {sum(messages.values())} messages")
+            stages, accuracy = benchmark_bag(bag_path, work_dir, repeats, workers)
+            results['runs'].append({
+                'duration': duration,
+                'messages': messages,
+                'bag_bytes': _directory_size(bag_path),
+                'generate_seconds': generate_seconds,
+                'stages': stages,
+                'accuracy': accuracy,
+                'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            })
+            for name, timing in stages.items():
+                print(f"  {name:<22} {timing['min_seconds']:8.3f} s  {timing['peak_memory_mb']:8.1f} MB")
+            for name, errors in accuracy.items():
+                print(f"  {name:<22} delay {errors['delay_seconds']:+.4f} s ({errors['delay_error_seconds']:+.4f}), "
+                      f"bias {errors['bias']:+.3f} m ({errors['bias_error']:+.3f})")
+    return results
+
+def check_accuracy(results, delay_tolerance=DELAY_TOLERANCE_SECONDS, bias_tolerance=BIAS_TOLERANCE):
+    """
+    Recovered UWB delays and biases of run_benchmarks results that miss the planted ones.
+
+    Args:
+        results (dict): run_benchmarks results.
+        delay_tolerance (float, optional): Largest delay error in seconds.
+        bias_tolerance (float, optional): Largest bias error in meters.
+
+    Returns:
+        list: (duration, analysis, quantity, error) of every error beyond its tolerance.
+    """
+    failures = []
+    for run in results['runs']:
+        for name, errors in run['accuracy'].items():
+            if abs(errors['delay_error_seconds']) > delay_tolerance:
+                failures.append((run['duration'], name, 'delay', errors['delay_error_seconds']))
+            if abs(errors['bias_error']) > bias_tolerance:
+                failures.append((run['duration'], name, 'bias', errors['bias_error']))
+    return failures
+
+def compare_results(baseline, current, ratio=BENCHMARK_REGRESSION_RATIO):
+    """
+    Stages of the runs in current that are slower than in baseline, matched by duration.
+
+    Args:
+        baseline (dict): Earlier run_benchmarks results.
+        current (dict): New run_benchmarks results.
+        ratio (float, optional): Slowdown of the fastest run counted as a regression.
+
+    Returns:
+        list: (duration, stage, baseline seconds, current seconds) of every regression.
+    """
+    baseline_runs = {run['duration']: run for run in baseline['runs']}
+    regressions = []
+    for run in current['runs']:
+        before = baseline_runs.get(run['duration'])
+        if before is None:
+            continue
+        for name, timing in run['stages'].items():
+            if name not in before['stages']:
+                continue
+            old, new = before['stages'][name]['min_seconds'], timing['min_seconds']
+            print(f"  {run['duration']:g} s {name:<22} {old:8.3f} s -> {new:8.3f} s  ({new / old:.2f}x)")
+            if new > old * ratio:
+                regressions.append((run['duration'], name, old, new))
+    return regressions
+
+def main():
+    """Main function to handle command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the bag parser, analysis, plots and KMZ export on synthetic bags, offline. "
+                    "Exits with status 1 when the analysis misses the planted UWB delay or bias."
+    )
+    parser.add_argument(
+        '--durations',
+        type=float,
+        nargs='+',
+        default=BENCHMARK_DURATIONS,
+        help="Seconds of flight of each generated bag."
+    )
+    parser.add_argument('--uwb-rate', type=float, default=BENCHMARK_RATES[UWB_TOPIC], help="UWB range rate (Hz).")
+    parser.add_argument('--gps-rate', type=float, default=BENCHMARK_RATES[GPS_TOPIC], help="GPS fix rate (Hz).")
+    parser.add_argument('--velocity-rate', type=float, default=BENCHMARK_RATES[VELOCITY_TOPIC],
+                        help="Velocity rate (Hz).")
+    parser.add_argument('--state-rate', type=float, default=BENCHMARK_RATES[UWB_STATE_TOPIC],
+                        help="UWB localizer state rate (Hz).")
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_REPEATS, help="Timed runs of every stage.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes used to decode the bags.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic sensor errors.")
+    parser.add_argument('--bag-dir', dest='bag_dir', help="Keep the generated bags in this directory.")
+    parser.add_argument(
+        '--output',
+        help="JSON file to write the results to. Defaults to a timestamped file in "
+             f"{BENCHMARK_OUTPUT_DIR}/."
+    )
+    parser.add_argument(
+        '--compare',
+        help="Results of an earlier benchmark. Exits with status 1 when a stage is more than "
+             f"{BENCHMARK_REGRESSION_RATIO:g}x slower."
+    )
+    args = parser.parse_args()
+
+    rates = dict(BENCHMARK_RATES)
+    rates.update({UWB_TOPIC: args.uwb_rate, GPS_TOPIC: args.gps_rate, VELOCITY_TOPIC: args.velocity_rate,
+                  UWB_STATE_TOPIC: args.state_rate})
+    if args.bag_dir:
+        os.makedirs(args.bag_dir, exist_ok=True)
+    results = run_benchmarks(args.durations, rates, args.repeats, args.workers, args.bag_dir, args.seed)
+
+    output = args.output or os.path.join(
+        BENCHMARK_OUTPUT_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to {output}")
+
+    failures = check_accuracy(results)
+    for duration, name, quantity, error in failures:
+        print(f"ACCURACY: the {name} {quantity} on the {duration:g} s bag is off by {error:+.4f}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare}:")
+        regressions = compare_results(baseline, results)
+        for duration, name, old, new in regressions:
+            print(f"REGRESSION: {name} on the {duration:g} s bag, {old:.3f} s -> {new:.3f} s")
+    if failures or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from online_stats import QuantileSketch
+
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+class BinnedStats:
+    """
+    Count, mean, standard deviation and percentiles of values in bins of one or two axes,
+    mergeable across chunks.
+
+    Bins have a fixed width per axis and are aligned to multiples of it, bin k covering
+    [k * width, (k + 1) * width), so the bins of every chunk line up and only bins
+    holding values are stored. Percentiles come from a QuantileSketch per bin.
+    """
+
+    def __init__(self, widths, percentiles=DEFAULT_PERCENTILES):
+        """
+        Args:
+            widths (dict): Axis name to bin width, one or two axes.
+            percentiles (tuple, optional): Percentiles (0 to 100) to report per bin.
+        """
+        self.axes = tuple(widths)
+        self.widths = np.array([float(widths[axis]) for axis in self.axes])
+        self.percentiles = tuple(percentiles)
+        self.keys = np.empty((0, len(self.axes)), dtype=np.int64)
+        self.count = np.empty(0, dtype=np.int64)
+        self.mean = np.empty(0)
+        self.m2 = np.empty(0)  # sum of squared differences from the bin mean
+        self.sketches = []
+
+    def update(self, values, *axis_values):
+        """Add a chunk of values and their positions on each axis, ignoring NaN"""
+        values = np.asarray(values, dtype=np.float64)
+        coords = np.column_stack([np.floor(np.asarray(position, dtype=np.float64) / width)
+                                  for position, width in zip(axis_values, self.widths)])
+        finite = np.isfinite(values) & np.isfinite(coords).all(axis=1)
+        values = values[finite]
+        if len(values) == 0:
+            return
+        keys, inverse, counts = np.unique(coords[finite].astype(np.int64), axis=0,
+                                          return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        means = np.bincount(inverse, weights=values, minlength=len(keys)) / counts
+        m2 = np.bincount(inverse, weights=(values - means[inverse])**2, minlength=len(keys))
+
+        # Values grouped by bin with one sort, for the per-bin sketches
+        grouped = np.split(values[np.argsort(inverse, kind='stable')], np.cumsum(counts)[:-1])
+        sketches = []
+        for group in grouped:
+            sketch = QuantileSketch()
+            sketch.update(group)
+            sketches.append(sketch)
+        self._combine(keys, counts, means, m2, sketches)
+
+    def merge(self, other):
+        """Combine with the statistics of another chunk binned the same way"""
+        if other.axes != self.axes or not np.array_equal(other.widths, self.widths) or \
+                other.percentiles != self.percentiles:
+            raise ValueError("Only statistics with the same axes, bin widths and percentiles can be merged.")
+        self._combine(other.keys, other.count, other.mean, other.m2, other.sketches)
+
+    def _combine(self, keys, counts, means, m2, sketches):
+        # Chan et al. parallel update, for every bin at once
+        all_keys = np.concatenate([self.keys, keys])
+        all_counts = np.concatenate([self.count, counts])
+        all_means = np.concatenate([self.mean, means])
+        self.keys, inverse = np.unique(all_keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        self.count = np.bincount(inverse, weights=all_counts, minlength=len(self.keys)).astype(np.int64)
+        self.mean = np.bincount(inverse, weights=all_counts * all_means, minlength=len(self.keys)) / self.count
+        self.m2 = np.bincount(inverse, weights=np.concatenate([self.m2, m2]) +
+                              all_counts * (all_means - self.mean[inverse])**2, minlength=len(self.keys))
+
+        merged = [QuantileSketch() for _ in range(len(self.keys))]
+        for index, sketch in zip(inverse.tolist(), self.sketches + list(sketches)):
+            merged[index].merge(sketch)
+        self.sketches = merged
+
+    def to_frame(self):
+        """One row per non-empty bin with its bounds on each axis, count, mean, std and percentiles"""
+        data = {}
+        for axis, width, key in zip(self.axes, self.widths, self.keys.T):
+            data[f'{axis}_min'] = key * width
+            data[f'{axis}_max'] = (key + 1) * width
+        data['count'] = self.count
+        data['mean'] = self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            data['std'] = np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+        for percentile in self.percentiles:
+            data[f'p{percentile:g}'] = [sketch.quantile(percentile / 100) for sketch in self.sketches]
+        return pd.DataFrame(data)
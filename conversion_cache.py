@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import pandas as pd
+from BagToCsv import PARSER_VERSION
+
+CSV_ROOT = "csv"
+CACHE_DIR = os.path.join(CSV_ROOT, "cache")
+CACHE_MAX_BYTES = 5 * 1024 ** 3  # size cap for the whole csv/ tree
+MANIFEST_NAME = "manifest.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def bag_content_hash(bag_path):
+    """Hash the contents of a bag file or of every file in a bag folder"""
+    digest = hashlib.blake2b(digest_size=20)
+    if os.path.isdir(bag_path):
+        paths = sorted(os.path.join(bag_path, name) for name in os.listdir(bag_path))
+    else:
+        paths = [bag_path]
+
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(bag_hash, columns, start=None, stop=None, last_seconds=None):
+    """Build the cache key from the bag hash, parser version, topic set and time window"""
+    request = {
+        'bag_hash': bag_hash,
+        'parser_version': PARSER_VERSION,
+        'columns': {topic: fields for topic, fields in sorted(columns.items())},
+        'window': [start, stop, last_seconds],
+    }
+    return hashlib.blake2b(json.dumps(request, sort_keys=True).encode('utf-8'), digest_size=20).hexdigest()
+
+def cached_dataframes(parser, columns, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Return the parser's dataframes for the given topic fields, converting the bag only on a cache miss"""
+    key = cache_key(bag_content_hash(str(parser.bag_path)), columns,
+                    parser.start, parser.stop, parser.last_seconds)
+    entry_dir = os.path.join(cache_dir, key)
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        # Mark the entry as recently used for the LRU eviction
+        os.utime(manifest_path)
+        print(f"Conversion cache hit: {entry_dir}")
+        return {topic: pd.read_parquet(os.path.join(entry_dir, file_name))
+                for topic, file_name in manifest['topics'].items()}
+
+    frames = parser.to_dataframes(columns=columns)
+
+    # Write into a temporary folder and rename it, so readers never see a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    manifest = {'parser_version': PARSER_VERSION, 'created': time.time(), 'topics': {}}
+    for topic, df in frames.items():
+        file_name = topic.replace('/', '_').lstrip('_') + '.parquet'
+        df.to_parquet(os.path.join(temp_dir, file_name), index=False, compression='zstd')
+        manifest['topics'][topic] = file_name
+    with open(os.path.join(temp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    try:
+        os.replace(temp_dir, entry_dir)
+    except OSError:
+        # Another session stored the same entry first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    enforce_size_cap(cache_dir, max_bytes)
+    return frames
+
+def directory_size(path):
+    """Total size in bytes of all files below a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def enforce_size_cap(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, root=CSV_ROOT):
+    """Evict the least recently used cache entries until the csv/ tree fits in max_bytes"""
+    if not os.path.isdir(cache_dir):
+        return
+
+    total = directory_size(root if os.path.isdir(root) else cache_dir)
+    if total <= max_bytes:
+        return
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        manifest_path = os.path.join(cache_dir, name, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            entries.append((os.path.getmtime(manifest_path), os.path.join(cache_dir, name)))
+
+    for _, entry_dir in sorted(entries):
+        if total <= max_bytes:
+            break
+        size = directory_size(entry_dir)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        print(f"Evicted conversion cache entry: {entry_dir}")
@@ -1,9 +1,26 @@
 import sqlite3
 import os
+import json
 from datetime import datetime
 
 DB_PATH = "flight_data.db"
 
+# Robust error metrics stored next to mean_error and std_error, see robust_stats.robust_summary.
+# Flights saved before they were added have NULL values.
+ROBUST_COLUMNS = {
+    'median_error': 'REAL',
+    'mad_error': 'REAL',
+    'trimmed_mean_error': 'REAL',
+    'p05_error': 'REAL',
+    'p95_error': 'REAL',
+    'outlier_count': 'INTEGER',
+}
+
+# Columns added after the flights table was first created, in the order they are
+# appended to older databases. plot_keys is a JSON object of plot file name to its
+# key in the plot cache, see plot_cache.
+ADDED_COLUMNS = {**ROBUST_COLUMNS, 'plot_keys': 'TEXT'}
+
 def init_database():
     """Initialize the database with required tables"""
     conn = sqlite3.connect(DB_PATH)
@@ -26,27 +43,39 @@ def init_database():
         )
     ''')
     
+    # Add the newer columns to databases created before them
+    cursor.execute('PRAGMA table_info(flights)')
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in ADDED_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE flights ADD COLUMN {column} {column_type}')
+    
     conn.commit()
     conn.close()
 
 def save_flight_data(flight_name, mean_error, std_error, total_points, 
-                    beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path=None, csv_path=None):
-    """Save flight analysis results to database"""
+                    beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path=None, csv_path=None,
+                    robust_metrics=None, plot_keys=None):
+    """Save flight analysis results to database, with the robust metrics keyed by ROBUST_COLUMNS
+    and the plot cache key of every plot file name"""
     init_database()
     
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    robust_metrics = robust_metrics or {}
     
     try:
-        cursor.execute('''
+        cursor.execute(f'''
             INSERT OR REPLACE INTO flights 
             (flight_name, mean_error, std_error, total_points, date, 
-             beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path, csv_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path, csv_path, {', '.join(ADDED_COLUMNS)})
+            VALUES ({', '.join('?' * (11 + len(ADDED_COLUMNS)))})
         ''', (flight_name, mean_error, std_error, total_points, date,
-              beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path, csv_path))
+              beacon_lat, beacon_lon, beacon_alt, plot_path, bag_path, csv_path,
+              *(robust_metrics.get(column) for column in ROBUST_COLUMNS),
+              json.dumps(plot_keys) if plot_keys is not None else None))
         
         conn.commit()
         return True
@@ -94,6 +123,8 @@ def get_flight_data(flight_name):
             'beacon_alt': flight[8],
             'plot_path': flight[9],
             'bag_path': flight[10],
-            'csv_path': flight[11]
+            'csv_path': flight[11],
+            **dict(zip(ADDED_COLUMNS, flight[12:])),
+            'plot_keys': json.loads(flight[12 + len(ROBUST_COLUMNS)]) if flight[12 + len(ROBUST_COLUMNS)] else None
         }
     return None
\ No newline at end of file
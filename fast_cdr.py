@@ -0,0 +1,241 @@
+import struct
+import numpy as np
+from rosbags.interfaces import Nodetype
+
+# Size in bytes of the CDR primitive types; CDR aligns each primitive to its size
+CDR_SIZES = {
+    'bool': 1,
+    'byte': 1,
+    'char': 1,
+    'octet': 1,
+    'int8': 1,
+    'uint8': 1,
+    'int16': 2,
+    'uint16': 2,
+    'int32': 4,
+    'uint32': 4,
+    'int64': 8,
+    'uint64': 8,
+    'float32': 4,
+    'float64': 8,
+}
+
+# NumPy type codes of the CDR primitive types, without byte order
+CDR_FORMATS = {
+    'bool': '?',
+    'byte': 'u1',
+    'char': 'u1',
+    'octet': 'u1',
+    'int8': 'i1',
+    'uint8': 'u1',
+    'int16': 'i2',
+    'uint16': 'u2',
+    'int32': 'i4',
+    'uint32': 'u4',
+    'int64': 'i8',
+    'uint64': 'u8',
+    'float32': 'f4',
+    'float64': 'f8',
+}
+
+# Size of the CDR encapsulation header in front of every message
+CDR_HEADER_SIZE = 4
+
+
+def is_fixed_layout(typestore, msgtype: str) -> bool:
+    """
+    Checks if a message type has a layout the fast path can decode.
+
+    That is every field is a primitive, a string, a fixed-length array of primitives
+    or a nested message of the same kind. Strings are allowed because their length
+    is checked per batch; sequences and arrays of strings or messages are not.
+    """
+    _, fields = typestore.fielddefs[msgtype]
+    for _, (nodetype, details) in fields:
+        if nodetype == Nodetype.NAME:
+            if not is_fixed_layout(typestore, details):
+                return False
+        elif nodetype == Nodetype.BASE:
+            if details[0] not in CDR_SIZES and details[0] != 'string':
+                return False
+        elif nodetype == Nodetype.ARRAY:
+            (element_nodetype, element_details), _ = details
+            if element_nodetype != Nodetype.BASE or element_details[0] not in CDR_SIZES:
+                return False
+        else:
+            return False
+    return True
+
+
+def _walk_layout(typestore, msgtype: str, rawdata: bytes, byteorder: str, pos: int, parent_path: str,
+                 layout: dict, string_offsets: list) -> int:
+    """
+    Computes the byte offset of every leaf field of a message from one sample message.
+
+    Offsets are relative to the end of the encapsulation header, like CDR alignment.
+    String lengths are read from the sample, so the layout holds for every message
+    with the same string lengths.
+
+    Returns:
+        int: The position after the last field.
+    """
+    _, fields = typestore.fielddefs[msgtype]
+    for name, (nodetype, details) in fields:
+        path = f"{parent_path}.{name}" if parent_path else name
+
+        if nodetype == Nodetype.NAME:
+            pos = _walk_layout(typestore, details, rawdata, byteorder, pos, path, layout, string_offsets)
+        elif nodetype == Nodetype.BASE and details[0] == 'string':
+            pos += -pos % 4
+            length = struct.unpack_from(f'{byteorder}I', rawdata, CDR_HEADER_SIZE + pos)[0]
+            if length == 0:
+                raise ValueError(f"String '{path}' has no terminating null byte.")
+            string_offsets.append((pos, length))
+            # The length includes the terminating null byte, which is not part of the value
+            layout[path] = (f'S{max(length - 1, 1)}', pos + 4, length - 1)
+            pos += 4 + length
+        elif nodetype == Nodetype.BASE:
+            size = CDR_SIZES[details[0]]
+            pos += -pos % size
+            layout[path] = (byteorder + CDR_FORMATS[details[0]], pos, None)
+            pos += size
+        else:
+            (_, (element_type, _)), length = details
+            size = CDR_SIZES[element_type]
+            pos += -pos % size
+            layout[path] = ((byteorder + CDR_FORMATS[element_type], (length,)), pos, None)
+            pos += size * length
+    return pos
+
+
+class FastDecoder:
+    """
+    Decodes batches of raw CDR messages of one fixed-layout type with np.frombuffer.
+
+    The batch is viewed as a NumPy structured array, one record per message, so each
+    flattened column is a strided view instead of a per-message deserialize call.
+    A batch whose messages do not share one layout (e.g. strings of different
+    lengths) is rejected and decoded by the generic path instead.
+    """
+
+    def __init__(self, typestore, msgtype: str, fields: list):
+        """
+        Args:
+            typestore: The typestore of the open bag reader.
+            msgtype (str): The message type name.
+            fields (list): The flattened fields to decode, in column order, as
+                           returned by RosbagParser._flattened_fields.
+        """
+        self.typestore = typestore
+        self.msgtype = msgtype
+        self.fields = fields
+        self._layouts = {}
+
+    def _layout(self, rawdata: bytes, byteorder: str):
+        """Returns the structured dtype and string offsets for messages shaped like rawdata."""
+        layout = {}
+        string_offsets = []
+        end = _walk_layout(self.typestore, self.msgtype, rawdata, byteorder, 0, '', layout, string_offsets)
+        if CDR_HEADER_SIZE + end > len(rawdata):
+            raise ValueError(f"Message of {len(rawdata)} bytes is too short for '{self.msgtype}'.")
+
+        names, formats, offsets = [], [], []
+        for i, (fmt, offset, _) in enumerate(layout.values()):
+            names.append(f'f{i}')
+            formats.append(fmt)
+            offsets.append(CDR_HEADER_SIZE + offset)
+        dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': len(rawdata)})
+        field_names = dict(zip(layout, names))
+        string_lengths = {path: length for path, (_, _, length) in layout.items() if length is not None}
+        return dtype, field_names, string_lengths, string_offsets
+
+    @staticmethod
+    def _matches(matrix: np.ndarray, byteorder: str, string_offsets: list) -> bool:
+        """Checks that every message in the batch has the string lengths of the layout."""
+        for offset, length in string_offsets:
+            start = CDR_HEADER_SIZE + offset
+            lengths = matrix[:, start:start + 4].copy().view(f'{byteorder}u4').ravel()
+            if not (lengths == length).all():
+                return False
+        return True
+
+    def decode(self, rawdatas: list):
+        """
+        Decodes a batch of raw messages into flattened columns.
+
+        Args:
+            rawdatas (list): Raw CDR messages of this decoder's type.
+
+        Returns:
+            list: One NumPy array per flattened field, or None if the batch does not
+                  share a single layout and has to be decoded generically.
+        """
+        first = rawdatas[0]
+        size = len(first)
+        if size < CDR_HEADER_SIZE or any(len(rawdata) != size for rawdata in rawdatas):
+            return None
+
+        joined = b''.join(rawdatas)
+        matrix = np.frombuffer(joined, dtype=np.uint8).reshape(len(rawdatas), size)
+        # Every message needs the same encapsulation, i.e. the same byte order
+        if not (matrix[:, :2] == matrix[0, :2]).all():
+            return None
+        byteorder = '<' if first[1] == 1 else '>'
+
+        # Messages of the same size can still split it differently between their
+        # strings, so a cached layout that does not match is rebuilt once from this batch
+        key = (size, byteorder)
+        layout = self._layouts.get(key)
+        if layout is None or not self._matches(matrix, byteorder, layout[3]):
+            try:
+                layout = self._layout(first, byteorder)
+            except (struct.error, ValueError):
+                return None
+            if not self._matches(matrix, byteorder, layout[3]):
+                return None
+            self._layouts[key] = layout
+        dtype, field_names, string_lengths, _ = layout
+
+        records = np.frombuffer(joined, dtype=dtype)
+        columns = []
+        for _, kind, payload, ros_type in self.fields:
+            if kind == 'constant':
+                columns.append(np.full(len(rawdatas), payload))
+                continue
+            if kind == 'element':
+                path, index = payload
+                values = records[field_names[path]][:, index]
+            else:
+                values = records[field_names[payload]]
+            if ros_type == 'string':
+                columns.append(_decode_strings(values, string_lengths[payload]))
+            else:
+                # Contiguous, native byte order copies, so writers can hand them on as they are
+                columns.append(np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('=')))
+        return columns
+
+
+def _decode_strings(values: np.ndarray, length: int) -> np.ndarray:
+    """Decodes a fixed-width bytes column to an object array of str, once per distinct value."""
+    if length == 0:
+        return np.full(len(values), '', dtype=object)
+    unique, inverse = np.unique(values, return_inverse=True)
+    decoded = np.array([value.decode('utf-8') for value in unique], dtype=object)
+    return decoded[inverse.ravel()]
+
+
+def compile_fast_decoder(typestore, msgtype: str, fields: list):
+    """
+    Builds a FastDecoder for a message type, or returns None if its layout is not fixed.
+
+    Args:
+        typestore: The typestore of the open bag reader.
+        msgtype (str): The message type name.
+        fields (list): The flattened fields to decode, in column order.
+
+    Returns:
+        FastDecoder: The decoder, or None for types that need the generic path.
+    """
+    if not is_fixed_layout(typestore, msgtype):
+        return None
+    return FastDecoder(typestore, msgtype, fields)
@@ -0,0 +1,510 @@
+import numpy as np
+import pandas as pd
+from BagToCsv import RosbagParser
+from alignment import align_streams, DEFAULT_MAX_GAP, NS_PER_SECOND
+from geo_utils import beacon_enu, slant_range, radial_velocity
+from online_stats import RunningStats, QuantileSketch, Reservoir
+from binned_stats import BinnedStats
+from robust_stats import hampel_outliers, robust_summary, HAMPEL_WINDOW, HAMPEL_THRESHOLD
+from time_offset import estimate_time_offset
+from beacon_solver import solve_beacon_position, SOLVER_COLUMNS
+from frame_schema import TIME_COLUMN, compact_frame, compact_values, frame_memory, memory_report
+
+UWB_TOPIC = '/uwb_distance'
+GPS_TOPIC = '/mavros/global_position/global'
+VELOCITY_TOPIC = '/mavros/local_position/velocity_local'
+UWB_STATE_TOPIC = '/uwb_state'
+
+VELOCITY_COLUMNS = ['twist.linear.x', 'twist.linear.y', 'twist.linear.z']
+
+# Streaming analysis: seconds of bag per chunk and rows kept per table for plotting
+STREAM_CHUNK_SECONDS = 60
+STREAM_PLOT_POINTS = 20000
+
+# The streaming analysis estimates an 'auto' clock offset from this many windows of
+# this many seconds, spread evenly over the flight, so memory does not grow with it
+OFFSET_WINDOWS = 5
+OFFSET_WINDOW_SECONDS = 60
+
+# Columns kept per table by the streaming analysis, enough for every plot
+STREAM_COLUMNS = {
+    'merged': ['timestamp', 'distance', 'actual_distance', 'latitude', 'longitude', 'altitude', 'beacon_error',
+               'radial_velocity', 'outlier'],
+    'uwb': ['timestamp', 'distance'],
+    'gps': ['timestamp', 'latitude', 'longitude', 'actual_distance'],
+    'uwb_state': ['timestamp', 'sigma', 'sigma_converged', 'sigma_plotted'],
+}
+
+# Bin widths of the merged columns the UWB error is characterized by
+ERROR_BIN_WIDTHS = {
+    'actual_distance': 25.0,  # m
+    'radial_velocity': 1.0,   # m/s
+    'altitude': 10.0,         # m
+}
+
+# Binnings of the UWB error shown for every flight, by one axis or a pair of axes
+ERROR_BINNINGS = [
+    ('actual_distance',),
+    ('radial_velocity',),
+    ('altitude',),
+    ('actual_distance', 'radial_velocity'),
+]
+
+def error_binning(axes):
+    """An empty BinnedStats of the UWB error over the given merged columns"""
+    return BinnedStats({axis: ERROR_BIN_WIDTHS[axis] for axis in axes})
+
+# Tables of a flight and the topic each one starts from. The 'merged' table is the
+# UWB timeline with GPS, velocity and localizer state aligned onto it.
+TABLE_TOPICS = {
+    'uwb': UWB_TOPIC,
+    'gps': GPS_TOPIC,
+    'velocity': VELOCITY_TOPIC,
+    'uwb_state': UWB_STATE_TOPIC,
+    'merged': UWB_TOPIC,
+}
+
+# Derived columns by (table, column): (dependencies, function). The function is called
+# with the FlightAnalysis and the values of the dependencies, columns of the same table.
+# Columns starting with '_' are intermediate values and are not part of a full frame.
+DERIVED_COLUMNS = {}
+
+def derived(table, column, *dependencies):
+    """Register a derived column of a table and the columns it is computed from"""
+    def register(function):
+        DERIVED_COLUMNS[(table, column)] = (dependencies, function)
+        return function
+    return register
+
+## GPS timeline ##
+
+@derived('gps', '_enu', 'latitude', 'longitude', 'altitude')
+def _gps_enu(analysis, latitude, longitude, altitude):
+    return beacon_enu(latitude, longitude, altitude, analysis.beacon_lat, analysis.beacon_lon, analysis.beacon_alt)
+
+@derived('gps', 'east', '_enu')
+def _gps_east(analysis, enu):
+    return enu[0]
+
+@derived('gps', 'north', '_enu')
+def _gps_north(analysis, enu):
+    return enu[1]
+
+@derived('gps', 'up', '_enu')
+def _gps_up(analysis, enu):
+    return enu[2]
+
+@derived('gps', 'actual_distance', 'east', 'north', 'up')
+def _gps_actual_distance(analysis, east, north, up):
+    return slant_range(east, north, up)
+
+## UWB timeline, with the GPS ENU position interpolated onto it ##
+
+# The true 3D range costs more than a great-circle distance: converting every UWB
+# reading to ENU takes about 0.12 s per 1M readings, against 0.05 s for haversine.
+# Each GPS fix is converted once instead (the gps '_enu' column) and east, north and
+# up are interpolated onto the UWB timeline, about 0.06 s per 1M readings with a GPS
+# fix per 5 readings: 0.025 s of conversion, 0.03 s of interpolation, and the range.
+
+@derived('merged', 'actual_distance', 'east', 'north', 'up')
+def _actual_distance(analysis, east, north, up):
+    return slant_range(east, north, up)
+
+@derived('merged', 'beacon_error', 'distance', 'actual_distance')
+def _beacon_error(analysis, distance, actual_distance):
+    return distance - actual_distance
+
+@derived('merged', 'radial_velocity', 'east', 'north', 'up', 'actual_distance', *VELOCITY_COLUMNS)
+def _radial_velocity(analysis, east, north, up, actual_distance, vel_x, vel_y, vel_z):
+    return radial_velocity(east, north, up, vel_x, vel_y, vel_z, actual_distance)
+
+@derived('merged', 'outlier', 'beacon_error')
+def _outlier(analysis, beacon_error):
+    return hampel_outliers(beacon_error, analysis.hampel_window, analysis.hampel_threshold)
+
+@derived('merged', 'sigma_converged', 'sigma')
+def _merged_sigma_converged(analysis, sigma):
+    return sigma < analysis.sigma_threshold
+
+## Localizer state ##
+
+@derived('uwb_state', 'sigma_converged', 'sigma')
+def _sigma_converged(analysis, sigma):
+    return sigma < analysis.sigma_threshold
+
+@derived('uwb_state', 'sigma_plotted', 'sigma')
+def _sigma_plotted(analysis, sigma):
+    return sigma < analysis.max_plot_sigma
+
+
+class FlightAnalysis:
+    """
+    Derived columns of one flight, computed lazily and memoized.
+
+    A column is computed the first time it or a column depending on it is requested,
+    and never again for the same flight. Pages ask for just the columns they show,
+    e.g. analysis.frame('merged', ['timestamp', 'beacon_error']).
+
+    The frames are held in the compact schema of frame_schema: the int64 ns
+    timestamps as recorded, float32 columns except latitude and longitude, and
+    categorical strings.
+    """
+
+    def __init__(self, frames, beacon_lat, beacon_lon, beacon_alt, max_gap=DEFAULT_MAX_GAP,
+                 sigma_threshold=2.0, max_plot_sigma=50, hampel_window=HAMPEL_WINDOW,
+                 hampel_threshold=HAMPEL_THRESHOLD, time_offset=0.0):
+        """
+        Args:
+            frames (dict): Topic name to DataFrame, as returned by cached_dataframes.
+            beacon_lat, beacon_lon, beacon_alt: Surveyed beacon position (WGS84).
+            max_gap (float, optional): Largest gap in seconds when aligning streams onto
+                                       the UWB timeline, see alignment.align_streams.
+            sigma_threshold (float, optional): Sigma below which the localizer counts as
+                                               converged.
+            max_plot_sigma (float, optional): Sigma below which state samples are plotted.
+            hampel_window (int, optional): UWB readings per window of the Hampel filter
+                                           flagging outliers, see robust_stats.
+            hampel_threshold (float, optional): Scaled MADs beyond which a reading is an outlier.
+            time_offset (float or str, optional): Seconds added to the UWB timestamps to line
+                                                  them up with the MAVROS ones before alignment,
+                                                  or 'auto' to estimate it, see time_offset.
+        """
+        self.memory_before = {topic: frame_memory(df) for topic, df in frames.items()}
+        self.frames = {topic: compact_frame(df) for topic, df in frames.items()}
+        self.beacon_lat = beacon_lat
+        self.beacon_lon = beacon_lon
+        self.beacon_alt = beacon_alt
+        self.max_gap = max_gap
+        self.sigma_threshold = sigma_threshold
+        self.max_plot_sigma = max_plot_sigma
+        self.hampel_window = hampel_window
+        self.hampel_threshold = hampel_threshold
+        self.time_offset = time_offset
+        self._offset_estimate = None
+        self._tables = {}
+        self._values = {}
+        self._error_bins = {}
+
+    def has_table(self, table):
+        """True if the bag had the topics the table is built from"""
+        if table == 'merged':
+            return all(self.has_table(name) for name in ('uwb', 'gps', 'velocity'))
+        return TABLE_TOPICS[table] in self.frames
+
+    def table(self, table):
+        """The base columns of a table, before any derived column"""
+        if table not in self._tables:
+            if table == 'merged':
+                self._tables[table] = self._merged_table()
+            else:
+                self._tables[table] = self.frames[TABLE_TOPICS[table]]
+        return self._tables[table]
+
+    def estimate_time_offset(self):
+        """Clock offset of the UWB ranges against the GPS distances to the beacon, see time_offset.estimate_time_offset"""
+        if self._offset_estimate is None:
+            uwb_times = self.column('uwb', TIME_COLUMN)
+            gps_times = self.column('gps', TIME_COLUMN)
+            # Seconds from the first reading, epoch ns lose sub-microsecond digits as float64 seconds
+            origin = min(uwb_times[:1].tolist() + gps_times[:1].tolist(), default=0)
+            self._offset_estimate = estimate_time_offset(
+                (uwb_times - origin) / NS_PER_SECOND, self.column('uwb', 'distance'),
+                (gps_times - origin) / NS_PER_SECOND, self.column('gps', 'actual_distance'))
+        return self._offset_estimate
+
+    def uwb_time_offset(self):
+        """Seconds added to the UWB timestamps before alignment, estimated once for 'auto'"""
+        if self.time_offset == 'auto':
+            try:
+                self.time_offset = self.estimate_time_offset()['offset']
+            except ValueError as e:
+                print(f"Not correcting the UWB clock offset: {e}")
+                self.time_offset = 0.0
+        return self.time_offset
+
+    def _merged_table(self):
+        """Interpolate GPS ENU position and velocity onto the UWB timestamps"""
+        gps = pd.DataFrame({column: self.column('gps', column)
+                            for column in [TIME_COLUMN, 'latitude', 'longitude', 'altitude', 'east', 'north', 'up']})
+        velocity = self.table('velocity')[[TIME_COLUMN] + VELOCITY_COLUMNS]
+        # Moving the MAVROS streams back by the offset lines them up with the UWB clock
+        # and keeps the UWB timeline of the merged table as recorded
+        shift = round(self.uwb_time_offset() * NS_PER_SECOND)
+        if shift:
+            gps[TIME_COLUMN] = gps[TIME_COLUMN] - shift
+            velocity = velocity.assign(**{TIME_COLUMN: velocity[TIME_COLUMN] - shift})
+        align = {'max_gap': self.max_gap, 'on': TIME_COLUMN}
+        merged = align_streams(self.table('uwb'), [gps, velocity], method='linear', **align)
+        # Readings without a GPS or velocity sample close enough have nothing to compare against
+        merged = merged.dropna(subset=['latitude', VELOCITY_COLUMNS[0]]).reset_index(drop=True)
+
+        if self.has_table('uwb_state'):
+            # Localizer sigma at each UWB reading, from the nearest state message
+            merged = align_streams(merged, [self.table('uwb_state')[[TIME_COLUMN, 'sigma']]], **align)
+
+        # As loaded, i.e. with float64 values
+        self.memory_before['merged'] = frame_memory(merged)
+        return compact_frame(merged)
+
+    def column(self, table, column):
+        """The values of a base or derived column as a NumPy array"""
+        key = (table, column)
+        if key not in self._values:
+            base = self.table(table)
+            if column in base.columns:
+                value = base[column].to_numpy()
+            elif key in DERIVED_COLUMNS:
+                dependencies, function = DERIVED_COLUMNS[key]
+                value = function(self, *(self.column(table, dependency) for dependency in dependencies))
+                if isinstance(value, np.ndarray):
+                    value = compact_values(column, value)
+            else:
+                raise KeyError(f"Column '{column}' is not available for table '{table}'.")
+            self._values[key] = value
+        return self._values[key]
+
+    def columns(self, table):
+        """Names of the base and derived columns of a table that can be computed"""
+        names = list(self.table(table).columns)
+        for derived_table, column in DERIVED_COLUMNS:
+            if derived_table == table and not column.startswith('_') and column not in names and \
+                    self._can_compute(table, column):
+                names.append(column)
+        return names
+
+    def _can_compute(self, table, column):
+        if column in self.table(table).columns:
+            return True
+        if (table, column) not in DERIVED_COLUMNS:
+            return False
+        dependencies, _ = DERIVED_COLUMNS[(table, column)]
+        return all(self._can_compute(table, dependency) for dependency in dependencies)
+
+    def memory_report(self):
+        """Bytes per row of the loaded frames and the merged frame, before and after the compact schema"""
+        after = {topic: frame_memory(df) for topic, df in self.frames.items()}
+        if 'merged' in self._tables:
+            after['merged'] = frame_memory(self._tables['merged'])
+        return memory_report(self.memory_before, after)
+
+    def error_summary(self):
+        """Number of UWB readings and the mean, standard deviation, minimum and maximum of their error"""
+        error = pd.Series(self.column('merged', 'beacon_error'), dtype=np.float64)
+        return {'count': int(error.count()), 'mean': error.mean(), 'std': error.std(),
+                'min': error.min(), 'max': error.max()}
+
+    def error_quantile(self, q):
+        """The UWB error at quantile q (0 to 1)"""
+        return float(np.nanquantile(self.column('merged', 'beacon_error'), q))
+
+    def robust_summary(self):
+        """Median, MAD, trimmed mean and percentiles of the UWB error and the number of Hampel outliers"""
+        return robust_summary(self.column('merged', 'beacon_error'), self.column('merged', 'outlier').sum())
+
+    def error_bins(self, *axes):
+        """
+        Count, mean, std and percentiles of the UWB error per bin of one or two merged
+        columns, e.g. analysis.error_bins('actual_distance', 'radial_velocity').
+        Bin widths are in ERROR_BIN_WIDTHS. Computed once per flight.
+        """
+        if axes not in self._error_bins:
+            stats = error_binning(axes)
+            stats.update(self.column('merged', 'beacon_error'), *(self.column('merged', axis) for axis in axes))
+            self._error_bins[axes] = stats.to_frame()
+        return self._error_bins[axes]
+
+    def solve_beacon(self):
+        """Beacon position and UWB range bias fitted to this flight's ranges, see beacon_solver.solve_beacon_position"""
+        return solve_beacon_position([self.frame('merged', SOLVER_COLUMNS)], self.beacon_lat, self.beacon_lon,
+                                     self.beacon_alt)
+
+    def frame(self, table, columns=None, where=None):
+        """
+        A DataFrame of the requested columns of a table.
+
+        Args:
+            table (str): 'merged', 'uwb', 'gps', 'velocity' or 'uwb_state'.
+            columns (list, optional): The columns to include. Defaults to all columns.
+            where (str, optional): A boolean column; only rows where it is True are kept.
+        """
+        if columns is None:
+            columns = self.columns(table)
+        df = pd.DataFrame({column: self.column(table, column) for column in columns}, columns=columns)
+        if where is not None:
+            df = df[self.column(table, where)].reset_index(drop=True)
+        return df
+
+
+class FlightSummary:
+    """
+    Streaming counterpart of FlightAnalysis for bags too large to analyze in one piece.
+
+    The bag is analyzed one time chunk at a time. The error metrics are kept in
+    mergeable online accumulators and the plot data in fixed-size random samples,
+    so memory stays flat however long the flight is. It answers the same has_table,
+    frame and error_summary calls as FlightAnalysis, with frames being samples.
+    """
+
+    def __init__(self, beacon_lat, beacon_lon, beacon_alt, max_gap=DEFAULT_MAX_GAP,
+                 sigma_threshold=2.0, max_plot_sigma=50, hampel_window=HAMPEL_WINDOW,
+                 hampel_threshold=HAMPEL_THRESHOLD, time_offset=0.0, plot_points=STREAM_PLOT_POINTS):
+        self.beacon_lat = beacon_lat
+        self.beacon_lon = beacon_lon
+        self.beacon_alt = beacon_alt
+        self.max_gap = max_gap
+        self.sigma_threshold = sigma_threshold
+        self.max_plot_sigma = max_plot_sigma
+        self.hampel_window = hampel_window
+        self.hampel_threshold = hampel_threshold
+        # 'auto' is estimated from the first chunk with UWB and GPS data, then kept;
+        # stream_flight_summary estimates it over the whole flight before the first chunk
+        self.time_offset = time_offset
+        self.outlier_count = 0
+        self.error_stats = RunningStats()
+        self.error_quantiles = QuantileSketch()
+        self.error_binnings = {axes: error_binning(axes) for axes in ERROR_BINNINGS}
+        self.samples = {table: Reservoir(plot_points) for table in STREAM_COLUMNS}
+        # Last message of every topic, e.g. the final commanded landing point
+        self.last_samples = {}
+
+    def add_chunk(self, frames, start, stop):
+        """Add the DataFrames of one time chunk, counting only rows in [start, stop)"""
+        analysis = FlightAnalysis(frames, self.beacon_lat, self.beacon_lon, self.beacon_alt, self.max_gap,
+                                  self.sigma_threshold, self.max_plot_sigma, self.hampel_window,
+                                  self.hampel_threshold, self.time_offset)
+        for table, columns in STREAM_COLUMNS.items():
+            if not analysis.has_table(table):
+                continue
+            df = analysis.frame(table, columns)
+            # Chunks are read with margins for the interpolation, which overlap
+            df = df[(df['timestamp'] >= start) & (df['timestamp'] < stop)]
+            if table == 'merged':
+                self.error_stats.update(df['beacon_error'].to_numpy())
+                self.error_quantiles.update(df['beacon_error'].to_numpy())
+                self.outlier_count += int(df['outlier'].sum())
+                for axes, stats in self.error_binnings.items():
+                    stats.update(df['beacon_error'].to_numpy(), *(df[axis].to_numpy() for axis in axes))
+            self.samples[table].update(df)
+        if analysis.has_table('merged'):
+            self.time_offset = analysis.uwb_time_offset()
+
+        for topic, df in frames.items():
+            df = df[(df['timestamp'] >= start) & (df['timestamp'] < stop)]
+            if not df.empty:
+                self.last_samples[topic] = df.iloc[[-1]].reset_index(drop=True)
+
+    def has_table(self, table):
+        return table in self.samples and self.samples[table].seen > 0
+
+    def error_summary(self):
+        return {'count': self.error_stats.count, 'mean': self.error_stats.mean, 'std': self.error_stats.std,
+                'min': self.error_stats.min, 'max': self.error_stats.max}
+
+    def error_quantile(self, q):
+        return self.error_quantiles.quantile(q)
+
+    def uwb_time_offset(self):
+        return 0.0 if self.time_offset == 'auto' else self.time_offset
+
+    def robust_summary(self):
+        """
+        Robust metrics of the UWB error over the whole flight. Median, MAD, trimmed mean
+        and percentiles come from the histogram of the quantile sketch, so are resolved
+        to about 1% of the error itself.
+        """
+        values, counts = self.error_quantiles.histogram()
+        return robust_summary(values, self.outlier_count, weights=counts)
+
+    def error_bins(self, *axes):
+        """Binned UWB error over the whole flight, for the binnings in ERROR_BINNINGS"""
+        if axes not in self.error_binnings:
+            raise KeyError(f"The streaming analysis only keeps the binnings {ERROR_BINNINGS}.")
+        return self.error_binnings[axes].to_frame()
+
+    def solve_beacon(self):
+        """Beacon position and UWB range bias fitted to the sampled readings"""
+        return solve_beacon_position([self.frame('merged', SOLVER_COLUMNS)], self.beacon_lat, self.beacon_lon,
+                                     self.beacon_alt)
+
+    def frame(self, table, columns=None, where=None):
+        """A time-ordered random sample of at most plot_points rows of a table"""
+        df = self.samples[table].to_frame()
+        if where is not None:
+            df = df[df[where].astype(bool)].reset_index(drop=True)
+        return df if columns is None else df[columns]
+
+
+def solve_flights_beacon(analyses):
+    """
+    One beacon position fitted jointly to several flights, with a UWB range bias per flight.
+    The first flight's entered beacon position is the origin of the local frame.
+
+    Args:
+        analyses (list): FlightAnalysis or FlightSummary of each flight.
+    """
+    first = analyses[0]
+    return solve_beacon_position([analysis.frame('merged', SOLVER_COLUMNS) for analysis in analyses],
+                                 first.beacon_lat, first.beacon_lon, first.beacon_alt)
+
+
+def estimate_flight_time_offset(parser, columns, beacon_lat, beacon_lon, beacon_alt):
+    """
+    Clock offset of the UWB ranges over the time window of a bag, for a streaming
+    analysis with an 'auto' offset.
+
+    Only the UWB and GPS topics of OFFSET_WINDOWS windows of OFFSET_WINDOW_SECONDS,
+    spread evenly over the time window, are decoded, one window at a time, so memory
+    stays flat however long the flight is. Each window is estimated as
+    FlightAnalysis.estimate_time_offset does, and the offset is the median of the
+    window estimates. Windows cover the whole of shorter flights.
+    """
+    start, stop = parser.time_window()
+    window_ns = int(OFFSET_WINDOW_SECONDS * 1e9)
+    if stop - start <= OFFSET_WINDOWS * window_ns:
+        windows = [(start, stop)]
+    else:
+        # Integer ns, epoch timestamps are not exact as float64
+        window_starts = [start + (stop - window_ns - start) * index // (OFFSET_WINDOWS - 1)
+                         for index in range(OFFSET_WINDOWS)]
+        windows = [(window_start, window_start + window_ns) for window_start in window_starts]
+
+    offsets = []
+    for window_start, window_stop in windows:
+        window = RosbagParser(parser.bag_path, parser.output_dir, workers=parser.workers,
+                              start=window_start, stop=window_stop)
+        frames = window.to_dataframes(columns={topic: columns.get(topic) for topic in (UWB_TOPIC, GPS_TOPIC)})
+        if UWB_TOPIC not in frames or GPS_TOPIC not in frames:
+            continue
+        try:
+            offsets.append(FlightAnalysis(frames, beacon_lat, beacon_lon, beacon_alt).estimate_time_offset()['offset'])
+        except ValueError as e:
+            print(f"No UWB clock offset from {window_start} to {window_stop} ns: {e}")
+    if not offsets:
+        print("Not correcting the UWB clock offset: no part of the bag has enough UWB ranges and GPS fixes.")
+        return 0.0
+    return float(np.median(offsets))
+
+
+def stream_flight_summary(parser, columns, beacon_lat, beacon_lon, beacon_alt,
+                          chunk_seconds=STREAM_CHUNK_SECONDS, **options):
+    """
+    Analyze a bag chunk by chunk into a FlightSummary.
+
+    Args:
+        parser (RosbagParser): Parser of the bag, with its time window.
+        columns (dict): The fields to decode per topic.
+        beacon_lat, beacon_lon, beacon_alt: Surveyed beacon position (WGS84).
+        chunk_seconds (float, optional): Seconds of bag decoded and analyzed at a time.
+        **options: Further FlightSummary arguments, e.g. sigma_threshold. A time_offset
+                   of 'auto' is estimated over the whole flight first, see
+                   estimate_flight_time_offset.
+    """
+    summary = FlightSummary(beacon_lat, beacon_lon, beacon_alt, **options)
+    if summary.time_offset == 'auto':
+        # One chunk is too short to place the offset, and every chunk must use the same one
+        summary.time_offset = estimate_flight_time_offset(parser, columns, beacon_lat, beacon_lon, beacon_alt)
+    # Margins cover the interpolation and the shift of the MAVROS streams by the clock offset
+    margin = summary.max_gap + abs(summary.time_offset)
+    for start, stop, frames in parser.iter_dataframes(chunk_seconds, columns=columns, margin_seconds=margin):
+        summary.add_chunk(frames, start, stop)
+    return summary
@@ -0,0 +1,91 @@
+from BagToCsv import RosbagParser
+from conversion_cache import cached_dataframes
+from geo_utils import haversine
+from flight_analysis import (FlightAnalysis, stream_flight_summary, UWB_TOPIC, GPS_TOPIC, VELOCITY_TOPIC,
+                             UWB_STATE_TOPIC)
+
+LZ_TOPIC = '/uwb_lz_nav'
+
+# Topics and fields the analysis reads. Only these are decoded from the bag;
+# None keeps every field of the topic.
+ANALYSIS_FIELDS = {
+    UWB_TOPIC: ['timestamp', 'distance'],
+    GPS_TOPIC: ['timestamp', 'latitude', 'longitude', 'altitude'],
+    VELOCITY_TOPIC: ['timestamp', 'twist.linear.x', 'twist.linear.y', 'twist.linear.z'],
+    UWB_STATE_TOPIC: ['timestamp', 'sigma'],
+    LZ_TOPIC: None,
+}
+
+# Topics without which there is no UWB error to analyze
+REQUIRED_TOPICS = [UWB_TOPIC, GPS_TOPIC, VELOCITY_TOPIC]
+
+def process_bag_data(bag_path, csv_output_dir, beacon_lat, beacon_lon, beacon_alt, save_topics=False,
+                     last_seconds=None, sigma_threshold=2.0, streaming=False, time_offset=0.0, cache=True):
+    """
+    Read a bag and set up its analysis, as the Current Flight page shows it.
+
+    Args:
+        bag_path (str): The ros2 bag folder.
+        csv_output_dir (str): Folder for the saved topics.
+        beacon_lat, beacon_lon, beacon_alt: Surveyed beacon position (WGS84).
+        save_topics (bool, optional): Save the decoded topics as Parquet files.
+        last_seconds (float, optional): Only analyze the last seconds of the bag.
+        sigma_threshold (float, optional): Sigma below which the localizer counts as converged.
+        streaming (bool, optional): Analyze the bag one chunk at a time into a FlightSummary.
+        time_offset (float or str, optional): UWB clock offset in seconds, or 'auto'.
+        cache (bool, optional): Reuse the conversion cache, see conversion_cache.
+
+    Returns:
+        tuple: (analysis, commanded_landing) with the FlightAnalysis or FlightSummary
+               and the last UWB landing estimate ('lat', 'lon', 'distance_from_beacon'),
+               or None for it without one. (None, None) if required topics are missing.
+    """
+    parser = RosbagParser(bag_file_path=bag_path, output_dir=csv_output_dir, last_seconds=last_seconds)
+    if streaming:
+        # Analyze the bag one chunk at a time, only summaries and plot samples are kept
+        if save_topics:
+            parser.export_to_parquet(columns=ANALYSIS_FIELDS)
+        analysis = stream_flight_summary(parser, ANALYSIS_FIELDS, beacon_lat, beacon_lon, beacon_alt,
+                                         sigma_threshold=sigma_threshold, time_offset=time_offset)
+        frames = analysis.last_samples
+        if not analysis.has_table('merged'):
+            print(f"Required topics not found, the bag needs {', '.join(REQUIRED_TOPICS)}.")
+            return None, None
+    else:
+        frames = cached_dataframes(parser, ANALYSIS_FIELDS) if cache else parser.to_dataframes(columns=ANALYSIS_FIELDS)
+        if save_topics:
+            parser.save_dataframes(frames)
+
+        if not all(topic in frames for topic in REQUIRED_TOPICS):
+            print(f"Required topics not found, the bag needs {', '.join(REQUIRED_TOPICS)}.")
+            return None, None
+
+        # Derived columns such as actual_distance and beacon_error are computed once,
+        # when a metric or plot first asks for them
+        analysis = FlightAnalysis(frames, beacon_lat, beacon_lon, beacon_alt, sigma_threshold=sigma_threshold,
+                                  time_offset=time_offset)
+
+    # Load UWB LZ message data if available
+    uwb_lz_df = frames.get(LZ_TOPIC)
+    if uwb_lz_df is not None:
+        # latitude and longitude
+        if 'latitude' in uwb_lz_df.columns and 'longitude' in uwb_lz_df.columns:
+            uwb_lz_df = uwb_lz_df[['timestamp', 'latitude', 'longitude']]
+
+    # Convert UWB state NED coordinates to GPS coordinates
+    commanded_landing = None
+    if uwb_lz_df is not None and not uwb_lz_df.empty:
+        # Get the last row in the data frame
+        landing_lat = uwb_lz_df['latitude'].iloc[-1]
+        landing_lon = uwb_lz_df['longitude'].iloc[-1]
+
+        # Calculate distance from beacon to commanded landing point
+        landing_distance = haversine(beacon_lat, beacon_lon, landing_lat, landing_lon)
+
+        commanded_landing = {
+            'lat': landing_lat,
+            'lon': landing_lon,
+            'distance_from_beacon': landing_distance
+        }
+
+    return analysis, commanded_landing
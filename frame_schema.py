@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+# Time stays the int64 ns timestamp of the bag: streams are aligned and chunks split
+# on it, and rounding it moves readings along a trajectory. Times are only shown in
+# this unit (ms), e.g. in charts.
+TIME_COLUMN = 'timestamp'
+TIME_UNIT_NS = 1_000_000
+
+# Columns kept at float64. float32 has about 7 significant digits, i.e. about a meter
+# in latitude/longitude, but well under a millimeter in the distances and ENU offsets.
+FLOAT64_COLUMNS = {'latitude', 'longitude'}
+
+def compact_values(column, values):
+    """Values of one column in the compact schema: float32 unless the column needs float64"""
+    if values.dtype.kind == 'f' and values.dtype != np.float32 and column not in FLOAT64_COLUMNS:
+        return values.astype(np.float32)
+    return values
+
+def compact_frame(df):
+    """Apply the compact schema to a frame, keeping its int64 ns timestamps as they are"""
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        if column == TIME_COLUMN:
+            data[column] = values.to_numpy(dtype=np.int64)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            data[column] = values.astype('category')
+        else:
+            data[column] = compact_values(column, values.to_numpy())
+    return pd.DataFrame(data, index=df.index)
+
+def frame_memory(df):
+    """Rows and bytes of a dataframe, including the contents of object columns"""
+    return len(df), int(df.memory_usage(index=False, deep=True).sum())
+
+def memory_report(before, after):
+    """Bytes per row of each frame before and after the compact schema
+
+    Args:
+        before (dict): Name to (rows, bytes) of the frames as loaded.
+        after (dict): Name to (rows, bytes) of the compact frames.
+    """
+    rows = []
+    for name, (count, after_bytes) in after.items():
+        _, before_bytes = before.get(name, (count, after_bytes))
+        rows.append({
+            'frame': name,
+            'rows': count,
+            'bytes_per_row_before': before_bytes / count if count else 0.0,
+            'bytes_per_row_after': after_bytes / count if count else 0.0,
+            'total_mb_before': before_bytes / 2**20,
+            'total_mb_after': after_bytes / 2**20,
+        })
+    return pd.DataFrame(rows)
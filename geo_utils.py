@@ -0,0 +1,56 @@
+import numpy as np
+from functools import lru_cache
+from pyproj import Transformer
+
+EARTH_RADIUS = 6371000  # Earth radius in meters
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between GPS coordinates, for scalars or whole columns"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS * c
+
+@lru_cache(maxsize=16)
+def enu_transformer(beacon_lat, beacon_lon, beacon_alt):
+    """Transformer from WGS84 lon/lat/height to east/north/up meters around the beacon, built once per beacon"""
+    return Transformer.from_pipeline(
+        "+proj=pipeline "
+        "+step +proj=cart +ellps=WGS84 "
+        f"+step +proj=topocentric +ellps=WGS84 +lat_0={beacon_lat!r} +lon_0={beacon_lon!r} +h_0={beacon_alt!r}"
+    )
+
+def beacon_enu(lat, lon, alt, beacon_lat, beacon_lon, beacon_alt):
+    """East, north and up offsets in meters of GPS positions from the beacon, via ECEF in one batched call
+
+    Altitudes are heights above the WGS84 ellipsoid, as published in NavSatFix.
+    """
+    transformer = enu_transformer(float(beacon_lat), float(beacon_lon), float(beacon_alt))
+    east, north, up = transformer.transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64),
+                                            np.asarray(alt, dtype=np.float64))
+    return np.asarray(east), np.asarray(north), np.asarray(up)
+
+def slant_range(east, north, up):
+    """True 3D distance in meters to the beacon from east, north and up offsets, e.g. from beacon_enu"""
+    return np.sqrt(east**2 + north**2 + up**2)
+
+def radial_velocity(east, north, up, vel_x, vel_y, vel_z, distance=None):
+    """
+    Velocity component towards the beacon for whole columns, from east, north and up
+    offsets and local ENU velocities (x east, y north, z up). Pass the slant_range of
+    the offsets as distance if it is already known.
+    """
+    if distance is None:
+        distance = slant_range(east, north, up)
+    # Along the line of sight to the beacon, -ENU / range
+    return -(vel_x*east + vel_y*north + vel_z*up) / distance
+
+def enu_to_geodetic(east, north, up, beacon_lat, beacon_lon, beacon_alt):
+    """Latitude, longitude and altitude (WGS84) of east, north and up offsets in meters from the beacon"""
+    transformer = enu_transformer(float(beacon_lat), float(beacon_lon), float(beacon_alt))
+    lon, lat, alt = transformer.transform(np.asarray(east, dtype=np.float64), np.asarray(north, dtype=np.float64),
+                                          np.asarray(up, dtype=np.float64), direction='INVERSE')
+    return np.asarray(lat), np.asarray(lon), np.asarray(alt)
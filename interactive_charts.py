@@ -0,0 +1,226 @@
+# Interactive versions of the plots in plot_utilities, drawn in the browser with Altair.
+# Each chart sends a decimated column payload instead of a rendered image. Charts with
+# a zoom column let a time (or range) window be brushed; the page passes the window
+# back and the chart is rebuilt from the full data inside it, at the same point budget.
+
+import numpy as np
+import pandas as pd
+import altair as alt
+from frame_schema import TIME_UNIT_NS
+from plot_utilities import decimate_series, density_grid
+
+# Points sent to the browser per chart, split between the series of charts with two.
+# Kept under Altair's 5000 row limit for inline data, so payloads stay small.
+INTERACTIVE_POINT_BUDGET = 4000
+
+# Cells (x, y) of the density chart drawn instead of a scatter above the point budget
+INTERACTIVE_DENSITY_BINS = (80, 50)
+
+# Decimals sent for distances and errors (mm), velocities and sigma, and coordinates
+DISTANCE_DECIMALS = 3
+VALUE_DECIMALS = 2
+COORDINATE_DECIMALS = 7
+
+CHART_HEIGHT = 400
+
+# Name of the interval selection charts are zoomed with
+ZOOM_SELECTION = 'zoom'
+
+# Column of the data each chart is zoomed on, by plot name. The path is zoomed and
+# panned in the browser only, it is drawn in full.
+CHART_ZOOM_COLUMNS = {
+    'distance': 'timestamp',
+    'error_time': 'timestamp',
+    'error_distance': 'actual_distance',
+    'distance_merged': 'timestamp',
+    'sigma': 'timestamp',
+}
+
+UWB_LABEL = 'UWB Distance'
+GPS_LABEL = 'GPS Actual Distance'
+
+def window_rows(df, column, window):
+    """Rows of df with column inside the (low, high) window, all of them without one"""
+    if window is None:
+        return df
+    values = df[column].to_numpy()
+    return df[(values >= window[0]) & (values <= window[1])]
+
+def selection_window(name, event):
+    """
+    The window brushed on a chart, in the units of its zoom column (ns for timestamps),
+    or None when nothing is brushed.
+
+    Args:
+        name (str): Plot name, a key of CHART_ZOOM_COLUMNS.
+        event: Selection state returned by st.altair_chart with on_select.
+    """
+    column = CHART_ZOOM_COLUMNS.get(name)
+    if column is None or not event:
+        return None
+    brushed = event['selection'].get(ZOOM_SELECTION) or {}
+    values = brushed.get('time' if column == 'timestamp' else column)
+    if not values:
+        return None
+    low, high = min(values), max(values)
+    if column == 'timestamp':
+        # Temporal brushes come back as epoch ms, or as date strings
+        return tuple(pd.Timestamp(value).value if isinstance(value, str) else int(value * TIME_UNIT_NS)
+                     for value in (low, high))
+    return (float(low), float(high))
+
+def _epoch_ms(timestamps):
+    """ns timestamps as epoch ms, which Vega-Lite reads as times"""
+    return np.asarray(timestamps, dtype=np.int64) // TIME_UNIT_NS
+
+def _round(values, decimals):
+    """Values as float64 rounded for the payload, float32 values serialize with noise digits"""
+    return np.round(np.asarray(values, dtype=np.float64), decimals)
+
+def _titled(chart, title, ros_bag_file):
+    """The chart with the plot's title and run subtitle"""
+    return chart.properties(title=alt.TitleParams(title, subtitle=f'Run: {ros_bag_file}'), height=CHART_HEIGHT)
+
+def _zoom():
+    """Interval selection along x, brushed to zoom into a window"""
+    return alt.selection_interval(name=ZOOM_SELECTION, encodings=['x'])
+
+def _time_axis():
+    return alt.X('time:T', title='Timestamp')
+
+def _velocity_color():
+    return alt.Color('radial_velocity:Q', scale=alt.Scale(scheme='viridis'), title='Radial Velocity (m/s)')
+
+def _series_frame(df, column, label, max_points):
+    """One decimated distance series, in long form for a chart of several series"""
+    df = decimate_series(df, 'timestamp', column, max_points)
+    return pd.DataFrame({'time': _epoch_ms(df['timestamp']), 'value': _round(df[column], DISTANCE_DECIMALS),
+                         'series': label})
+
+def _uwb_gps_chart(uwb_df, gps_df, title, ros_bag_file):
+    """UWB and GPS distance series over time, blue and red as in the plots"""
+    chart = alt.Chart(pd.concat([uwb_df, gps_df], ignore_index=True)).mark_circle(size=12, opacity=0.6).encode(
+        x=_time_axis(),
+        y=alt.Y('value:Q', title='Distance (m)'),
+        color=alt.Color('series:N', scale=alt.Scale(domain=[UWB_LABEL, GPS_LABEL], range=['blue', 'red']), title=None),
+    ).add_params(_zoom())
+    return _titled(chart, title, ros_bag_file)
+
+
+## DESCRIBE THE UWB ERROR in Interactive Charts ##
+
+def error_time_chart(merged_df, ros_bag_file, window=None, max_points=INTERACTIVE_POINT_BUDGET):
+    """UWB error over time colored by radial velocity, like plot_uwb_error_over_time"""
+    merged_df = decimate_series(window_rows(merged_df, 'timestamp', window), 'timestamp', 'beacon_error', max_points)
+    data = pd.DataFrame({
+        'time': _epoch_ms(merged_df['timestamp']),
+        'beacon_error': _round(merged_df['beacon_error'], DISTANCE_DECIMALS),
+        'radial_velocity': _round(merged_df['radial_velocity'], VALUE_DECIMALS),
+    })
+    chart = alt.Chart(data).mark_circle(size=12, opacity=0.8).encode(
+        x=_time_axis(),
+        y=alt.Y('beacon_error:Q', title='UWB Error (meters)'),
+        color=_velocity_color(),
+    ).add_params(_zoom())
+    return _titled(chart, 'UWB Error Over Time Colored by Radial Velocity', ros_bag_file)
+
+def error_distance_chart(merged_df, ros_bag_file, window=None, max_points=INTERACTIVE_POINT_BUDGET):
+    """
+    UWB error by actual distance colored by radial velocity, like
+    plot_uwb_error_over_actual_distance: a scatter up to max_points, a grid of
+    INTERACTIVE_DENSITY_BINS cells with the mean radial velocity above it.
+    """
+    merged_df = window_rows(merged_df, 'actual_distance', window)
+    x = alt.X('actual_distance:Q', title='Actual Distance (meters) - GPS measured to Beacon')
+    y = alt.Y('beacon_error:Q', title='UWB Error (meters)')
+    if len(merged_df) <= max_points:
+        data = pd.DataFrame({
+            'actual_distance': _round(merged_df['actual_distance'], DISTANCE_DECIMALS),
+            'beacon_error': _round(merged_df['beacon_error'], DISTANCE_DECIMALS),
+            'radial_velocity': _round(merged_df['radial_velocity'], VALUE_DECIMALS),
+        })
+        chart = alt.Chart(data).mark_circle(size=15).encode(x=x, y=y, color=_velocity_color())
+    else:
+        x_edges, y_edges, image = density_grid(merged_df['actual_distance'], merged_df['beacon_error'],
+                                               merged_df['radial_velocity'], INTERACTIVE_DENSITY_BINS)
+        rows, columns = np.nonzero(~np.ma.getmaskarray(image))
+        data = pd.DataFrame({
+            'actual_distance': _round(x_edges[columns], DISTANCE_DECIMALS),
+            'actual_distance_end': _round(x_edges[columns + 1], DISTANCE_DECIMALS),
+            'beacon_error': _round(y_edges[rows], DISTANCE_DECIMALS),
+            'beacon_error_end': _round(y_edges[rows + 1], DISTANCE_DECIMALS),
+            'radial_velocity': _round(image[rows, columns], VALUE_DECIMALS),
+        })
+        chart = alt.Chart(data).mark_rect().encode(
+            x=x, x2='actual_distance_end:Q', y=y, y2='beacon_error_end:Q', color=_velocity_color())
+    return _titled(chart.add_params(_zoom()), 'UWB Error vs Actual Distance to Beacon', ros_bag_file)
+
+def distance_chart(uwb_distance_df, aircraft_gps_df, ros_bag_file, window=None, max_points=INTERACTIVE_POINT_BUDGET):
+    """UWB distance and GPS actual distance over time, like plot_uwb_distance_vs_gps_actual_distance"""
+    uwb_df = _series_frame(window_rows(uwb_distance_df, 'timestamp', window), 'distance', UWB_LABEL, max_points // 2)
+    gps_df = _series_frame(window_rows(aircraft_gps_df, 'timestamp', window), 'actual_distance', GPS_LABEL,
+                           max_points // 2)
+    return _uwb_gps_chart(uwb_df, gps_df, 'UWB Distance vs GPS Measured Actual Distance', ros_bag_file)
+
+def distance_merged_chart(merged_df, ros_bag_file, window=None, max_points=INTERACTIVE_POINT_BUDGET):
+    """The distance chart from the merged data, like plot_uwb_distance_vs_gps_actual_distance_merged"""
+    merged_df = window_rows(merged_df, 'timestamp', window)
+    uwb_df = _series_frame(merged_df, 'distance', UWB_LABEL, max_points // 2)
+    gps_df = _series_frame(merged_df, 'actual_distance', GPS_LABEL, max_points // 2)
+    return _uwb_gps_chart(uwb_df, gps_df, 'UWB vs GPS Distance Over Time (Merged Data)', ros_bag_file)
+
+def sigma_chart(sigma_df, sigma_threshold, ros_bag_file, window=None, max_points=INTERACTIVE_POINT_BUDGET):
+    """Sigma over time with the threshold, like plot_sigma_time"""
+    sigma_df = decimate_series(window_rows(sigma_df, 'timestamp', window), 'timestamp', 'sigma', max_points)
+    data = pd.DataFrame({'time': _epoch_ms(sigma_df['timestamp']), 'sigma': _round(sigma_df['sigma'], VALUE_DECIMALS)})
+    points = alt.Chart(data).mark_circle(size=15, color='blue').encode(
+        x=_time_axis(), y=alt.Y('sigma:Q', title='Sigma')).add_params(_zoom())
+    threshold = alt.Chart(pd.DataFrame({'sigma': [sigma_threshold]})).mark_rule(color='red', strokeDash=[6, 4]).encode(
+        y='sigma:Q', tooltip=alt.Tooltip('sigma:Q', title='Sigma Threshold'))
+    return _titled(points + threshold, 'Sigma Over Time', ros_bag_file)
+
+def path_chart(gps_df, beacon_lat, beacon_lon, commanded_landing, ros_bag_file, max_points=INTERACTIVE_POINT_BUDGET):
+    """
+    Aircraft path with its start, end, the beacon and the UWB landing estimate, like
+    plot_aircraft_path. The path is strided down to max_points, it is a track rather
+    than a series over time; zoom and pan stay in the browser.
+    """
+    rows = np.unique(np.linspace(0, len(gps_df) - 1, min(len(gps_df), max_points)).astype(np.int64))
+    gps_df = gps_df.iloc[rows]
+    path = pd.DataFrame({
+        'order': np.arange(len(gps_df)),
+        'latitude': _round(gps_df['latitude'], COORDINATE_DECIMALS),
+        'longitude': _round(gps_df['longitude'], COORDINATE_DECIMALS),
+    })
+    markers = [
+        ('Start', path['latitude'].iloc[0], path['longitude'].iloc[0]),
+        ('End', path['latitude'].iloc[-1], path['longitude'].iloc[-1]),
+        ('Beacon', beacon_lat, beacon_lon),
+    ]
+    if commanded_landing:
+        markers.append(('UWB Landing Est.', commanded_landing['lat'], commanded_landing['lon']))
+    markers = pd.DataFrame(markers, columns=['marker', 'latitude', 'longitude'])
+
+    x = alt.X('longitude:Q', title='Longitude', scale=alt.Scale(zero=False))
+    y = alt.Y('latitude:Q', title='Latitude', scale=alt.Scale(zero=False))
+    line = alt.Chart(path).mark_line(color='blue', strokeWidth=1).encode(x=x, y=y, order='order:Q')
+    points = alt.Chart(markers).mark_point(size=150, filled=True).encode(
+        x=x, y=y,
+        color=alt.Color('marker:N', title=None, scale=alt.Scale(
+            domain=['Start', 'End', 'Beacon', 'UWB Landing Est.'], range=['green', 'red', 'orange', 'purple'])),
+        shape=alt.Shape('marker:N', title=None, scale=alt.Scale(
+            domain=['Start', 'End', 'Beacon', 'UWB Landing Est.'],
+            range=['triangle-up', 'triangle-down', 'diamond', 'cross'])),
+        tooltip=['marker:N', alt.Tooltip('latitude:Q', format='.7f'), alt.Tooltip('longitude:Q', format='.7f')],
+    )
+    return _titled((line + points).interactive(), 'Aircraft Flight Path', ros_bag_file)
+
+# Chart functions by plot name, each taking the data arguments of its plot function
+INTERACTIVE_CHARTS = {
+    'distance': distance_chart,
+    'error_time': error_time_chart,
+    'error_distance': error_distance_chart,
+    'distance_merged': distance_merged_chart,
+    'sigma': sigma_chart,
+    'path': path_chart,
+}
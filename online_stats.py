@@ -0,0 +1,171 @@
+import math
+import numpy as np
+import pandas as pd
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream of values, mergeable across chunks"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        """Add a chunk of values, ignoring NaN"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean)**2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        self.merge(chunk)
+
+    def merge(self, other):
+        """Combine with the statistics of another chunk (Chan et al. parallel Welford update)"""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """Sample variance, like pandas' var()"""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+
+class QuantileSketch:
+    """
+    Quantiles of a stream of values within a relative accuracy, mergeable across chunks.
+
+    Values are counted in logarithmic buckets (as in DDSketch), so memory depends on the
+    range of the values, not on how many there are.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value  # magnitudes below this count as zero
+        self.count = 0
+        self.zero_count = 0
+        self.positive = {}
+        self.negative = {}
+
+    def _add(self, store, magnitudes):
+        buckets, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            store[bucket] = store.get(bucket, 0) + count
+
+    def update(self, values):
+        """Add a chunk of values, ignoring NaN and infinities"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        self.count += len(values)
+        self.zero_count += int((np.abs(values) < self.min_value).sum())
+        self._add(self.positive, values[values >= self.min_value])
+        self._add(self.negative, -values[values <= -self.min_value])
+
+    def merge(self, other):
+        """Combine with a sketch of another chunk with the same relative accuracy"""
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged.")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for bucket, count in other_store.items():
+                store[bucket] = store.get(bucket, 0) + count
+
+    def quantile(self, q):
+        """Value at quantile q (0 to 1), NaN for an empty sketch"""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        # Most negative values first, i.e. the largest negative buckets
+        for bucket in sorted(self.negative, reverse=True):
+            seen += self.negative[bucket]
+            if seen > rank:
+                return -self._bucket_value(bucket)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self.positive):
+            seen += self.positive[bucket]
+            if seen > rank:
+                return self._bucket_value(bucket)
+        return self._bucket_value(max(self.positive)) if self.positive else 0.0
+
+    def histogram(self):
+        """The representative value of every non-empty bucket and its count, within the relative accuracy"""
+        buckets = [(-self._bucket_value(bucket), count) for bucket, count in self.negative.items()]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend((self._bucket_value(bucket), count) for bucket, count in self.positive.items())
+        values, counts = zip(*buckets) if buckets else ((), ())
+        return np.array(values, dtype=np.float64), np.array(counts, dtype=np.int64)
+
+    def _bucket_value(self, bucket):
+        return 2 * self.gamma**bucket / (self.gamma + 1)
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most size rows of a stream of dataframes, mergeable across chunks.
+
+    Every row gets a random key and the rows with the smallest keys are kept, so the
+    sample does not depend on how the stream was split into chunks.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._frame = None
+        self._keys = np.empty(0)
+
+    def update(self, df):
+        """Add a chunk of rows"""
+        if len(df) == 0:
+            return
+        self.seen += len(df)
+        self._keep(pd.concat([self._frame, df], ignore_index=True) if self._frame is not None else df.reset_index(drop=True),
+                   np.concatenate([self._keys, self._rng.random(len(df))]))
+
+    def merge(self, other):
+        """Combine with the sample of another chunk"""
+        if other._frame is None:
+            return
+        self.seen += other.seen
+        frame = other._frame if self._frame is None else pd.concat([self._frame, other._frame], ignore_index=True)
+        self._keep(frame, np.concatenate([self._keys, other._keys]))
+
+    def _keep(self, frame, keys):
+        if len(keys) > self.size:
+            kept = np.sort(np.argpartition(keys, self.size)[:self.size])
+            frame = frame.iloc[kept].reset_index(drop=True)
+            keys = keys[kept]
+        self._frame = frame
+        self._keys = keys
+
+    def to_frame(self, sort_by='timestamp'):
+        """The sampled rows, in time order"""
+        if self._frame is None:
+            return pd.DataFrame()
+        if sort_by in self._frame.columns:
+            return self._frame.sort_values(sort_by, kind='stable').reset_index(drop=True)
+        return self._frame
@@ -1,114 +1,80 @@
 import streamlit as st
 import os
-import pandas as pd
 import numpy as np
-import math
 import tempfile
+import threading
+from functools import partial
 from pathlib import Path
-from geographiclib.geodesic import Geodesic
-from pyproj import Proj, transform
-from BagToCsv import RosbagParser
 from plot_utilities import (
     plot_uwb_error_over_time,
     plot_uwb_error_over_actual_distance,
     plot_uwb_distance_vs_gps_actual_distance_merged,
     plot_uwb_distance_vs_gps_actual_distance,
     plot_aircraft_path,
-    plot_sigma_time
+    plot_sigma_time,
+    PLOT_POINT_BUDGET,
+    PLOT_CAPTIONS
 )
+from plot_cache import render_cached_plots, plot_cache_key
+from interactive_charts import INTERACTIVE_CHARTS, CHART_ZOOM_COLUMNS, selection_window
 from database_utils import save_flight_data
+from flight_analysis import ERROR_BINNINGS
+from flight_processing import process_bag_data
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_los_vector(aircraft_lat, aircraft_lon, aircraft_alt, beacon_lat, beacon_lon, beacon_alt):
-    R = 6371000
-    dlat = np.radians(beacon_lat - aircraft_lat) * R
-    dlon = np.radians(beacon_lon - aircraft_lon) * R * np.cos(np.radians(aircraft_lat))
-    dalt = beacon_alt - aircraft_alt
-    los_vector = np.array([dlat, dlon, dalt])
-    return los_vector / np.linalg.norm(los_vector)
-
-def calculate_radial_velocity(row, beacon_lat, beacon_lon, beacon_alt):
-    los_unit = calculate_los_vector(row['latitude'], row['longitude'], row['altitude'], 
-                                   beacon_lat, beacon_lon, beacon_alt)
-    velocity = np.array([row['twist.linear.x'], row['twist.linear.y'], row['twist.linear.z']])
-    return np.dot(velocity, los_unit)
-
-def process_bag_data(bag_path, csv_output_dir, beacon_lat, beacon_lon, beacon_alt):
-    parser = RosbagParser(bag_file_path=bag_path, output_dir=csv_output_dir)
-    parser.export_to_csv()
-    
-    bag_name = Path(bag_path).stem
-    
-    uwb_file = os.path.join(csv_output_dir, f'{bag_name}_uwb_distance.csv')
-    gps_file = os.path.join(csv_output_dir, f'{bag_name}_mavros_global_position_global.csv')
-    vel_file = os.path.join(csv_output_dir, f'{bag_name}_mavros_local_position_velocity_local.csv')
-    state_file = os.path.join(csv_output_dir, f'{bag_name}_uwb_state.csv')
-    lz_file = os.path.join(csv_output_dir, f'{bag_name}_uwb_lz_nav.csv')
-
-    if not all(os.path.exists(f) for f in [uwb_file, gps_file, vel_file]):
-        st.error("Required CSV files not found.")
-        return None, None, None
-    
-    uwb_df = pd.read_csv(uwb_file)[['timestamp', 'distance']]
-    gps_df = pd.read_csv(gps_file)[['timestamp', 'latitude', 'longitude', 'altitude']]
-    vel_df = pd.read_csv(vel_file)[['timestamp', 'twist.linear.x', 'twist.linear.y', 'twist.linear.z']]
-    uwb_state_df = pd.read_csv(state_file)
-
-    # Load UWB LZ message data if available
-    uwb_lz_df = None
-    if os.path.exists(lz_file):
-        uwb_lz_df = pd.read_csv(lz_file)
-        # latitude and longitude
-        if 'latitude' in uwb_lz_df.columns and 'longitude' in uwb_lz_df.columns:
-            uwb_lz_df = uwb_lz_df[['timestamp', 'latitude', 'longitude']]
-    
-    # Convert UWB state NED coordinates to GPS coordinates
-    commanded_landing = None
-    if uwb_lz_df is not None and not uwb_lz_df.empty:
-        # Get the last row in the data frame
-        landing_lat = uwb_lz_df['latitude'].iloc[-1]
-        landing_lon = uwb_lz_df['longitude'].iloc[-1]
-        
-        # Calculate distance from beacon to commanded landing point
-        landing_distance = haversine(beacon_lat, beacon_lon, landing_lat, landing_lon)
-        
-        commanded_landing = {
-            'lat': landing_lat,
-            'lon': landing_lon,
-            'distance_from_beacon': landing_distance
-        }
-    
-    merged_df = pd.merge_asof(uwb_df.sort_values('timestamp'),
-                              gps_df.sort_values('timestamp'),
-                              on='timestamp', direction='nearest')
-    
-    merged_df = pd.merge_asof(merged_df.sort_values('timestamp'),
-                              vel_df.sort_values('timestamp'),
-                              on='timestamp', direction='nearest')
-    
-    merged_df['actual_distance'] = merged_df.apply(
-        lambda row: haversine(row['latitude'], row['longitude'], beacon_lat, beacon_lon), axis=1
-    )
-    merged_df['beacon_error'] = merged_df['distance'] - merged_df['actual_distance']
-    
-    merged_df['radial_velocity'] = merged_df.apply(
-        lambda row: calculate_radial_velocity(row, beacon_lat, beacon_lon, beacon_alt), axis=1
-    )
-    
-    gps_df['actual_distance'] = gps_df.apply(
-        lambda row: haversine(row['latitude'], row['longitude'], beacon_lat, beacon_lon), axis=1
-    )
-    
-    return merged_df, uwb_df, gps_df, uwb_state_df, commanded_landing
+# Tab titles of the error binnings
+BINNING_LABELS = {
+    'actual_distance': 'Range',
+    'radial_velocity': 'Radial Velocity',
+    'altitude': 'Altitude',
+}
+
+def place_plot(name, plot_jobs, chart_args, plot_slots):
+    """Draw a plot as an interactive chart in place, or lay out the slot its image is shown in"""
+    if interactive:
+        show_interactive_chart(name, chart_args[name], plot_jobs[name])
+    else:
+        plot_slots[name] = st.empty()
+
+def cache_plots(plot_jobs):
+    """Render plots into the plot cache without showing them, so they show in the flight history"""
+    try:
+        for _ in render_cached_plots(plot_jobs):
+            pass
+    except Exception as e:
+        print(f"Error rendering plots into the cache: {e}")
+
+def zoom_chart(name):
+    """Keep the window brushed on a chart, it is redrawn from the data inside the window"""
+    window = selection_window(name, st.session_state[f"chart_{name}"])
+    if window is not None:
+        st.session_state[f"chart_window_{name}"] = window
+
+@st.fragment
+def show_interactive_chart(name, chart_args, plot_job):
+    """
+    Draw a plot as an interactive chart. Brushing a window on it redraws it from the
+    data inside the window at full resolution, rerunning only this fragment. The PNG of
+    the whole plot is exported from the plot cache, rendered into it if it is not there
+    yet.
+    """
+    chart_function = INTERACTIVE_CHARTS[name]
+    window_key = f"chart_window_{name}"
+    window = st.session_state.get(window_key)
+    if name in CHART_ZOOM_COLUMNS:
+        st.altair_chart(chart_function(*chart_args, window=window), width="stretch", key=f"chart_{name}",
+                        on_select=partial(zoom_chart, name))
+    else:
+        st.altair_chart(chart_function(*chart_args), width="stretch")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if window is not None:
+            st.button("Reset zoom", key=f"reset_{name}", on_click=st.session_state.pop, args=(window_key, None))
+    with col2:
+        st.download_button(
+            "Export PNG", data=lambda: Path(next(render_cached_plots({name: plot_job}))[2]).read_bytes(),
+            file_name=f"{name}.png", mime="image/png", on_click="ignore", key=f"export_{name}"
+        )
 
 # Page content
 st.title("Current Flight Analysis")
@@ -123,6 +89,43 @@ beacon_alt = st.sidebar.number_input("Beacon Altitude (m)", value=325.281693, fo
 st.sidebar.header("Localizer Configuration")
 sigma_threshold = st.sidebar.number_input("Sigma Threshold", value=2.0, format="%.1f")
 
+st.sidebar.header("Clock Offset")
+estimate_offset = st.sidebar.checkbox(
+    "Estimate UWB clock offset", value=True,
+    help="Line up the UWB and MAVROS timestamps by cross-correlating UWB ranges with GPS distances"
+)
+time_offset = 'auto' if estimate_offset else st.sidebar.number_input(
+    "UWB clock offset (s)", value=0.0, format="%.3f", help="Seconds added to the UWB timestamps"
+)
+
+st.sidebar.header("Analyze Window")
+window_minutes = st.sidebar.number_input(
+    "Analyze last N minutes (0 = entire flight)", min_value=0.0, value=0.0, step=1.0, format="%.1f",
+    help="Only the end of the bag is read, e.g. the final approach and landing"
+)
+
+st.sidebar.header("Output")
+save_topics = st.sidebar.checkbox("Save extracted topics to disk (Parquet)", value=False)
+
+st.sidebar.header("Plots")
+plot_points = st.sidebar.number_input(
+    "Points per plot", min_value=1000, value=PLOT_POINT_BUDGET, step=5000,
+    help="Larger series are decimated with LTTB and larger scatters drawn as density images"
+)
+interactive = st.sidebar.checkbox(
+    "Interactive charts", value=True,
+    help="Draw plots in the browser from decimated data and brush a window to zoom into it, "
+         "PNGs are rendered in the background for export and the flight history. "
+         "Otherwise every plot is rendered as an image."
+)
+
+st.sidebar.header("Large Bags")
+streaming = st.sidebar.checkbox(
+    "Streaming analysis", value=False,
+    help="Analyze the bag in time chunks with bounded memory. Metrics cover every reading, "
+         "plots and the data preview show a random sample."
+)
+
 uploaded_files = st.file_uploader(
     "Upload ROS2 bag folder contents (.yaml and .mcap file)",
     accept_multiple_files=True,
@@ -149,19 +152,25 @@ if uploaded_files:
                 f.write(uploaded_file.getbuffer())
         
         if st.button("Process Bag Data"):
+            # Zoom windows and brushes belong to the previous flight's charts
+            for key in [key for key in st.session_state if key.startswith("chart_")]:
+                del st.session_state[key]
             with st.spinner("Processing ROS2 bag data..."):
                 try:
-                    merged_df, uwb_df, gps_df, uwb_state_df, commanded_landing = process_bag_data(
-                        bag_dir, csv_dir, beacon_lat, beacon_lon, beacon_alt
+                    analysis, commanded_landing = process_bag_data(
+                        bag_dir, csv_dir, beacon_lat, beacon_lon, beacon_alt, save_topics,
+                        window_minutes * 60 if window_minutes > 0 else None, sigma_threshold, streaming,
+                        time_offset
                     )
                     
-                    if merged_df is not None:
+                    if analysis is not None:
                         st.success("Data processed successfully!")
                         
                         # Calculate metrics
-                        mean_error = merged_df['beacon_error'].mean()
-                        std_error = merged_df['beacon_error'].std()
-                        total_points = len(merged_df)
+                        error_summary = analysis.error_summary()
+                        mean_error = error_summary['mean']
+                        std_error = error_summary['std']
+                        total_points = error_summary['count']
                         
                         col1, col2, col3 = st.columns(3)
                         with col1:
@@ -171,6 +180,27 @@ if uploaded_files:
                         with col3:
                             st.metric("Std UWB Error (m)", f"{std_error:.3f}")
                         
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Min UWB Error (m)", f"{error_summary['min']:.3f}")
+                        with col2:
+                            st.metric("Median UWB Error (m)", f"{analysis.error_quantile(0.5):.3f}")
+                        with col3:
+                            st.metric("Max UWB Error (m)", f"{error_summary['max']:.3f}")
+                        
+                        # Robust metrics, insensitive to multipath spikes
+                        robust_metrics = analysis.robust_summary()
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Trimmed Mean UWB Error (m)", f"{robust_metrics['trimmed_mean_error']:.3f}")
+                        with col2:
+                            st.metric("MAD UWB Error (m)", f"{robust_metrics['mad_error']:.3f}")
+                        with col3:
+                            st.metric("Outliers (Hampel)", robust_metrics['outlier_count'])
+                        
+                        st.metric("UWB Clock Offset (s)", f"{analysis.uwb_time_offset():+.3f}",
+                                  help="Seconds added to the UWB timestamps before aligning them with GPS")
+                        
                         # Display commanded landing location if available
                         if commanded_landing:
                             st.subheader("UWB Estimated Landing Location - FIX")
@@ -182,59 +212,115 @@ if uploaded_files:
                             with col3:
                                 st.write(f"Distance from Beacon: {commanded_landing['distance_from_beacon']:.2f} m")
                         
-                        # Generate plots
-                        st.subheader("UWB Error Plots")
-                        
-                        plot_uwb_distance_vs_gps_actual_distance(uwb_df, gps_df, bag_name, plot_dir)
-                        plot1_path = os.path.join(plot_dir, 'uwb_distance_vs_gps_actual_distance.png')
-                        if os.path.exists(plot1_path):
-                            st.image(plot1_path, caption="UWB Distance vs GPS Actual Distance")
+                        # Beacon position fitted to the UWB ranges, to check the entered one
+                        st.subheader("Beacon Position Estimate")
+                        try:
+                            beacon_fit = analysis.solve_beacon()
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                st.write(f"Latitude: {beacon_fit['latitude']:.7f}")
+                                st.write(f"Horizontal Shift: {beacon_fit['horizontal_shift']:.2f} m")
+                            with col2:
+                                st.write(f"Longitude: {beacon_fit['longitude']:.7f}")
+                                st.write(f"Vertical Shift: {beacon_fit['vertical_shift']:+.2f} m")
+                            with col3:
+                                st.write(f"Altitude: {beacon_fit['altitude']:.3f} m")
+                                st.write(f"UWB Range Bias: {beacon_fit['bias'][0]:+.3f} m")
+                            st.caption(f"Residual RMS {beacon_fit['rms']:.3f} m over {beacon_fit['readings']} readings, "
+                                       f"position std (E, N, U) "
+                                       f"{', '.join(f'{std:.2f}' for std in beacon_fit['position_std'])} m")
+                        except (ValueError, np.linalg.LinAlgError) as e:
+                            st.warning(f"Could not estimate the beacon position: {e}")
                         
-                        plot_uwb_error_over_time(merged_df, bag_name, plot_dir)
-                        plot2_path = os.path.join(plot_dir, 'uwb_error_vs_time_colored_velocity.png')
-                        if os.path.exists(plot2_path):
-                            st.image(plot2_path, caption="UWB Error Over Time")
+                        # Lay out a slot for every plot, then serve them from the plot cache or
+                        # render them in parallel, showing each one as soon as it is ready. Interactive
+                        # charts are drawn in place instead, from the same data as the plot.
+                        plot_jobs = {}
+                        chart_args = {}
+                        plot_slots = {}
+                        st.subheader("UWB Error Plots")
                         
-                        plot_uwb_error_over_actual_distance(merged_df, bag_name, plot_dir)
-                        plot3_path = os.path.join(plot_dir, 'uwb_error_vs_actual_distance.png')
-                        if os.path.exists(plot3_path):
-                            st.image(plot3_path, caption="UWB Error vs Actual Distance")
+                        chart_args['distance'] = (analysis.frame('uwb', ['timestamp', 'distance']),
+                                                  analysis.frame('gps', ['timestamp', 'actual_distance']), bag_name)
+                        plot_jobs['distance'] = (plot_uwb_distance_vs_gps_actual_distance, (
+                            *chart_args['distance'], plot_dir, plot_points))
+                        chart_args['error_time'] = (analysis.frame('merged', ['timestamp', 'beacon_error', 'radial_velocity']),
+                                                    bag_name)
+                        plot_jobs['error_time'] = (plot_uwb_error_over_time, (*chart_args['error_time'], plot_dir, plot_points))
+                        chart_args['error_distance'] = (
+                            analysis.frame('merged', ['actual_distance', 'beacon_error', 'radial_velocity']), bag_name)
+                        plot_jobs['error_distance'] = (plot_uwb_error_over_actual_distance, (
+                            *chart_args['error_distance'], plot_dir, plot_points))
+                        chart_args['distance_merged'] = (analysis.frame('merged', ['timestamp', 'distance', 'actual_distance']),
+                                                         bag_name)
+                        plot_jobs['distance_merged'] = (plot_uwb_distance_vs_gps_actual_distance_merged, (
+                            *chart_args['distance_merged'], plot_dir, plot_points))
+                        for name in plot_jobs:
+                            place_plot(name, plot_jobs, chart_args, plot_slots)
                         
-                        plot_uwb_distance_vs_gps_actual_distance_merged(merged_df, bag_name, plot_dir)
-                        plot4_path = os.path.join(plot_dir, 'uwb_distance_vs_gps_actual_distance_merged.png')
-                        if os.path.exists(plot4_path):
-                            st.image(plot4_path, caption="UWB vs GPS Distance Over Time")
+                        # Error statistics binned by range, radial velocity and altitude
+                        st.subheader("UWB Error by Range, Radial Velocity and Altitude")
+                        tabs = st.tabs([" vs ".join(BINNING_LABELS[axis] for axis in axes) for axes in ERROR_BINNINGS])
+                        for tab, axes in zip(tabs, ERROR_BINNINGS):
+                            with tab:
+                                bins_df = analysis.error_bins(*axes)
+                                if len(axes) == 2:
+                                    st.caption("Mean UWB error (m) per bin")
+                                    st.dataframe(bins_df.pivot(index=f'{axes[0]}_min', columns=f'{axes[1]}_min',
+                                                               values='mean'))
+                                else:
+                                    st.dataframe(bins_df, hide_index=True)
                         
                         # Plot sigma over time
-                        st.subheader("Sigma Over Time, values less than 50")
-                        sigma_df = uwb_state_df[uwb_state_df['sigma'] < 50]
-                        plot_sigma_time(sigma_df,sigma_threshold, bag_name, plot_dir)
-                        plot6_path = os.path.join(plot_dir, 'sigma_over_time.png')
-                        if os.path.exists(plot6_path):
-                            st.image(plot6_path, caption="Sigma Over Time")
+                        if analysis.has_table('uwb_state'):
+                            st.subheader(f"Sigma Over Time, values less than {analysis.max_plot_sigma}")
+                            sigma_df = analysis.frame('uwb_state', ['timestamp', 'sigma'], where='sigma_plotted')
+                            chart_args['sigma'] = (sigma_df, sigma_threshold, bag_name)
+                            plot_jobs['sigma'] = (plot_sigma_time, (*chart_args['sigma'], plot_dir, plot_points))
+                            place_plot('sigma', plot_jobs, chart_args, plot_slots)
 
                         # Plot aircraft path
                         st.subheader("Aircraft Flight Path")
-                        plot_aircraft_path(gps_df, beacon_lat, beacon_lon, commanded_landing, bag_name, plot_dir)
-                        plot5_path = os.path.join(plot_dir, 'aircraft_flight_path.png')
-                        if os.path.exists(plot5_path):
-                            st.image(plot5_path, caption="Aircraft Flight Path")
+                        chart_args['path'] = (analysis.frame('gps', ['latitude', 'longitude']), beacon_lat, beacon_lon,
+                                              commanded_landing, bag_name)
+                        plot_jobs['path'] = (plot_aircraft_path, (*chart_args['path'], plot_dir))
+                        place_plot('path', plot_jobs, chart_args, plot_slots)
+                        
+                        plot_keys = {}
+                        if interactive:
+                            # The PNGs are rendered into the cache in the background, the history page
+                            # shows them by these keys
+                            plot_keys = {name: plot_cache_key(*plot_job) for name, plot_job in plot_jobs.items()}
+                            threading.Thread(target=cache_plots, args=(plot_jobs,), daemon=True).start()
+                        else:
+                            for name in plot_slots:
+                                plot_slots[name].info(f"Rendering {PLOT_CAPTIONS[name]}...")
+                            for name, plot_key, plot_path in render_cached_plots(plot_jobs):
+                                plot_slots[name].image(plot_path, caption=PLOT_CAPTIONS[name])
+                                plot_keys[name] = plot_key
                         
                         # Save to database
                         save_flight_data(bag_name, mean_error, std_error, total_points, 
                                        beacon_lat, beacon_lon, beacon_alt, plot_dir, 
-                                       bag_dir, csv_dir)
+                                       bag_dir, csv_dir if save_topics else None, robust_metrics, plot_keys)
                         
+                        merged_df = analysis.frame('merged')
                         st.subheader("Data Preview")
                         st.dataframe(merged_df.head(100))
                         
+                        if not streaming:
+                            with st.expander("Memory Usage"):
+                                st.dataframe(analysis.memory_report())
+                        
                         csv_data = merged_df.to_csv(index=False)
                         st.download_button(
-                            label="Download UWB Merged Data (CSV)",
+                            label="Download UWB Merged Data Sample (CSV)" if streaming else "Download UWB Merged Data (CSV)",
                             data=csv_data,
                             file_name="processed_uwb_data.csv",
                             mime="text/csv"
                         )
+                    else:
+                        st.error("Required topics not found.")
                         
                 except Exception as e:
                     st.error(f"Error processing data: {str(e)}")
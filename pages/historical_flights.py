@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 import os
 from database_utils import get_all_flights, get_flight_data
+from plot_cache import cached_plot_path
+from plot_utilities import PLOT_CAPTIONS
 
 st.title("Historical Flight Data")
 st.markdown("View and analyze previous flight results")
@@ -32,6 +34,18 @@ if flights:
             with col4:
                 st.metric("Date", flight_data['date'])
             
+            # Robust metrics, missing for flights processed before they were added
+            if flight_data['median_error'] is not None:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Median UWB Error (m)", f"{flight_data['median_error']:.3f}")
+                with col2:
+                    st.metric("Trimmed Mean UWB Error (m)", f"{flight_data['trimmed_mean_error']:.3f}")
+                with col3:
+                    st.metric("MAD UWB Error (m)", f"{flight_data['mad_error']:.3f}")
+                with col4:
+                    st.metric("Outliers (Hampel)", flight_data['outlier_count'])
+            
             # Display beacon configuration
             st.subheader("Beacon Configuration")
             col1, col2, col3 = st.columns(3)
@@ -44,9 +58,20 @@ if flights:
             
             # Display plots
             st.subheader("Flight Analysis Plots")
+            if flight_data['plot_keys']:
+                # Plots of the exact data and settings the flight was processed with
+                for name, plot_key in flight_data['plot_keys'].items():
+                    plot_path = cached_plot_path(plot_key)
+                    if plot_path is not None:
+                        st.image(plot_path, caption=PLOT_CAPTIONS[name])
+                    else:
+                        st.warning(f"Plot not in the cache: {PLOT_CAPTIONS[name]}. It is still being rendered, or "
+                                   f"was evicted. Process the flight again to render it.")
+            
+            # Flights processed before the plot cache have their plots in the plot folder
             plot_dir = flight_data['plot_path']
             
-            plot_files = [
+            plot_files = [] if flight_data['plot_keys'] else [
                 ('uwb_distance_vs_gps_actual_distance.png', 'UWB Distance vs GPS Actual Distance'),
                 ('uwb_error_vs_time_colored_velocity.png', 'UWB Error Over Time'),
                 ('uwb_error_vs_actual_distance.png', 'UWB Error vs Actual Distance'),
@@ -62,8 +87,9 @@ if flights:
     
     # Summary statistics
     st.subheader("Flight Summary Statistics")
-    df = pd.DataFrame(flights, columns=['ID', 'Flight Name', 'Mean Error', 'Std Error', 'Total Points', 'Date', 'Beacon Lat', 'Beacon Lon', 'Beacon Alt', 'Plot Path', 'Bag Path', 'CSV Path'])
-    st.dataframe(df[['Flight Name', 'Mean Error', 'Std Error', 'Total Points', 'Date']])
+    df = pd.DataFrame(flights, columns=['ID', 'Flight Name', 'Mean Error', 'Std Error', 'Total Points', 'Date', 'Beacon Lat', 'Beacon Lon', 'Beacon Alt', 'Plot Path', 'Bag Path', 'CSV Path',
+                                        'Median Error', 'MAD Error', 'Trimmed Mean Error', 'P05 Error', 'P95 Error', 'Outlier Count', 'Plot Keys'])
+    st.dataframe(df[['Flight Name', 'Mean Error', 'Std Error', 'Median Error', 'MAD Error', 'Trimmed Mean Error', 'Total Points', 'Date']])
     
 else:
     st.info("No historical flight data found. Process some flights first!")
\ No newline at end of file
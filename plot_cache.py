@@ -0,0 +1,109 @@
+import os
+import json
+import inspect
+import hashlib
+import tempfile
+import pandas as pd
+from plot_utilities import PLOT_RENDERER_VERSION, PLOT_WORKERS, render_plots
+
+PLOT_CACHE_DIR = os.path.join("plots", "cache")
+PLOT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+PLOT_EXTENSION = ".png"
+
+def _value_hash(digest, value):
+    """Add a plot argument to the digest, DataFrames by their column names, dtypes and values"""
+    if isinstance(value, pd.DataFrame):
+        digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in value.dtypes.items()]).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=repr).encode('utf-8'))
+
+def _bind(function, args):
+    """The arguments of a plot function by name, with its defaults filled in"""
+    bound = inspect.signature(function).bind(*args)
+    bound.apply_defaults()
+    return bound
+
+def plot_cache_key(function, args):
+    """Hash of the plot function, renderer version and every argument except the output folder"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{function.__module__}.{function.__qualname__}:{PLOT_RENDERER_VERSION}".encode('utf-8'))
+    for name, value in _bind(function, args).arguments.items():
+        if name != 'plot_output_dir':
+            digest.update(name.encode('utf-8'))
+            _value_hash(digest, value)
+    return digest.hexdigest()
+
+def cached_plot_path(key, cache_dir=PLOT_CACHE_DIR):
+    """Path of a cached plot, marked as recently used, or None if it is not cached"""
+    path = os.path.join(cache_dir, key + PLOT_EXTENSION)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return path
+
+def _render_to_cache(function, args, key, cache_dir):
+    """Render a plot into a temporary folder and move it into the cache under its key"""
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as temp_dir:
+        bound = _bind(function, args)
+        bound.arguments['plot_output_dir'] = temp_dir
+        rendered = function(*bound.args, **bound.kwargs)
+        path = os.path.join(cache_dir, key + PLOT_EXTENSION)
+        os.replace(rendered, path)
+    return path
+
+def render_cached_plots(jobs, cache_dir=PLOT_CACHE_DIR, max_bytes=PLOT_CACHE_MAX_BYTES, workers=PLOT_WORKERS):
+    """
+    Serve plots from the cache and render the missing ones in parallel with
+    plot_utilities.render_plots.
+
+    Args:
+        jobs (dict): Name to (plot function, arguments) of every plot. The plot_output_dir
+                     argument is ignored, plots are stored in the cache.
+        cache_dir (str, optional): Folder of the cached plots, named by their key.
+        max_bytes (int, optional): Size cap of the cache, least recently used plots are
+                                   evicted beyond it.
+        workers (int, optional): Worker processes for the plots that are not cached.
+
+    Yields:
+        tuple: (name, key, path) of each plot, cached ones first, the rest as they finish.
+    """
+    keys = {}
+    missing = {}
+    for name, (function, args) in jobs.items():
+        keys[name] = plot_cache_key(function, args)
+        path = cached_plot_path(keys[name], cache_dir)
+        if path is not None:
+            print(f"Plot cache hit: {path}")
+            yield name, keys[name], path
+        else:
+            missing[name] = (_render_to_cache, (function, args, keys[name], cache_dir))
+
+    for name, path in render_plots(missing, workers):
+        yield name, keys[name], path
+
+    if missing:
+        enforce_plot_cache_cap(cache_dir, max_bytes)
+
+def enforce_plot_cache_cap(cache_dir=PLOT_CACHE_DIR, max_bytes=PLOT_CACHE_MAX_BYTES):
+    """Evict the least recently used plots until the cache fits in max_bytes"""
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(PLOT_EXTENSION) and os.path.isfile(path):
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        print(f"Evicted cached plot: {path}")
@@ -1,107 +1,265 @@
 # This is a library to create plots for ultrawideband data from csv files
 # The inputs to the function are the data frame and the ros bag file name, for labeling.
 # Some functions require a merged data frame and some require the individual data frames.
+# Every function draws on its own Figure with the Agg canvas, without pyplot's global
+# state, so plots can be rendered in parallel with render_plots.
 
 import os
-import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+FIGURE_SIZE = (12, 8)
+PLOT_DPI = 300
+
+# Part of the plot cache keys, bump it when a change to this file changes the images
+PLOT_RENDERER_VERSION = '2'
+
+# Processes rendering plots at a time, see render_plots
+PLOT_WORKERS = min(os.cpu_count() or 1, 6)
+
+# Above this many points a series is decimated with LTTB and a scatter is drawn as a
+# density image, so render time does not grow with the length of the flight
+PLOT_POINT_BUDGET = 20000
+
+# Captions of the plots, by the names the pages and the plot cache know them by
+PLOT_CAPTIONS = {
+    'distance': "UWB Distance vs GPS Actual Distance",
+    'error_time': "UWB Error Over Time",
+    'error_distance': "UWB Error vs Actual Distance",
+    'distance_merged': "UWB vs GPS Distance Over Time",
+    'sigma': "Sigma Over Time",
+    'path': "Aircraft Flight Path",
+}
+
+# Cells (x, y) of the density image drawn instead of a scatter above the point budget
+DENSITY_BINS = (400, 250)
+
+def _figure():
+    """A new figure with one axes, on its own Agg canvas"""
+    fig = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+def _save(fig, plot_output_dir, file_name):
+    """Save the figure to the plot output dir and return its path"""
+    path = os.path.join(plot_output_dir, file_name)
+    fig.savefig(path, dpi=PLOT_DPI)
+    return path
+
+def render_plots(jobs, workers=PLOT_WORKERS):
+    """
+    Render plots in parallel, yielding each one as soon as it is saved.
+
+    Args:
+        jobs (dict): Name to (plot function, arguments) of every plot.
+        workers (int, optional): Worker processes. With one, the plots are rendered in
+                                 this process, one after another.
+
+    Yields:
+        tuple: (name, path) of each plot, in the order they finish.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for name, (function, args) in jobs.items():
+            yield name, function(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = {executor.submit(function, *args): name for name, (function, args) in jobs.items()}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+## DECIMATION of large data sets ##
+
+def _first_in_buckets(values, bucket, starts, extreme):
+    """Index of the first sample of every bucket equal to the bucket's extreme (e.g. np.fmax) of values"""
+    best = extreme.reduceat(values, starts)
+    candidates = np.flatnonzero(values == best[bucket])
+    return candidates[np.concatenate([[True], np.diff(bucket[candidates]) > 0])]
+
+def lttb_indices(x, y, max_points):
+    """
+    Indices of at most max_points samples of a series that keep its visual shape,
+    by Largest-Triangle-Three-Buckets.
+
+    The first and last samples are kept, the rest are split into equal buckets and
+    each bucket keeps the sample forming the largest triangle with the mean of the
+    previous bucket and the mean of the next one. Using the previous mean instead of
+    the previously kept sample lets every bucket be chosen at once, vectorized.
+
+    With at least 5 points to keep, every bucket also keeps its lowest and highest
+    sample, in a third as many buckets, so spikes such as multipath errors are never
+    dropped. Below that, a bucket with two spikes keeps only one of them.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    count = len(x)
+    if count <= max_points or max_points < 3:
+        return np.arange(count)
+    x = x - x[0]
+    per_bucket = 3 if max_points >= 5 else 1
+
+    # Buckets of the inner samples and the points either side of each bucket: the
+    # first sample, the bucket means, then the last sample
+    edges = np.linspace(1, count - 1, (max_points - 2) // per_bucket + 1).astype(np.int64)
+    sizes = np.diff(edges)
+    starts = edges[:-1] - 1
+    inner_x, inner_y = x[1:-1], y[1:-1]
+    means_x = np.add.reduceat(inner_x, starts) / sizes
+    means_y = np.add.reduceat(inner_y, starts) / sizes
+    anchor_x = np.concatenate([[x[0]], means_x, [x[-1]]])
+    anchor_y = np.concatenate([[y[0]], means_y, [y[-1]]])
+
+    bucket = np.repeat(np.arange(len(sizes)), sizes)
+    ax, ay = anchor_x[bucket], anchor_y[bucket]
+    cx, cy = anchor_x[bucket + 2], anchor_y[bucket + 2]
+    area = np.abs((ax - cx) * (inner_y - ay) - (ax - inner_x) * (cy - ay))
+    area = np.nan_to_num(area, nan=-1.0)
+
+    chosen = [_first_in_buckets(area, bucket, starts, np.maximum)]
+    if per_bucket == 3:
+        chosen += [_first_in_buckets(inner_y, bucket, starts, np.fmin),
+                   _first_in_buckets(inner_y, bucket, starts, np.fmax)]
+    return np.unique(np.concatenate([[0], *(indices + 1 for indices in chosen), [count - 1]]))
+
+def decimate_series(df, x_column, y_column, max_points):
+    """The rows of a series to plot, decimated with LTTB above max_points"""
+    if len(df) <= max_points:
+        return df
+    return df.iloc[lttb_indices(df[x_column].to_numpy(), df[y_column].to_numpy(), max_points)]
+
+def density_grid(x, y, c=None, bins=DENSITY_BINS):
+    """
+    Points binned into a grid of bins (x, y) cells, with the mean of c in each cell, or
+    the number of points without c. Returns the x and y cell edges and a (y, x) masked
+    array of the cells, empty cells masked.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if c is not None:
+        c = np.asarray(c, dtype=np.float64)
+        keep &= np.isfinite(c)
+        c = c[keep]
+    x, y = x[keep], y[keep]
+    x_edges = np.linspace(x.min(), x.max(), bins[0] + 1)
+    y_edges = np.linspace(y.min(), y.max(), bins[1] + 1)
+    columns = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, bins[0] - 1)
+    rows = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, bins[1] - 1)
+    cells = rows * bins[0] + columns
+    size = bins[0] * bins[1]
+    counts = np.bincount(cells, minlength=size).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = counts if c is None else np.bincount(cells, weights=c, minlength=size) / counts
+    return x_edges, y_edges, np.ma.masked_where(counts == 0, values).reshape(bins[1], bins[0])
+
+def _density_image(ax, x, y, c=None, cmap='viridis'):
+    """
+    Draw points as an image of DENSITY_BINS cells instead of one marker each, colored
+    by the mean of c in each cell, or by the number of points without c. Returns the
+    image, for a colorbar.
+    """
+    x_edges, y_edges, image = density_grid(x, y, c)
+    return ax.pcolormesh(x_edges, y_edges, image, cmap=cmap, shading='flat')
 
 
 ## DESCRIBE THE UWB ERROR in Scatter Plots##
 
 # Show the UWB error over time, coloring with radial velocitty
-def plot_uwb_error_over_time(merged_df, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.scatter(merged_df['timestamp'], merged_df['beacon_error'], c=merged_df['radial_velocity'], cmap='viridis', s=8, alpha=0.8)
-    plt.xlabel('Timestamp')
-    plt.ylabel('UWB Error (meters)')
-    plt.colorbar(label='Radial Velocity (m/s)')
-    plt.suptitle('UWB Error Over Time Colored by Radial Velocity', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize=10)
-    plt.grid(True)
-    plt.savefig(os.path.join(plot_output_dir, 'uwb_error_vs_time_colored_velocity.png'), dpi=300)
-    plt.clf()
-    plt.close()
+def plot_uwb_error_over_time(merged_df, ros_bag_file, plot_output_dir, max_points=PLOT_POINT_BUDGET):
+    fig, ax = _figure()
+    merged_df = decimate_series(merged_df, 'timestamp', 'beacon_error', max_points)
+    points = ax.scatter(merged_df['timestamp'], merged_df['beacon_error'], c=merged_df['radial_velocity'], cmap='viridis', s=8, alpha=0.8)
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('UWB Error (meters)')
+    fig.colorbar(points, ax=ax, label='Radial Velocity (m/s)')
+    fig.suptitle('UWB Error Over Time Colored by Radial Velocity', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize=10)
+    ax.grid(True)
+    return _save(fig, plot_output_dir, 'uwb_error_vs_time_colored_velocity.png')
 
 # Create a scatter plot of the error by actual distance, coloring the scatter by radial velocity
-def plot_uwb_error_over_actual_distance(merged_df, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.scatter(merged_df['actual_distance'], merged_df['beacon_error'], c=merged_df['radial_velocity'], cmap='viridis', s=10)
-    plt.colorbar(label='Radial Velocity (m/s)')
-    plt.xlabel('Actual Distance (meters) - GPS measured to Beacon')
-    plt.ylabel('UWB Error (meters)')
+def plot_uwb_error_over_actual_distance(merged_df, ros_bag_file, plot_output_dir, max_points=PLOT_POINT_BUDGET):
+    fig, ax = _figure()
+    if len(merged_df) > max_points:
+        # Mean radial velocity per cell, the markers would only overplot each other
+        points = _density_image(ax, merged_df['actual_distance'], merged_df['beacon_error'], merged_df['radial_velocity'])
+    else:
+        points = ax.scatter(merged_df['actual_distance'], merged_df['beacon_error'], c=merged_df['radial_velocity'], cmap='viridis', s=10)
+    fig.colorbar(points, ax=ax, label='Radial Velocity (m/s)')
+    ax.set_xlabel('Actual Distance (meters) - GPS measured to Beacon')
+    ax.set_ylabel('UWB Error (meters)')
     
     #save the plot to the plot output dir
-    plt.suptitle('UWB Error vs Actual Distance to Beacon', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize = 10)
-    plt.grid(True)
-    plt.savefig(os.path.join(plot_output_dir, 'uwb_error_vs_actual_distance.png'), dpi=300)
-    plt.clf()
-    plt.close()
+    fig.suptitle('UWB Error vs Actual Distance to Beacon', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize = 10)
+    ax.grid(True)
+    return _save(fig, plot_output_dir, 'uwb_error_vs_actual_distance.png')
 
 # Create a combined scatter plot of uwb measured distance to gps measured actual distance
-def plot_uwb_distance_vs_gps_actual_distance(uwb_distance_df, aircraft_gps_df, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.scatter(uwb_distance_df['timestamp'], uwb_distance_df['distance'], c='blue', s=8, alpha=0.6, label='UWB Distance')
-    plt.scatter(aircraft_gps_df['timestamp'], aircraft_gps_df['actual_distance'], c='red', s=8, alpha=0.6, label='GPS Actual Distance')
-    plt.xlabel('UWB Distance (meters)')
-    plt.ylabel('GPS Measured Actual Distance (meters)')
-    plt.suptitle('UWB Distance vs GPS Measured Actual Distance', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize = 10)
-    plt.grid(True)
-    plt.legend()
-    plt.savefig(os.path.join(plot_output_dir, 'uwb_distance_vs_gps_actual_distance.png'), dpi=300)
-    plt.clf()
-    plt.close()
+def plot_uwb_distance_vs_gps_actual_distance(uwb_distance_df, aircraft_gps_df, ros_bag_file, plot_output_dir,
+                                             max_points=PLOT_POINT_BUDGET):
+    fig, ax = _figure()
+    uwb_distance_df = decimate_series(uwb_distance_df, 'timestamp', 'distance', max_points)
+    aircraft_gps_df = decimate_series(aircraft_gps_df, 'timestamp', 'actual_distance', max_points)
+    ax.scatter(uwb_distance_df['timestamp'], uwb_distance_df['distance'], c='blue', s=8, alpha=0.6, label='UWB Distance')
+    ax.scatter(aircraft_gps_df['timestamp'], aircraft_gps_df['actual_distance'], c='red', s=8, alpha=0.6, label='GPS Actual Distance')
+    ax.set_xlabel('UWB Distance (meters)')
+    ax.set_ylabel('GPS Measured Actual Distance (meters)')
+    fig.suptitle('UWB Distance vs GPS Measured Actual Distance', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize = 10)
+    ax.grid(True)
+    ax.legend()
+    return _save(fig, plot_output_dir, 'uwb_distance_vs_gps_actual_distance.png')
 
 # Create the same UWB and GPS distance plot but from the merged data frame
-def plot_uwb_distance_vs_gps_actual_distance_merged(merged_df, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.scatter(merged_df['timestamp'], merged_df['distance'], c='blue', s=8, alpha=0.6, label='UWB Distance')
-    plt.scatter(merged_df['timestamp'], merged_df['actual_distance'], c='red', s=8, alpha=0.6, label='GPS Actual Distance')
-    plt.xlabel('Timestamp')
-    plt.ylabel('Distance (m)')
-    plt.suptitle('UWB vs GPS Distance Over Time (Merged Data)', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize = 10)
-    plt.grid(True)
-    plt.legend()
-    plt.savefig(os.path.join(plot_output_dir, 'uwb_distance_vs_gps_actual_distance_merged.png'), dpi=300)
-    plt.clf()
-    plt.close()
+def plot_uwb_distance_vs_gps_actual_distance_merged(merged_df, ros_bag_file, plot_output_dir, max_points=PLOT_POINT_BUDGET):
+    fig, ax = _figure()
+    uwb_df = decimate_series(merged_df, 'timestamp', 'distance', max_points)
+    gps_df = decimate_series(merged_df, 'timestamp', 'actual_distance', max_points)
+    ax.scatter(uwb_df['timestamp'], uwb_df['distance'], c='blue', s=8, alpha=0.6, label='UWB Distance')
+    ax.scatter(gps_df['timestamp'], gps_df['actual_distance'], c='red', s=8, alpha=0.6, label='GPS Actual Distance')
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('Distance (m)')
+    fig.suptitle('UWB vs GPS Distance Over Time (Merged Data)', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize = 10)
+    ax.grid(True)
+    ax.legend()
+    return _save(fig, plot_output_dir, 'uwb_distance_vs_gps_actual_distance_merged.png')
 
 # Plot aircraft GPS path
 def plot_aircraft_path(gps_df, beacon_lat, beacon_lon, commanded_landing, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.plot(gps_df['longitude'], gps_df['latitude'], 'b-', linewidth=1, label='Aircraft Path')
-    plt.scatter(gps_df['longitude'].iloc[0], gps_df['latitude'].iloc[0], c='green', s=100, marker='^', label='Start')
-    plt.scatter(gps_df['longitude'].iloc[-1], gps_df['latitude'].iloc[-1], c='red', s=100, marker='v', label='End')
-    plt.scatter(beacon_lon, beacon_lat, c='orange', s=150, marker='*', label='Beacon')
+    fig, ax = _figure()
+    ax.plot(gps_df['longitude'], gps_df['latitude'], 'b-', linewidth=1, label='Aircraft Path')
+    ax.scatter(gps_df['longitude'].iloc[0], gps_df['latitude'].iloc[0], c='green', s=100, marker='^', label='Start')
+    ax.scatter(gps_df['longitude'].iloc[-1], gps_df['latitude'].iloc[-1], c='red', s=100, marker='v', label='End')
+    ax.scatter(beacon_lon, beacon_lat, c='orange', s=150, marker='*', label='Beacon')
     
     if commanded_landing:
-        plt.scatter(commanded_landing['lon'], commanded_landing['lat'], c='purple', s=100, marker='x', label='UWB Landing Est.')
+        ax.scatter(commanded_landing['lon'], commanded_landing['lat'], c='purple', s=100, marker='x', label='UWB Landing Est.')
     
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.suptitle('Aircraft Flight Path', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize=10)
-    plt.grid(True)
-    plt.legend()
-    plt.axis('equal')
-    plt.savefig(os.path.join(plot_output_dir, 'aircraft_flight_path.png'), dpi=300)
-    plt.clf()
-    plt.close()
-
-def plot_sigma_time (sigma_df, sigma_threshold, ros_bag_file, plot_output_dir):
-    plt.figure(figsize=(12, 8))
-    plt.scatter(sigma_df['timestamp'], sigma_df['sigma'], c='blue', s=10)
-    plt.axhline(y=sigma_threshold, color='red', linestyle='--', label=f'Sigma Threshold: {sigma_threshold}')
-    plt.xlabel('Timestamp')
-    plt.ylabel('Sigma')
-    plt.suptitle('Sigma Over Time', fontsize=14, fontweight='bold')
-    plt.title(f'Run: {ros_bag_file}', fontsize=10)
-    plt.grid(True)
-    plt.savefig(os.path.join(plot_output_dir, 'sigma_over_time.png'), dpi=300)
-    plt.clf()
-    plt.close()
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    fig.suptitle('Aircraft Flight Path', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize=10)
+    ax.grid(True)
+    ax.legend()
+    ax.axis('equal')
+    return _save(fig, plot_output_dir, 'aircraft_flight_path.png')
+
+def plot_sigma_time (sigma_df, sigma_threshold, ros_bag_file, plot_output_dir, max_points=PLOT_POINT_BUDGET):
+    fig, ax = _figure()
+    sigma_df = decimate_series(sigma_df, 'timestamp', 'sigma', max_points)
+    ax.scatter(sigma_df['timestamp'], sigma_df['sigma'], c='blue', s=10)
+    ax.axhline(y=sigma_threshold, color='red', linestyle='--', label=f'Sigma Threshold: {sigma_threshold}')
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('Sigma')
+    fig.suptitle('Sigma Over Time', fontsize=14, fontweight='bold')
+    ax.set_title(f'Run: {ros_bag_file}', fontsize=10)
+    ax.grid(True)
+    return _save(fig, plot_output_dir, 'sigma_over_time.png')
 
 
 # # Compare the radial velocity to the UWB error
@@ -0,0 +1,109 @@
+import numpy as np
+
+# Scale of the median absolute deviation that estimates the standard deviation of normal data
+MAD_SCALE = 1.4826
+
+# Hampel filter: samples further than HAMPEL_THRESHOLD scaled MADs from the median of the
+# HAMPEL_WINDOW samples centred on them are outliers, e.g. multipath spikes
+HAMPEL_WINDOW = 21
+HAMPEL_THRESHOLD = 3.0
+
+# Fraction of samples cut from each end for the trimmed mean
+TRIM_PROPORTION = 0.1
+
+# Rows of rolling windows evaluated at a time, bounding the memory of hampel_outliers
+HAMPEL_BLOCK_ROWS = 65536
+
+def _finite(values, weights=None):
+    values = np.asarray(values, dtype=np.float64)
+    keep = np.isfinite(values)
+    if weights is None:
+        return values[keep], None
+    return values[keep], np.asarray(weights, dtype=np.float64)[keep]
+
+def _weighted_quantile(values, q, weights):
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    return values[order][np.searchsorted(cumulative, q * cumulative[-1], side='right').clip(max=len(values) - 1)]
+
+def quantile(values, q, weights=None):
+    """Quantile q (0 to 1) of the finite values, optionally with a count per value, NaN if there are none"""
+    values, weights = _finite(values, weights)
+    if len(values) == 0:
+        return np.nan
+    if weights is None:
+        return float(np.quantile(values, q))
+    return float(_weighted_quantile(values, q, weights))
+
+def median_mad(values, weights=None):
+    """Median and scaled median absolute deviation of the finite values, optionally with a count per value"""
+    values, weights = _finite(values, weights)
+    median = quantile(values, 0.5, weights)
+    return median, MAD_SCALE * quantile(np.abs(values - median), 0.5, weights)
+
+def trimmed_mean(values, proportion=TRIM_PROPORTION, weights=None):
+    """Mean of the finite values without the lowest and highest proportion of them, optionally with a count per value"""
+    values, weights = _finite(values, weights)
+    if len(values) == 0:
+        return np.nan
+    if weights is None:
+        values = np.sort(values)
+        cut = int(proportion * len(values))
+        return float(values[cut:len(values) - cut].mean())
+    # Clip each value's count to the part of the cumulative count inside the kept range
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    upper = np.cumsum(weights)
+    lower = upper - weights
+    total = upper[-1]
+    kept = np.clip(np.minimum(upper, (1 - proportion) * total) - np.maximum(lower, proportion * total), 0, None)
+    return float((values * kept).sum() / kept.sum())
+
+def hampel_outliers(values, window=HAMPEL_WINDOW, threshold=HAMPEL_THRESHOLD):
+    """
+    Flag outliers of a time series with a rolling Hampel filter.
+
+    Every sample is compared with the median and scaled MAD of the window samples
+    centred on it, with the series mirrored at its ends. NaN samples are never flagged.
+
+    Args:
+        values: The series, in time order.
+        window (int, optional): Odd number of samples per window.
+        threshold (float, optional): Scaled MADs from the window median beyond which a
+                                     sample is an outlier.
+
+    Returns:
+        numpy.ndarray: True for outliers.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    half = window // 2
+    if len(values) <= half:
+        return np.zeros(len(values), dtype=bool)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(values, half, mode='reflect'), 2 * half + 1)
+    outliers = np.empty(len(values), dtype=bool)
+    for start in range(0, len(values), HAMPEL_BLOCK_ROWS):
+        block = windows[start:start + HAMPEL_BLOCK_ROWS]
+        median = np.median(block, axis=1)
+        mad = MAD_SCALE * np.median(np.abs(block - median[:, None]), axis=1)
+        deviation = np.abs(values[start:start + HAMPEL_BLOCK_ROWS] - median)
+        outliers[start:start + HAMPEL_BLOCK_ROWS] = deviation > threshold * mad
+    return outliers
+
+def robust_summary(values, outliers, weights=None):
+    """
+    Robust metrics of the UWB error, as stored with each flight.
+
+    Args:
+        values: The errors, or the distinct values of a histogram of them.
+        outliers: Number of outliers flagged among the errors.
+        weights (optional): Count of each value, for a histogram.
+    """
+    median, mad = median_mad(values, weights)
+    return {
+        'median_error': median,
+        'mad_error': mad,
+        'trimmed_mean_error': trimmed_mean(values, weights=weights),
+        'p05_error': quantile(values, 0.05, weights),
+        'p95_error': quantile(values, 0.95, weights),
+        'outlier_count': int(outliers),
+    }
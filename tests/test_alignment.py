@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from alignment import align_stream
+
+def test_linear_alignment_next_to_dropout_takes_nearest_sample():
+    # GPS fixes at 0, 1 s, then a 10 s dropout until 11 s
+    gps = pd.DataFrame({'timestamp': np.array([0, 1, 11], dtype=np.int64) * 1000,
+                        'distance': [100.0, 110.0, 210.0],
+                        'fix': ['a', 'b', 'c']})
+    # UWB readings inside the dropout: 0.1 s after the fix at 1 s, 0.1 s before the one
+    # at 11 s, and in the middle, out of reach of both
+    targets = np.array([500, 1100, 6000, 10900], dtype=np.int64)
+    aligned = align_stream(targets, gps, method='linear', max_gap=1.0, time_unit_ns=1_000_000)
+
+    assert aligned['distance'].iloc[0] == 105.0
+    assert aligned['distance'].iloc[1] == 110.0
+    assert np.isnan(aligned['distance'].iloc[2])
+    assert aligned['distance'].iloc[3] == 210.0
+    assert list(aligned['fix'].iloc[[0, 1, 3]]) == ['a', 'b', 'c']
+    assert pd.isna(aligned['fix'].iloc[2])
+
+def test_linear_alignment_outside_the_stream_takes_nearest_sample_in_range():
+    gps = pd.DataFrame({'timestamp': np.array([1000, 2000], dtype=np.int64), 'distance': [1.0, 2.0]})
+    targets = np.array([500, 2500, 4000], dtype=np.int64)
+    aligned = align_stream(targets, gps, method='linear', max_gap=1.0, time_unit_ns=1_000_000)
+
+    assert aligned['distance'].iloc[0] == 1.0
+    assert aligned['distance'].iloc[1] == 2.0
+    assert np.isnan(aligned['distance'].iloc[2])
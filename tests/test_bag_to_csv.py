@@ -0,0 +1,82 @@
+import numpy as np
+from rosbags.rosbag2 import Writer, StoragePlugin
+from rosbags.typesys import Stores, get_typestore
+from BagToCsv import RosbagParser
+from fast_cdr import compile_fast_decoder
+
+BAG_START_TIME = 1_700_000_000_000_000_000
+
+typestore = get_typestore(Stores.ROS2_HUMBLE)
+types = typestore.types
+
+def header(stamp, frame_id='map'):
+    return types['std_msgs/msg/Header'](
+        stamp=types['builtin_interfaces/msg/Time'](sec=stamp // 10**9, nanosec=stamp % 10**9), frame_id=frame_id)
+
+def navsatfix(stamp, latitude, covariance, frame_id='map'):
+    return types['sensor_msgs/msg/NavSatFix'](
+        header=header(stamp, frame_id), status=types['sensor_msgs/msg/NavSatStatus'](status=0, service=1),
+        latitude=latitude, longitude=-79.6, altitude=325.0, position_covariance=covariance,
+        position_covariance_type=2)
+
+def laser_scan(stamp, ranges):
+    return types['sensor_msgs/msg/LaserScan'](
+        header=header(stamp), angle_min=0.0, angle_max=1.0, angle_increment=0.1, time_increment=0.0,
+        scan_time=0.1, range_min=0.0, range_max=10.0, ranges=ranges, intensities=np.zeros(0, dtype=np.float32))
+
+def write_bag(bag_path, messages):
+    """Write (topic, stamp, message) tuples, in order, to an MCAP bag"""
+    with Writer(bag_path, version=9, storage_plugin=StoragePlugin.MCAP) as writer:
+        connections = {}
+        for topic, stamp, message in messages:
+            if topic not in connections:
+                connections[topic] = writer.add_connection(topic, message.__msgtype__, typestore=typestore)
+            writer.write(connections[topic], stamp, typestore.serialize_cdr(message, message.__msgtype__))
+
+def test_array_fields_flatten_into_numeric_columns(tmp_path):
+    covariances = [np.arange(9, dtype=np.float64) + 10 * i for i in range(3)]
+    scans = [np.array([1.5, 2.5], dtype=np.float32), np.zeros(0, dtype=np.float32),
+             np.array([3.0, 4.0, 5.0], dtype=np.float32)]
+    messages = []
+    for i in range(3):
+        stamp = BAG_START_TIME + i * 10**8
+        messages.append(('/fix', stamp, navsatfix(stamp, 40.0 + i, covariances[i])))
+        messages.append(('/scan', stamp + 1, laser_scan(stamp + 1, scans[i])))
+    write_bag(tmp_path / 'bag', messages)
+
+    frames = RosbagParser(bag_file_path=str(tmp_path / 'bag'), output_dir=str(tmp_path)).to_dataframes()
+
+    fix = frames['/fix']
+    covariance_columns = [f'position_covariance.{i}' for i in range(9)]
+    assert [column for column in fix.columns if column.startswith('position_covariance.')] == covariance_columns
+    assert (fix[covariance_columns].dtypes == np.float64).all()
+    np.testing.assert_array_equal(fix[covariance_columns].to_numpy(), np.stack(covariances))
+
+    ranges = frames['/scan']['ranges']
+    for cell, expected in zip(ranges, scans):
+        assert isinstance(cell, np.ndarray) and cell.dtype == np.float32
+        np.testing.assert_array_equal(cell, expected)
+
+def test_fast_decoder_matches_generic_deserializer_on_variable_length_strings():
+    msgtype = 'sensor_msgs/msg/NavSatFix'
+    fields = RosbagParser._flattened_fields(typestore, msgtype)
+    _, _, flatten = RosbagParser._compile_flattener(typestore, msgtype)
+    decoder = compile_fast_decoder(typestore, msgtype, fields)
+
+    # The frame ids give messages of one size, but split it differently between the string and padding
+    batches = [['map'] * 4, ['a', 'a', 'a'], ['abcde', 'abcde'], ['\u00e9'] * 2, ['a', 'abc', 'map'], ['', '']]
+    fast_batches = 0
+    for i, frame_ids in enumerate(batches):
+        rawdatas = [bytes(typestore.serialize_cdr(navsatfix(BAG_START_TIME + j, 40.0 + i + j / 10,
+                                                            np.full(9, float(j)), frame_id), msgtype))
+                    for j, frame_id in enumerate(frame_ids)]
+        arrays = decoder.decode(rawdatas)
+        if arrays is None:
+            continue
+        fast_batches += 1
+        rows = [flatten(typestore.deserialize_cdr(rawdata, msgtype)) for rawdata in rawdatas]
+        for column, (key, *_) in enumerate(fields):
+            assert arrays[column].tolist() == [row[column] for row in rows], key
+
+    # Only the batch mixing frame ids of different lengths needs the generic path
+    assert fast_batches == len(batches) - 1
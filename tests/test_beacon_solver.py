@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import benchmark
+from beacon_solver import solve_beacon_position
+from geo_utils import enu_to_geodetic, haversine
+
+def flight_frame(seconds, bias, rng):
+    """Merged readings of a flight around the benchmark beacon, with multipath spikes and flagged garbage"""
+    east, north, up = benchmark.flight_enu(seconds)
+    latitude, longitude, altitude = enu_to_geodetic(east, north, up, benchmark.BEACON_LAT, benchmark.BEACON_LON,
+                                                    benchmark.BEACON_ALT)
+    distance = np.sqrt(east**2 + north**2 + up**2) + bias + rng.normal(0, 0.05, len(seconds))
+    distance[rng.random(len(seconds)) < 0.02] += rng.uniform(2, 10)
+    outlier = rng.random(len(seconds)) < 0.05
+    distance[outlier] = 1000.0
+    return pd.DataFrame({'latitude': latitude, 'longitude': longitude, 'altitude': altitude, 'distance': distance,
+                         'outlier': outlier})
+
+def test_beacon_and_flight_biases_are_recovered_from_a_wrong_entered_position():
+    rng = np.random.default_rng(0)
+    frames = [flight_frame(np.arange(0, 300, 0.1), 0.3, rng), flight_frame(np.arange(50, 250, 0.1), -0.1, rng)]
+    # Entered 4 m east, 3 m south and 1.5 m above the true beacon
+    entered_lat, entered_lon, entered_alt = enu_to_geodetic(4.0, -3.0, 1.5, benchmark.BEACON_LAT,
+                                                            benchmark.BEACON_LON, benchmark.BEACON_ALT)
+
+    result = solve_beacon_position(frames, float(entered_lat), float(entered_lon), float(entered_alt))
+
+    assert result['converged']
+    assert result['readings'] == sum(int((~df['outlier']).sum()) for df in frames)
+    assert haversine(result['latitude'], result['longitude'], benchmark.BEACON_LAT, benchmark.BEACON_LON) < 0.02
+    assert abs(result['altitude'] - benchmark.BEACON_ALT) < 0.03
+    assert abs(result['horizontal_shift'] - 5.0) < 0.02
+    np.testing.assert_allclose(result['bias'], [0.3, -0.1], atol=0.01)
@@ -0,0 +1,14 @@
+import benchmark
+
+def test_benchmark_recovers_planted_delay_and_bias(tmp_path):
+    results = benchmark.run_benchmarks(durations=[60.0], repeats=1, bag_dir=str(tmp_path))
+
+    accuracy = results['runs'][0]['accuracy']
+    assert set(accuracy) == {'analyze', 'stream'}
+    assert benchmark.check_accuracy(results) == []
+
+def test_check_accuracy_flags_errors_beyond_tolerance():
+    errors = {'delay_seconds': 0.05, 'delay_error_seconds': -0.05, 'bias': 0.31, 'bias_error': 0.01}
+    results = {'runs': [{'duration': 60.0, 'accuracy': {'analyze': errors}}]}
+
+    assert benchmark.check_accuracy(results) == [(60.0, 'analyze', 'delay', -0.05)]
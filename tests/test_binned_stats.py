@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from binned_stats import BinnedStats
+
+def test_chunked_bins_match_grouped_statistics():
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(0, 100, 20000)
+    velocity = rng.uniform(-10, 10, 20000)
+    error = 1.0 + 0.01 * distance + rng.normal(0, 0.2, 20000)
+    error[::97] = np.nan
+
+    stats = BinnedStats({'actual_distance': 25.0, 'radial_velocity': 5.0})
+    for chunk in np.array_split(np.arange(20000), 7):
+        chunk_stats = BinnedStats({'actual_distance': 25.0, 'radial_velocity': 5.0})
+        chunk_stats.update(error[chunk], distance[chunk], velocity[chunk])
+        stats.merge(chunk_stats)
+    bins = stats.to_frame()
+
+    # Bins are aligned to multiples of their width, negative positions included
+    df = pd.DataFrame({'error': error, 'actual_distance_min': np.floor(distance / 25.0) * 25.0,
+                       'radial_velocity_min': np.floor(velocity / 5.0) * 5.0}).dropna()
+    expected = df.groupby(['actual_distance_min', 'radial_velocity_min'])['error'].agg(
+        ['count', 'mean', 'std', lambda values: np.percentile(values, 95)]).reset_index()
+    assert len(bins) == len(expected) == 16
+    bins = bins.sort_values(['actual_distance_min', 'radial_velocity_min']).reset_index(drop=True)
+    np.testing.assert_array_equal(bins['actual_distance_min'], expected['actual_distance_min'])
+    np.testing.assert_array_equal(bins['radial_velocity_max'] - bins['radial_velocity_min'], 5.0)
+    np.testing.assert_array_equal(bins['count'], expected['count'])
+    np.testing.assert_allclose(bins['mean'], expected['mean'], rtol=1e-9)
+    np.testing.assert_allclose(bins['std'], expected['std'], rtol=1e-9)
+    np.testing.assert_allclose(bins['p95'], expected['<lambda_0>'], rtol=0.02)
@@ -0,0 +1,45 @@
+import pandas as pd
+import benchmark
+import conversion_cache
+from BagToCsv import RosbagParser
+from conversion_cache import cached_dataframes
+from flight_analysis import UWB_TOPIC, GPS_TOPIC
+from flight_processing import ANALYSIS_FIELDS
+
+def test_conversions_are_reused_until_the_bag_fields_or_parser_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conversions = []
+    to_dataframes = RosbagParser.to_dataframes
+    def counted(parser, *args, **kwargs):
+        conversions.append(parser.bag_path)
+        return to_dataframes(parser, *args, **kwargs)
+    monkeypatch.setattr(RosbagParser, 'to_dataframes', counted)
+
+    bag_path = tmp_path / 'flight'
+    benchmark.generate_bag(bag_path, 20)
+    cache_dir = str(tmp_path / 'cache')
+    def convert(columns=ANALYSIS_FIELDS, **kwargs):
+        parser = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path), **kwargs)
+        return cached_dataframes(parser, columns, cache_dir=cache_dir)
+
+    frames = convert()
+    assert len(conversions) == 1
+    cached = convert()
+    assert len(conversions) == 1
+    assert cached.keys() == frames.keys()
+    for topic, df in frames.items():
+        pd.testing.assert_frame_equal(cached[topic], df)
+
+    # Other fields, another time window, a newer parser or new bag contents miss the cache
+    convert({topic: ANALYSIS_FIELDS[topic] for topic in (UWB_TOPIC, GPS_TOPIC)})
+    assert len(conversions) == 2
+    convert(last_seconds=5.0)
+    assert len(conversions) == 3
+    monkeypatch.setattr(conversion_cache, 'PARSER_VERSION', 'test')
+    convert()
+    assert len(conversions) == 4
+    benchmark.generate_bag(bag_path, 20, seed=1)
+    convert()
+    assert len(conversions) == 5
+    convert()
+    assert len(conversions) == 5
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import benchmark
+from BagToCsv import RosbagParser
+from geo_utils import enu_to_geodetic
+import flight_analysis
+from flight_analysis import (FlightAnalysis, stream_flight_summary, estimate_flight_time_offset, UWB_TOPIC,
+                             GPS_TOPIC, VELOCITY_TOPIC)
+from flight_processing import ANALYSIS_FIELDS
+
+def test_streaming_and_in_memory_agree_on_auto_time_offset(tmp_path):
+    bag_path = tmp_path / 'flight'
+    benchmark.generate_bag(bag_path, 180)
+    parser = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path))
+    location = (benchmark.BEACON_LAT, benchmark.BEACON_LON, benchmark.BEACON_ALT)
+
+    analysis = FlightAnalysis(parser.to_dataframes(columns=ANALYSIS_FIELDS), *location,
+                              time_offset='auto')
+    summary = stream_flight_summary(parser, ANALYSIS_FIELDS, *location, chunk_seconds=30,
+                                    time_offset='auto')
+
+    assert abs(summary.uwb_time_offset() - analysis.uwb_time_offset()) < 0.001
+    in_memory = analysis.error_summary()
+    streamed = summary.error_summary()
+    assert streamed['count'] == in_memory['count']
+    assert abs(streamed['mean'] - in_memory['mean']) < 0.001
+    assert abs(streamed['std'] - in_memory['std']) < 0.001
+
+def test_readings_off_the_millisecond_grid_are_aligned_exactly():
+    # Aircraft flying east at 50 m/s, 100 m up; GPS and UWB timestamps fall between
+    # milliseconds, so any rounding of them shows up in the error
+    start = 1_700_000_000_000_000_000
+    gps_times = start + np.arange(0, 10_000_000_000, 100_000_000) + 366_123
+    uwb_times = start + np.arange(0, 9_800_000_000, 20_000_000) + 741_777
+    east = 50.0 * (gps_times - start) / 1e9
+    latitude, longitude, altitude = enu_to_geodetic(east, np.zeros_like(east), np.full_like(east, 100.0),
+                                                    benchmark.BEACON_LAT, benchmark.BEACON_LON, benchmark.BEACON_ALT)
+    uwb_east = 50.0 * (uwb_times - start) / 1e9
+    frames = {
+        UWB_TOPIC: pd.DataFrame({'timestamp': uwb_times, 'distance': np.sqrt(uwb_east**2 + 100.0**2)}),
+        GPS_TOPIC: pd.DataFrame({'timestamp': gps_times, 'latitude': latitude, 'longitude': longitude,
+                                 'altitude': altitude}),
+        VELOCITY_TOPIC: pd.DataFrame({'timestamp': gps_times, 'twist.linear.x': 50.0, 'twist.linear.y': 0.0,
+                                      'twist.linear.z': 0.0}),
+    }
+
+    analysis = FlightAnalysis(frames, benchmark.BEACON_LAT, benchmark.BEACON_LON, benchmark.BEACON_ALT)
+    merged = analysis.frame('merged', ['timestamp', 'beacon_error'])
+
+    assert set(merged['timestamp']) <= set(uwb_times)
+    assert np.abs(merged['beacon_error']).max() < 0.001
+
+def test_streaming_counts_every_reading_off_the_millisecond_grid(tmp_path):
+    bag_path = tmp_path / 'flight'
+    benchmark.generate_bag(bag_path, 120, jitter=0.005)
+    location = (benchmark.BEACON_LAT, benchmark.BEACON_LON, benchmark.BEACON_ALT)
+    uwb_times = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path)).to_dataframes(
+        columns={UWB_TOPIC: ['timestamp']})[UWB_TOPIC]['timestamp']
+    counts = []
+    # Windows starting on a UWB reading, so the first chunk starts exactly on one
+    for start in uwb_times.iloc[[500, 1000, 1500, 2000]]:
+        parser = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path), start=int(start))
+        analysis = FlightAnalysis(parser.to_dataframes(columns=ANALYSIS_FIELDS), *location, time_offset='auto')
+        summary = stream_flight_summary(parser, ANALYSIS_FIELDS, *location, chunk_seconds=30, time_offset='auto')
+        counts.append((summary.error_summary()['count'], analysis.error_summary()['count']))
+
+    assert [streamed for streamed, _ in counts] == [in_memory for _, in_memory in counts]
+
+def test_streaming_offset_is_estimated_from_bounded_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(flight_analysis, 'OFFSET_WINDOW_SECONDS', 30)
+    bag_path = tmp_path / 'flight'
+    benchmark.generate_bag(bag_path, 400)
+    parser = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path))
+    windows = []
+    to_dataframes = RosbagParser.to_dataframes
+    def recording_to_dataframes(self, *args, **kwargs):
+        windows.append((self.start, self.stop))
+        return to_dataframes(self, *args, **kwargs)
+    monkeypatch.setattr(RosbagParser, 'to_dataframes', recording_to_dataframes)
+
+    offset = estimate_flight_time_offset(parser, ANALYSIS_FIELDS, benchmark.BEACON_LAT, benchmark.BEACON_LON,
+                                         benchmark.BEACON_ALT)
+
+    start, stop = parser.time_window()
+    assert len(windows) == flight_analysis.OFFSET_WINDOWS
+    assert all(window_stop - window_start == 30 * 10**9 for window_start, window_stop in windows)
+    assert windows[0][0] == start and windows[-1][1] == stop
+    assert abs(offset - (-benchmark.UWB_DELAY_SECONDS)) < 0.005
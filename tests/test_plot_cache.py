@@ -0,0 +1,44 @@
+import os
+import numpy as np
+import pandas as pd
+import plot_cache
+from plot_cache import render_cached_plots
+from plot_utilities import plot_uwb_error_over_actual_distance
+
+def error_frame(bias):
+    distance = np.linspace(5, 200, 500)
+    return pd.DataFrame({'actual_distance': distance, 'beacon_error': bias + 0.01 * distance,
+                         'radial_velocity': np.sin(distance)})
+
+def test_plots_are_served_from_the_cache_until_their_inputs_change(tmp_path, monkeypatch):
+    renders = []
+    render_to_cache = plot_cache._render_to_cache
+    def counted(function, args, key, cache_dir):
+        renders.append(key)
+        return render_to_cache(function, args, key, cache_dir)
+    monkeypatch.setattr(plot_cache, '_render_to_cache', counted)
+    cache_dir = str(tmp_path / 'cache')
+    def render(bias, plot_dir='plots', **kwargs):
+        job = (plot_uwb_error_over_actual_distance, (error_frame(bias), 'flight', str(tmp_path / plot_dir)))
+        return next(render_cached_plots({'error_distance': job}, cache_dir=cache_dir, workers=1, **kwargs))
+
+    _, key, path = render(0.1)
+    assert renders == [key]
+    assert path == os.path.join(cache_dir, key + '.png') and os.path.getsize(path) > 0
+
+    # The output folder is not part of the key
+    assert render(0.1, plot_dir='elsewhere') == ('error_distance', key, path)
+    assert len(renders) == 1
+
+    # Other data or a new renderer version miss the cache
+    _, other_key, other_path = render(0.2)
+    assert other_key != key and renders[-1] == other_key
+    monkeypatch.setattr(plot_cache, 'PLOT_RENDERER_VERSION', 'test')
+    _, versioned_key, _ = render(0.1)
+    assert versioned_key not in (key, other_key) and len(renders) == 3
+
+    # Beyond the size cap the least recently used plots are evicted
+    os.utime(path, (0, 0))
+    total = sum(entry.stat().st_size for entry in os.scandir(cache_dir))
+    plot_cache.enforce_plot_cache_cap(cache_dir, total - 1)
+    assert not os.path.exists(path) and os.path.exists(other_path)
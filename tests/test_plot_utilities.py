@@ -0,0 +1,27 @@
+import numpy as np
+from plot_utilities import lttb_indices
+
+def test_lttb_keeps_spikes_up_and_down():
+    rng = np.random.default_rng(0)
+    y = rng.normal(0.0, 1.0, 10007)
+    # Pairs of spikes close enough to share a bucket
+    up = np.arange(50, 10000, 400)
+    down = up + 5
+    y[up] += 100.0
+    y[down] -= 100.0
+
+    kept = lttb_indices(np.arange(len(y)), y, 333)
+
+    assert len(kept) <= 333
+    assert kept[0] == 0 and kept[-1] == len(y) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert np.isin(up, kept).all()
+    assert np.isin(down, kept).all()
+
+def test_lttb_keeps_a_spike_with_one_point_to_spare():
+    y = np.array([0.0, 0.1, 100.0, -0.1, 0.0])
+
+    assert list(lttb_indices(np.arange(5), y, 3)) == [0, 2, 4]
+
+def test_lttb_keeps_short_series_whole():
+    assert list(lttb_indices(np.arange(4), np.ones(4), 10)) == [0, 1, 2, 3]
@@ -0,0 +1,41 @@
+import numpy as np
+import robust_stats
+from robust_stats import MAD_SCALE, hampel_outliers, robust_summary
+
+def test_hampel_filter_flags_spikes_like_a_per_sample_window(monkeypatch):
+    rng = np.random.default_rng(0)
+    values = np.sin(np.arange(3000) / 200) * 20 + rng.normal(0, 0.1, 3000)
+    spikes = np.array([0, 3, 1000, 1001, 2047, 2999])
+    values[spikes] += 10.0
+    values[1500] = np.nan
+
+    # Windows are evaluated in blocks; make them small so samples on block edges are covered
+    monkeypatch.setattr(robust_stats, 'HAMPEL_BLOCK_ROWS', 1024)
+    outliers = hampel_outliers(values, window=21, threshold=3.0)
+
+    padded = np.pad(values, 10, mode='reflect')
+    expected = np.zeros(len(values), dtype=bool)
+    for i in range(len(values)):
+        window = padded[i:i + 21]
+        median = np.median(window)
+        expected[i] = abs(values[i] - median) > 3.0 * MAD_SCALE * np.median(np.abs(window - median))
+    np.testing.assert_array_equal(outliers, expected)
+    assert outliers[spikes].all()
+    assert not outliers[1500]
+    assert outliers.sum() < len(spikes) + 0.01 * len(values)
+
+def test_histogram_summary_matches_raw_values():
+    rng = np.random.default_rng(1)
+    values = np.round(rng.normal(0.3, 0.2, 5000), 2)
+    values[:50] += 10.0
+    distinct, counts = np.unique(values, return_counts=True)
+
+    raw = robust_summary(values, 50)
+    weighted = robust_summary(distinct, 50, weights=counts)
+
+    for metric in ('median_error', 'mad_error', 'p05_error', 'p95_error'):
+        assert abs(weighted[metric] - raw[metric]) <= 0.01, metric
+    np.testing.assert_allclose(weighted['trimmed_mean_error'], raw['trimmed_mean_error'], rtol=1e-9)
+    # The spikes do not move the robust metrics
+    assert abs(raw['median_error'] - 0.3) < 0.02 and abs(raw['mad_error'] - 0.2) < 0.02
+    assert raw['outlier_count'] == 50
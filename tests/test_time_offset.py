@@ -0,0 +1,34 @@
+import numpy as np
+import benchmark
+from BagToCsv import RosbagParser
+from flight_analysis import FlightAnalysis
+from flight_processing import ANALYSIS_FIELDS
+from time_offset import estimate_time_offset
+
+def flight_range(seconds):
+    east, north, up = benchmark.flight_enu(seconds)
+    return np.sqrt(east ** 2 + north ** 2 + up ** 2)
+
+def test_offset_is_recovered_from_noisy_ranges():
+    rng = np.random.default_rng(0)
+    uwb_times = np.arange(0, 300, 0.1)
+    gps_times = np.arange(0, 300, 0.2)
+    # UWB ranges stamped 0.1 s late, with multipath spikes
+    uwb_distance = flight_range(uwb_times - 0.1) + rng.normal(0, 0.1, len(uwb_times))
+    uwb_distance[rng.random(len(uwb_times)) < 0.01] += 10.0
+    gps_distance = flight_range(gps_times) + rng.normal(0, 0.3, len(gps_times))
+
+    result = estimate_time_offset(uwb_times, uwb_distance, gps_times, gps_distance)
+
+    assert abs(result['offset'] - (-0.1)) < 0.005
+
+def test_planted_uwb_delay_is_recovered_from_benchmark_bag(tmp_path):
+    bag_path = tmp_path / 'flight'
+    benchmark.generate_bag(bag_path, 120)
+    frames = RosbagParser(bag_file_path=str(bag_path), output_dir=str(tmp_path)).to_dataframes(
+        columns=ANALYSIS_FIELDS)
+
+    analysis = FlightAnalysis(frames, benchmark.BEACON_LAT, benchmark.BEACON_LON, benchmark.BEACON_ALT,
+                              time_offset='auto')
+
+    assert abs(analysis.uwb_time_offset() - (-benchmark.UWB_DELAY_SECONDS)) < 0.005
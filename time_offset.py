@@ -0,0 +1,165 @@
+import numpy as np
+from robust_stats import hampel_outliers, median_mad
+
+# Spacing of the uniform grid both ranges are resampled onto, and the largest clock
+# offset searched for, in seconds
+OFFSET_GRID_SECONDS = 0.02
+MAX_OFFSET_SECONDS = 2.0
+
+# Interval over which the range rates that are correlated are taken, in seconds.
+# Longer intervals average out more UWB noise.
+RATE_SECONDS = 0.5
+
+# Shortest overlap of the two streams an offset is estimated from, in seconds
+MIN_OVERLAP_SECONDS = 10.0
+
+# The correlation peak is flat and noise moves it, so the offset is refined around it:
+# first on a grid of REFINE_COARSE_SECONDS within REFINE_SPAN_SECONDS of the peak, then
+# on a grid of REFINE_FINE_SECONDS, using at most REFINE_READINGS UWB readings. On 300 s
+# of 50 Hz UWB with 0.3 m GPS noise the parabolic FFT peak alone is off by 40 ms
+# (median, up to 0.1 s, at any grid spacing), the refined offset by 1 ms (up to 2 ms).
+# The 72 candidates over at most REFINE_READINGS readings cost 0.03 to 0.08 s however
+# long the flight is.
+REFINE_SPAN_SECONDS = 0.25
+REFINE_COARSE_SECONDS = 0.01
+REFINE_FINE_SECONDS = 0.001
+REFINE_READINGS = 20000
+
+# Readings further than this many scaled MADs from the median residual are left out
+# of the fine search
+REFINE_INLIER_MADS = 3.0
+
+def _residuals(offset, uwb_times, uwb_distance, gps_times, gps_distance):
+    """UWB ranges minus the GPS distances at the UWB times plus offset, NaN outside the GPS data"""
+    return uwb_distance - np.interp(uwb_times + offset, gps_times, gps_distance, left=np.nan, right=np.nan)
+
+def _refine_offset(offset, uwb_times, uwb_distance, gps_times, gps_distance, max_offset):
+    """
+    The offset near a first estimate at which the UWB range residual spreads least.
+
+    The coarse search minimizes the MAD of the residual, which multipath spikes do not
+    move. The MAD has a flat, noisy minimum though, so the fine search minimizes the
+    standard deviation of the readings that are inliers at the coarse offset, which
+    changes smoothly with the offset.
+
+    Returns:
+        tuple: The offset and the MAD of the residual at it.
+    """
+    step = max(len(uwb_times) // REFINE_READINGS, 1)
+    uwb_times, uwb_distance = uwb_times[::step], uwb_distance[::step]
+
+    candidates = np.clip(offset + np.arange(-REFINE_SPAN_SECONDS, REFINE_SPAN_SECONDS + REFINE_COARSE_SECONDS / 2,
+                                            REFINE_COARSE_SECONDS), -max_offset, max_offset)
+    spread = [np.nanmedian(np.abs(residual - np.nanmedian(residual)))
+              for residual in (_residuals(candidate, uwb_times, uwb_distance, gps_times, gps_distance)
+                               for candidate in candidates)]
+    offset = float(candidates[int(np.argmin(spread))])
+
+    # Inliers at the coarse offset that stay inside the GPS data over the fine search
+    residual = _residuals(offset, uwb_times, uwb_distance, gps_times, gps_distance)
+    median, mad = median_mad(residual)
+    inliers = (np.abs(residual - median) <= REFINE_INLIER_MADS * mad) & \
+        (uwb_times + offset - REFINE_COARSE_SECONDS >= gps_times[0]) & \
+        (uwb_times + offset + REFINE_COARSE_SECONDS <= gps_times[-1])
+    uwb_times, uwb_distance = uwb_times[inliers], uwb_distance[inliers]
+
+    candidates = np.clip(offset + np.arange(-REFINE_COARSE_SECONDS, REFINE_COARSE_SECONDS + REFINE_FINE_SECONDS / 2,
+                                            REFINE_FINE_SECONDS), -max_offset, max_offset)
+    spread = [np.std(_residuals(candidate, uwb_times, uwb_distance, gps_times, gps_distance))
+              for candidate in candidates]
+    offset = float(candidates[int(np.argmin(spread))])
+    residual = _residuals(offset, uwb_times, uwb_distance, gps_times, gps_distance)
+    return offset, float(np.median(np.abs(residual - np.median(residual))))
+
+def estimate_time_offset(uwb_times, uwb_distance, gps_times, gps_distance, grid_seconds=OFFSET_GRID_SECONDS,
+                         max_offset=MAX_OFFSET_SECONDS):
+    """
+    Estimate the clock offset between UWB ranges and GPS distances to the beacon by FFT
+    cross-correlation.
+
+    Both ranges are resampled onto a uniform grid over the time both streams cover and
+    turned into range rates over RATE_SECONDS, so a constant range bias does not matter
+    and the correlation peaks sharply where the rates line up. The correlation at each
+    lag is normalized by the energy of the overlapping parts, which keeps shorter
+    overlaps at larger lags from biasing the peak towards zero. The lag of the peak is
+    refined to a fraction of the grid spacing with a parabola through it and its
+    neighbours.
+
+    That peak is flat, and GPS noise moves it by up to a tenth of a second while the
+    correlation stays high. It is only a first estimate: the offset is then searched
+    for, down to REFINE_FINE_SECONDS, around it as the one where the UWB range minus
+    the interpolated GPS distance spreads least, see _refine_offset.
+
+    Args:
+        uwb_times, gps_times: Sorted sample times in seconds, on the same time base.
+        uwb_distance: UWB ranges; Hampel outliers (multipath spikes) of the range minus
+                      the GPS distance are ignored.
+        gps_distance: Distances from GPS positions to the beacon.
+        grid_seconds (float, optional): Spacing of the resampling grid.
+        max_offset (float, optional): Largest offset searched for, in seconds.
+
+    Returns:
+        dict: 'offset', the seconds to add to the UWB times to line them up with GPS,
+              'correlation', the normalized correlation (-1 to 1) at the correlation
+              peak, and 'residual_mad', the spread (MAD) in meters of the range
+              residual at the offset.
+    """
+    gps_times = np.asarray(gps_times, dtype=np.float64)
+    gps_distance = np.asarray(gps_distance, dtype=np.float64)
+    keep = np.isfinite(gps_distance)
+    gps_times, gps_distance = gps_times[keep], gps_distance[keep]
+    uwb_times = np.asarray(uwb_times, dtype=np.float64)
+    uwb_distance = np.asarray(uwb_distance, dtype=np.float64)
+    keep = np.isfinite(uwb_distance)
+    uwb_times, uwb_distance = uwb_times[keep], uwb_distance[keep]
+    if len(gps_times):
+        # Spikes stand out of the range minus the GPS distance, which takes out the change
+        # in range over a Hampel window that hides them in the range itself
+        keep = ~hampel_outliers(uwb_distance - np.interp(uwb_times, gps_times, gps_distance))
+        uwb_times, uwb_distance = uwb_times[keep], uwb_distance[keep]
+
+    start = max(uwb_times[0], gps_times[0]) if len(uwb_times) and len(gps_times) else 0.0
+    stop = min(uwb_times[-1], gps_times[-1]) if len(uwb_times) and len(gps_times) else 0.0
+    if stop - start < max(MIN_OVERLAP_SECONDS, 4 * max_offset):
+        raise ValueError(f"UWB and GPS overlap for {max(stop - start, 0.0):.1f} s, too short to estimate their offset.")
+
+    grid = np.arange(start, stop, grid_seconds)
+    step = max(int(round(RATE_SECONDS / grid_seconds)), 1)
+    uwb_range = np.interp(grid, uwb_times, uwb_distance)
+    gps_range = np.interp(grid, gps_times, gps_distance)
+    uwb_rate = uwb_range[step:] - uwb_range[:-step]
+    gps_rate = gps_range[step:] - gps_range[:-step]
+    uwb_rate -= uwb_rate.mean()
+    gps_rate -= gps_rate.mean()
+
+    # correlation[k] = sum(uwb_rate[n + k] * gps_rate[n]), zero-padded so it is not circular
+    count = len(uwb_rate)
+    size = 1 << int(2 * count - 1).bit_length()
+    correlation = np.fft.irfft(np.fft.rfft(uwb_rate, size) * np.conj(np.fft.rfft(gps_rate, size)), size)
+    max_lag = min(int(max_offset / grid_seconds), count - 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+    shifts = np.abs(lags)
+
+    # Energy of the overlapping parts: uwb_rate[k:] and gps_rate[:count - k] for k >= 0,
+    # uwb_rate[:count + k] and gps_rate[-k:] for k < 0
+    uwb_head = np.cumsum(uwb_rate**2)
+    uwb_tail = np.cumsum(uwb_rate[::-1]**2)[::-1]
+    gps_head = np.cumsum(gps_rate**2)
+    gps_tail = np.cumsum(gps_rate[::-1]**2)[::-1]
+    energy = np.where(lags >= 0, uwb_tail[shifts] * gps_head[count - 1 - shifts],
+                      uwb_head[count - 1 - shifts] * gps_tail[shifts])
+    if not (energy > 0).all():
+        raise ValueError("The range to the beacon does not change, its clock offset cannot be estimated.")
+    window = correlation[lags] / np.sqrt(energy)  # negative lags wrap to the end
+    peak = int(np.argmax(window))
+
+    shift = 0.0
+    if 0 < peak < len(window) - 1:
+        before, at, after = window[peak - 1:peak + 2]
+        curvature = before - 2 * at + after
+        if curvature < 0:
+            shift = 0.5 * (before - after) / curvature
+    # At a peak lag of k the UWB range k steps after a GPS distance matches it, so UWB is stamped k steps late
+    offset, spread = _refine_offset(-(lags[peak] + shift) * grid_seconds, uwb_times, uwb_distance,
+                                    gps_times, gps_distance, max_offset)
+    return {'offset': offset, 'correlation': float(window[peak]), 'residual_mad': spread}